@@ -0,0 +1,487 @@
+# Ticket to ride benchmarks
+
+# Time the ticket_to_ride functions on synthetic boards of increasing size.
+# Needs no fonts or display, results are saved as .json to compare runs:
+#
+#   python T2R_benchmark.py --sizes 50 500 5000 50000 --output before.json
+#   python T2R_benchmark.py --output after.json --compare before.json
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')   # no display needed
+
+import matplotlib.font_manager as fm
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+import ticket_to_ride as t2r
+from ticket_to_ride.T2R_create_board import EUROPE_TRACK_COLOURS
+
+SIZES = [50, 500, 5000, 50000]
+
+GRID_SPACING = 10   # map units between grid points of the synthetic boards
+
+LENGTH_SHARES = {1:11, 2:26, 3:25, 4:13, 5:3, 6:2}  # number of Singapore tracks of each length
+
+TRACKS_PER_PLACE = 79/45    # Singapore tracks per place
+
+DOUBLE_SHARE = 22/80    # share of Singapore tracks that are double routes
+
+N_TICKETS = 40  # place pairs used for tickets and route difficulty
+
+ALL_PAIRS_LIMIT = 5000  # largest board for functions using all pairs distances or k shortest paths
+
+GAME_SHARE = 0.9    # share of the Europe colour budget used by the game sized colouring boards
+
+# import statements timed in a new python process, importing everything is the
+# cost of the package before submodules were imported lazily
+IMPORTS = [('import ticket_to_ride', 'import ticket_to_ride'),
+           ('import get_t2r_europe_ticket_counts', 'from ticket_to_ride import get_t2r_europe_ticket_counts'),
+           ('import create_data_dictionary', 'from ticket_to_ride import create_data_dictionary'),
+           ('import show_board_colour', 'from ticket_to_ride import show_board_colour'),
+           ('import everything', 'from ticket_to_ride import *')]
+
+HEAVY_MODULES = ['numpy', 'scipy', 'pandas', 'networkx', 'matplotlib', 'matplotlib.pyplot']
+
+_IMPORT_TIMER = '''
+import sys, time, json
+start = time.perf_counter()
+%s
+wall_time = time.perf_counter() - start
+print(json.dumps({'wall_time':wall_time, 'modules':[name for name in %r if name in sys.modules]}))
+'''
+
+
+def synthetic_board(n_places, seed=None):
+    '''
+    Random board like the Singapore map: places scattered over a jittered
+    grid, tracks between grid neighbours and along one diagonal of each
+    grid square (so tracks hardly cross), thinned to Singapore's number of
+    tracks per place. A minimum spanning tree of the tracks is always kept
+    so every place can be reached. Track lengths follow the Singapore
+    length counts (further apart places get longer tracks) and a random
+    share of tracks are double routes.
+
+    Parameters
+    ----------
+    n_places : int, number of places on the board
+    seed : int, random seed
+
+    Returns
+    -------
+    locations : pandas dataframe with location coordinates (as the .csv file)
+    connections : pandas dataframe with place connections (as the .csv file)
+
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    side = int(np.ceil(np.sqrt(n_places)))
+    cell = np.arange(n_places)
+    gx, gy = cell % side, cell // side
+
+    coords = (np.column_stack([gx, gy]) + rng.uniform(0.15, 0.85, (n_places, 2)))*GRID_SPACING
+
+    # grid neighbours to the right and below, and one diagonal of each square
+    right = cell[(gx < side-1) & (cell+1 < n_places)]
+    down = cell[cell+side < n_places]
+    square = cell[(gx < side-1) & (cell+side+1 < n_places)]
+    flip = rng.random(len(square)) < 0.5
+
+    place_1 = np.concatenate([right, down, np.where(flip, square+1, square)])
+    place_2 = np.concatenate([right+1, down+side, np.where(flip, square+side, square+side+1)])
+
+    dist = np.hypot(*(coords[place_1] - coords[place_2]).T)
+
+    # Kruskal minimum spanning tree keeps the board connected
+    parent = list(range(n_places))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    tree = np.zeros(len(dist), dtype=bool)
+    for edge in np.argsort(dist, kind='stable').tolist():
+        root_1, root_2 = find(int(place_1[edge])), find(int(place_2[edge]))
+        if root_1 != root_2:
+            parent[root_1] = root_2
+            tree[edge] = True
+
+    n_extra = max(int(round(TRACKS_PER_PLACE*n_places)) - int(tree.sum()), 0)
+    extra_share = min(n_extra/max((~tree).sum(), 1), 1)
+    keep = tree | (rng.random(len(dist)) < extra_share)
+
+    place_1, place_2, dist = place_1[keep], place_2[keep], dist[keep]
+
+    # lengths by rank of the distance, in the Singapore proportions
+    shares = np.array(list(LENGTH_SHARES.values()), dtype=float)
+    bounds = np.cumsum(shares)/shares.sum()*len(dist)
+    length = np.empty(len(dist), dtype=int)
+    length[np.argsort(dist, kind='stable')] = np.array(list(LENGTH_SHARES))[
+        np.minimum(np.searchsorted(bounds, np.arange(len(dist)), side='right'), len(shares)-1)]
+
+    names = np.array(['place_%d' % i for i in range(n_places)], dtype=object)
+
+    locations = pd.DataFrame({'place':names, 'coord_x':coords[:, 0].round(2), 'coord_y':coords[:, 1].round(2)})
+
+    connections = pd.DataFrame({'place_1':names[place_1], 'place_2':names[place_2], 'length':length,
+                                'double_route':np.where(rng.random(len(length)) < DOUBLE_SHARE, 'Y', 'N')})
+
+    return locations, connections
+
+
+def _ticket_counts(data, counts):
+    '''
+    Ticket counts for the lengths the board has enough place pairs for
+    '''
+
+    return {length:n for length, n in counts.items() if length in data and len(data[length]) >= n}
+
+
+def _setup(n_places, seed):
+    '''
+    Board, graph and ticket inputs for the benchmarks (not timed), files
+    are saved in the working folder
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    locations, connections = synthetic_board(n_places, seed)
+
+    inputs = {'n_places':n_places, 'locations':locations, 'connections':connections,
+              'seed':seed, 'font':fm.FontProperties()}   # default matplotlib font, no font files needed
+
+    locations.to_csv('locations.csv', index=False)
+    connections.to_csv('connections.csv', index=False)
+
+    graph = t2r.build_graph(locations, connections)
+    inputs['graph'] = graph
+    inputs['double_routes'], inputs['double_len'] = t2r.get_double_routes(connections)
+    inputs['routes'], inputs['route_len'] = t2r.get_all_neighbours(graph)
+
+    # random colouring, the Europe colour budget of create_board_colouring only covers game sized boards
+    board = t2r.BoardData.from_routes(np.concatenate([np.asarray(inputs['routes'], dtype=object).reshape(-1, 2),
+                                                      np.asarray(inputs['double_routes'], dtype=object).reshape(-1, 2)]),
+                                      np.append(inputs['route_len'], inputs['double_len']), list(EUROPE_TRACK_COLOURS))
+    board.colour = rng.integers(0, len(board.colours), len(board))
+    board.tunnel = rng.random(len(board)) < 0.1
+    board.locomotive = rng.random(len(board)) < 0.05
+    inputs['board_data'] = board.to_frame()
+
+    # first tracks of the board that fit the Europe colour budget, for the colouring functions
+    budget = GAME_SHARE*sum(EUROPE_TRACK_COLOURS.values())
+    n_routes = np.searchsorted(np.cumsum(inputs['route_len'].ravel()), budget*(1 - DOUBLE_SHARE), side='right')
+    n_doubles = np.searchsorted(np.cumsum(inputs['double_len']), budget*DOUBLE_SHARE, side='right')
+    inputs['game_routes'], inputs['game_len'] = inputs['routes'][:n_routes], inputs['route_len'][:n_routes]
+    inputs['game_doubles'], inputs['game_double_len'] = inputs['double_routes'][:n_doubles], inputs['double_len'][:n_doubles]
+
+    # random ticket pairs, with their shortest path lengths as points
+    places = np.array(list(graph.nodes), dtype=object)
+    pairs = places[rng.choice(len(places), (N_TICKETS, 2), replace=len(places) < 2*N_TICKETS)]
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    inputs['tickets'] = pairs.tolist()
+    inputs['ticket_points'] = np.array([[nx.shortest_path_length(graph, place_1, place_2, weight='weight')*10]
+                                        for place_1, place_2 in inputs['tickets']]).round()
+
+    if n_places <= ALL_PAIRS_LIMIT:
+        inputs['route_index'] = t2r.route_difficulty_index(graph, inputs['tickets'])
+        inputs['data'], _ = t2r.create_data_dictionary(graph)
+        short_counts, long_counts = t2r.get_t2r_europe_ticket_counts()
+        inputs['short_counts'] = _ticket_counts(inputs['data'], short_counts)
+        inputs['long_counts'] = _ticket_counts(inputs['data'], long_counts)
+        inputs['decks'] = t2r.generate_decks(inputs['data'], [inputs['short_counts'], inputs['long_counts']],
+                                             seed=seed, fallback=3)
+
+    return inputs
+
+
+def _network_cache(inputs, warm):
+    '''
+    Cache lookup of the network, cold (empty cache) or warm
+    '''
+
+    cache = t2r.NetworkCache('cache_warm' if warm else tempfile.mkdtemp(dir='.'))
+
+    if warm:
+        cache.network(inputs['locations'], inputs['connections'])    # first lookup fills the cache
+
+    return lambda: cache.network(inputs['locations'], inputs['connections'])
+
+
+def _incremental_update(inputs):
+    '''
+    Change the length of one track of an incremental graph
+    '''
+
+    graph = t2r.IncrementalGraph(inputs['locations'], inputs['connections'])
+    place_1, place_2, length = inputs['connections'].iloc[0][['place_1', 'place_2', 'length']]
+
+    return lambda: graph.set_connection(place_1, place_2, length+2)
+
+
+# name, largest number of places, function of the inputs returning the call to time
+# (functions taking a setup argument prepare untimed state first)
+BENCHMARKS = [
+    ('build_graph', None, lambda b: lambda: t2r.build_graph(b['locations'], b['connections'])),
+    ('build_graph[array_graph]', None, lambda b: lambda: t2r.build_graph(b['locations'], b['connections'], array_graph=True)),
+    ('ArrayGraph.from_frames', None, lambda b: lambda: t2r.ArrayGraph.from_frames(b['locations'], b['connections'])),
+    ('get_double_routes', None, lambda b: lambda: t2r.get_double_routes(b['connections'])),
+    ('load_board', None, lambda b: lambda: t2r.load_board('locations.csv', 'connections.csv')),
+    ('load_board[array_graph]', None, lambda b: lambda: t2r.load_board('locations.csv', 'connections.csv', array_graph=True)),
+    ('get_all_neighbours', None, lambda b: lambda: t2r.get_all_neighbours(b['graph'])),
+    ('create_data_dictionary', ALL_PAIRS_LIMIT, lambda b: lambda: t2r.create_data_dictionary(b['graph'])),
+    ('route_difficulty_index', ALL_PAIRS_LIMIT, lambda b: lambda: t2r.route_difficulty_index(b['graph'], b['tickets'])),
+    ('create_board_colouring[game size]', None, lambda b: lambda: t2r.create_board_colouring(b['game_routes'], b['game_len'], b['game_doubles'],
+                                                                                             b['game_double_len'], b['seed'])),
+    ('optimise_board_colouring', None, lambda b: lambda: t2r.optimise_board_colouring(b['board_data'], 20000, seed=b['seed'])),
+    ('BoardData.from_frame', None, lambda b: lambda: t2r.BoardData.from_frame(b['board_data'])),
+    ('generate_board_colourings[game size]', None, lambda b: lambda: t2r.generate_board_colourings(b['game_routes'], b['game_len'], b['game_doubles'],
+                                                                                                   b['game_double_len'], 1000, seed=b['seed'])),
+    ('get_t2r_europe_ticket_counts', None, lambda b: t2r.get_t2r_europe_ticket_counts),
+    ('get_routes', ALL_PAIRS_LIMIT, lambda b: lambda: t2r.get_routes(b['data'], b['short_counts'], b['seed'])),
+    ('generate_decks', ALL_PAIRS_LIMIT, lambda b: lambda: t2r.generate_decks(b['data'], [b['short_counts'], b['long_counts']],
+                                                                             seed=b['seed'], max_per_city=4, fallback=3)),
+    ('get_start_end_destination', None, lambda b: lambda: t2r.get_start_end_destination(b['tickets'])),
+    ('score_tickets', ALL_PAIRS_LIMIT, lambda b: lambda: t2r.score_tickets(b['tickets'], b['ticket_points'], b['route_index'])),
+    ('simulate_games', ALL_PAIRS_LIMIT, lambda b: lambda: t2r.simulate_games(b['board_data'], b['decks'], 20, seed=b['seed'])),
+    ('draw_graph', ALL_PAIRS_LIMIT, lambda b: lambda: t2r.draw_graph(b['graph'], 'graph.png', headless=True)),
+    ('show_board_colour', None, lambda b: lambda: t2r.show_board_colour(b['board_data'], b['graph'], 'board.png', headless=True)),
+    ('export_board_tiles', None, lambda b: lambda: t2r.export_board_tiles(b['board_data'], b['graph'], 'tiles', levels=3)),
+    ('create_tickets', ALL_PAIRS_LIMIT, lambda b: lambda: t2r.create_tickets(b['tickets'][:10], b['graph'], b['ticket_points'][:10],
+                                                                             b['font'], 'tickets', headless=True)),
+    ('create_ticket_sheets', ALL_PAIRS_LIMIT, lambda b: lambda: t2r.create_ticket_sheets(b['tickets'][:10], b['graph'], b['ticket_points'][:10],
+                                                                                         b['font'], 'sheets', dpi=100)),
+    ('IncrementalGraph', 2000, lambda b: lambda: t2r.IncrementalGraph(b['locations'], b['connections'])),
+    ('IncrementalGraph.set_connection', 2000, _incremental_update),
+    ('NetworkCache.network[cold]', ALL_PAIRS_LIMIT, lambda b: _network_cache(b, warm=False)),
+    ('NetworkCache.network[warm]', ALL_PAIRS_LIMIT, lambda b: _network_cache(b, warm=True)),
+]
+
+
+def import_times(repeat=5, only=None, verbose=True):
+    '''
+    Time importing parts of the package, each in a new python process
+    (best of repeat), with the heavy libraries each import loads
+
+    Returns
+    -------
+    results : list of dicts of import results (n_places is 0)
+
+    '''
+
+    env = dict(os.environ)  # find this ticket_to_ride package in the new processes
+    package_folder = os.path.dirname(os.path.dirname(os.path.abspath(t2r.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_folder, env.get('PYTHONPATH')]))
+
+    results = []
+
+    for name, statement in IMPORTS:
+        if only and not any(part in name for part in only):
+            continue
+
+        runs = [json.loads(subprocess.run([sys.executable, '-c', _IMPORT_TIMER % (statement, HEAVY_MODULES)],
+                                          env=env, check=True, capture_output=True, text=True).stdout)
+                for _ in range(repeat)]
+
+        times = [run['wall_time'] for run in runs]
+
+        results.append({'function':name, 'n_places':0, 'n_connections':0, 'wall_time':min(times), 'times':times,
+                        'modules':runs[0]['modules']})
+
+        if verbose:
+            print('  %-38s %10.4fs   %s' % (name, min(times), ', '.join(runs[0]['modules'])))
+
+    return results
+
+
+def run_benchmark(name, prepare, inputs, repeat=3, memory=True):
+    '''
+    Time a benchmark (best of repeat calls, each after a fresh untimed
+    prepare), then run it once more under t2r.profile for its peak memory,
+    counters and the times of the stages it calls
+
+    Returns
+    -------
+    result : dict of the benchmark results
+
+    '''
+
+    times = []
+    for _ in range(repeat):
+        call = prepare(inputs)
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+
+    result = {'function':name, 'n_places':inputs['n_places'], 'n_connections':len(inputs['connections']),
+              'wall_time':min(times), 'times':times}
+
+    if memory:
+        call = prepare(inputs)
+        with t2r.profile(memory=True) as profiler:
+            with profiler.stage(name):
+                call()
+
+        result['peak_memory'] = profiler.stages[name]['peak_memory']
+        result['counters'] = profiler.counters
+        result['stages'] = {stage:values['wall_time'] for stage, values in profiler.stages.items() if stage != name}
+
+    return result
+
+
+def run_suite(sizes=SIZES, repeat=3, memory=True, only=None, seed=1, verbose=True):
+    '''
+    Run the benchmarks on a synthetic board of each size
+
+    Parameters
+    ----------
+    sizes : list of int, numbers of places on the boards
+    repeat : int, number of timed calls of each benchmark
+    memory : bool, also measure peak memory (one extra call)
+    only : list of strings, only run benchmarks with one of these in their name
+    seed : int, random seed of the boards
+
+    Returns
+    -------
+    results : list of dicts of benchmark results, boards too large for
+              a benchmark are recorded as skipped and failed calls with
+              their error
+
+    '''
+
+    results = []
+
+    working_folder = os.getcwd()
+
+    for n_places in sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            os.chdir(folder)    # all output files go in the temporary folder
+            try:
+                results += _run_size(n_places, repeat, memory, only, seed, verbose)
+            finally:
+                os.chdir(working_folder)
+
+    return results
+
+
+def _run_size(n_places, repeat, memory, only, seed, verbose):
+    '''
+    Run the benchmarks on one synthetic board (see run_suite)
+    '''
+
+    results = []
+
+    start = time.perf_counter()
+    inputs = _setup(n_places, seed)
+    if verbose:
+        print('%d places, %d connections (setup %.1fs)' % (n_places, len(inputs['connections']),
+                                                            time.perf_counter() - start))
+
+    for name, limit, prepare in BENCHMARKS:
+        if only and not any(part in name for part in only):
+            continue
+
+        if limit is not None and n_places > limit:
+            results.append({'function':name, 'n_places':n_places, 'n_connections':len(inputs['connections']),
+                            'skipped':'more than %d places' % limit})
+            if verbose:
+                print('  %-38s skipped' % name)
+            continue
+
+        try:
+            result = run_benchmark(name, prepare, inputs, repeat, memory)
+        except Exception as error:     # e.g. a board too large for the Europe colour budget
+            result = {'function':name, 'n_places':n_places, 'n_connections':len(inputs['connections']),
+                      'error':'%s: %s' % (type(error).__name__, error)}
+
+        results.append(result)
+
+        if verbose and 'error' in result:
+            print('  %-38s %s' % (name, result['error']))
+        elif verbose:
+            print('  %-38s %10.4fs %12s' % (name, result['wall_time'],
+                  '%.1f MB' % (result['peak_memory']/1024**2) if memory else ''))
+
+    return results
+
+
+def _metadata(args):
+    '''
+    Machine and library versions of a run
+    '''
+
+    return {'date':datetime.datetime.now().isoformat(timespec='seconds'), 'python':platform.python_version(),
+            'platform':platform.platform(), 'processor':platform.processor(), 'cpu_count':os.cpu_count(),
+            'numpy':np.__version__, 'pandas':pd.__version__, 'networkx':nx.__version__,
+            'matplotlib':matplotlib.__version__, 'sizes':args.sizes, 'repeat':args.repeat, 'seed':args.seed}
+
+
+def compare(results, previous):
+    '''
+    Table of the wall times of two runs, ratio > 1 is slower than before
+
+    Parameters
+    ----------
+    results, previous : lists of benchmark results (as run_suite)
+
+    Returns
+    -------
+    table : pandas dataframe of function, n_places, before, after and ratio
+
+    '''
+
+    def times(rows):
+        return pd.DataFrame([row for row in rows if 'wall_time' in row],
+                            columns=['function', 'n_places', 'wall_time']).set_index(['function', 'n_places']).wall_time
+
+    table = pd.concat([times(previous).rename('before'), times(results).rename('after')], axis=1, join='inner')
+    table['ratio'] = table.after/table.before
+
+    return table.sort_values('ratio', ascending=False)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmark ticket_to_ride on synthetic boards')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of places on the boards')
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls of each benchmark (best is kept)')
+    parser.add_argument('--only', nargs='+', help='only run benchmarks with one of these in their name')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory runs')
+    parser.add_argument('--no-imports', action='store_true', help='skip the import time runs')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the boards')
+    parser.add_argument('--output', default='t2r_benchmark.json', help='.json file for the results')
+    parser.add_argument('--compare', help='.json results of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    results = []
+
+    if not args.no_imports:
+        print('import times')
+        results += import_times(max(args.repeat, 5), args.only)
+
+    results += run_suite(args.sizes, args.repeat, not args.no_memory, args.only, args.seed)
+
+    with open(args.output, 'w') as file:
+        json.dump({'metadata':_metadata(args), 'results':results}, file, indent=2, default=float)
+    print('results saved to %s' % args.output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)['results']
+        with pd.option_context('display.max_rows', None, 'display.width', 120):
+            print(compare(results, previous))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
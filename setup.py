@@ -3,16 +3,29 @@ from setuptools import setup
 setup(name='ticket2ride',
       version='0.1',
       description='ticket2ride: generate fan ticket2ride map',
-      url='https://github.com/lauraredmondson/ticket2ride
+      url='https://github.com/lauraredmondson/ticket2ride',
       author='Laura Edmondson',
       author_email='lredmondsonl@sheffield.ac.uk',
       classifiers=[
         'Development Status :: 3 - Alpha',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
       ],
-      packages=['ticket2ride'],
+      python_requires='>=3.9',
+      packages=['ticket_to_ride'],
       install_requires=[
           'numpy','pandas','matplotlib','networkx'
       ],
+      extras_require={
+          'scipy':['scipy'],   # sparse Dijkstra for the all pairs distances
+          'test':['pytest'],
+      },
+      entry_points={
+          'console_scripts': ['ticket2ride=ticket_to_ride.T2R_pipeline:main',
+                              'ticket2ride-serve=ticket_to_ride.T2R_server:main'],
+      },
       zip_safe=False,
       )
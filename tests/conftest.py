@@ -0,0 +1,26 @@
+# Ticket to ride test fixtures
+
+# Connections
+import os
+
+import pandas as pd
+import pytest
+
+import ticket_to_ride as t2r
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))   # Singapore example csv files
+
+
+@pytest.fixture(scope='session')
+def locations():
+    return pd.read_csv(os.path.join(ROOT, 'ticket2ride_singapore_locations.csv'))
+
+
+@pytest.fixture(scope='session')
+def connections():
+    return pd.read_csv(os.path.join(ROOT, 'ticket2ride_singapore_connections.csv'))
+
+
+@pytest.fixture(scope='session')
+def graph(locations, connections):
+    return t2r.build_graph(locations, connections)
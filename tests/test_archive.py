@@ -0,0 +1,89 @@
+# Ticket to ride board archive tests
+
+# Connections
+import numpy as np
+import pandas as pd
+import pytest
+
+import ticket_to_ride as t2r
+
+
+@pytest.fixture(scope='module')
+def boards(graph, connections):
+
+    routes, lengths = t2r.get_all_neighbours(graph)
+    double_routes, double_lengths = t2r.get_double_routes(connections)
+
+    return [t2r.create_board_colouring(routes, lengths, double_routes, double_lengths, seed)[0] for seed in range(5)]
+
+
+@pytest.fixture(scope='module')
+def decks(graph):
+
+    data, _ = t2r.create_data_dictionary(graph)
+    short_counts, long_counts = t2r.get_t2r_europe_ticket_counts()
+
+    return [t2r.get_routes(data, short_counts, 30), t2r.get_routes(data, long_counts, 30)]
+
+
+def test_round_trip(tmp_path, graph, boards, decks):
+
+    path = str(tmp_path / 'boards.t2r')
+
+    assert t2r.write_boards(path, graph, boards, decks) == len(boards)
+
+    for index in (0, 3, -1):
+        pd.testing.assert_frame_equal(t2r.read_board(path, index), boards[index])
+
+    with t2r.BoardArchive(path) as archive:
+        assert len(archive) == len(boards)
+        assert archive.n_decks == len(decks)
+
+        board = archive.board(2)
+        assert isinstance(board, t2r.BoardData)
+        pd.testing.assert_frame_equal(board.to_frame(), boards[2])
+
+        for index, (routes, points) in enumerate(decks):
+            archive_routes, archive_points = archive.deck(index)
+            assert archive_routes == [list(route) for route in routes]
+            np.testing.assert_array_equal(archive_points, points)
+
+        stored = archive.graph()
+        assert {frozenset(edge) for edge in stored.edges} == {frozenset(edge) for edge in graph.edges}
+        for place_1, place_2 in graph.edges:
+            assert stored.edges[place_1, place_2]['weight'] == pytest.approx(graph.edges[place_1, place_2]['weight'])
+        for place in graph.nodes:
+            np.testing.assert_allclose(stored.nodes[place]['pos'], graph.nodes[place]['pos'])
+
+
+def test_decks_only(tmp_path, graph, decks):
+
+    path = str(tmp_path / 'decks.t2r')
+
+    t2r.write_decks(path, graph, decks)
+
+    routes, points = t2r.read_deck(path, 1)
+    assert routes == [list(route) for route in decks[1][0]]
+    np.testing.assert_array_equal(points, decks[1][1])
+
+    assert len(t2r.BoardArchive(path)) == 0
+
+
+def test_bad_files(tmp_path, graph, boards):
+
+    path = tmp_path / 'boards.t2r'
+    t2r.write_boards(str(path), graph, boards)
+    raw = bytearray(path.read_bytes())
+
+    not_archive = tmp_path / 'not_archive.t2r'
+    not_archive.write_bytes(b'hello')
+
+    newer = tmp_path / 'newer.t2r'
+    newer.write_bytes(bytes(raw[:8]) + bytes([9]) + bytes(raw[9:]))   # unknown version
+
+    truncated = tmp_path / 'truncated.t2r'
+    truncated.write_bytes(bytes(raw[:-10]))
+
+    for bad in (not_archive, newer, truncated):
+        with pytest.raises(ValueError):
+            t2r.BoardArchive(str(bad))
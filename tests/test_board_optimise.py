@@ -0,0 +1,102 @@
+# Ticket to ride board optimisation tests
+
+# Connections
+import numpy as np
+import pytest
+
+import ticket_to_ride as t2r
+from ticket_to_ride.T2R_board_optimise import _AnnealingState, _propose, _undo, board_scores, MOVES
+
+
+@pytest.fixture
+def board(graph, connections):
+    '''
+    Coloured Singapore board with random tunnels and locomotives (some
+    tracks have both)
+    '''
+
+    routes, lengths = t2r.get_all_neighbours(graph)
+    double_routes, double_lengths = t2r.get_double_routes(connections)
+
+    board = t2r.BoardData.from_frame(t2r.create_board_colouring(routes, lengths, double_routes, double_lengths, 3)[0])
+
+    rng = np.random.default_rng(0)
+    board.tunnel = (rng.random(len(board)) < 0.2) & (board.track_length >= 2) & (board.track_length <= 3)
+    board.locomotive = rng.random(len(board)) < 0.2
+
+    return board
+
+
+def _state_board(board, state):
+    '''
+    BoardData of the current annealing state
+    '''
+
+    return t2r.BoardData(board.places, board.place_1, board.place_2, board.track_length, board.colours,
+                         np.array(state.colour, dtype=np.int8), np.array(state.tunnel), np.array(state.locomotive))
+
+
+def _feature_counts(board):
+    '''
+    Number of tunnels and locomotives of each colour
+    '''
+
+    n_colours = len(board.colours)
+
+    return (np.bincount(board.colour[board.tunnel], minlength=n_colours).tolist(),
+            np.bincount(board.colour[board.locomotive], minlength=n_colours).tolist())
+
+
+def test_move_deltas_match_rescore(board):
+
+    state = _AnnealingState(board, {})
+    score = board_scores(board)['score']
+
+    rng = np.random.default_rng(1)
+    moves = list(MOVES)
+
+    for step in range(3000):
+        proposal = _propose(state, moves[rng.integers(len(moves))], rng.random(2).tolist(), len(board.colours))
+        if proposal is None:
+            continue
+
+        delta, changes = proposal
+
+        if rng.random() < 0.5:
+            score += delta
+        else:
+            _undo(state, changes)
+
+        if step % 100 == 0:
+            assert score == pytest.approx(board_scores(_state_board(board, state))['score'], abs=1e-9)
+
+    assert score == pytest.approx(board_scores(_state_board(board, state))['score'], abs=1e-9)
+    assert _feature_counts(_state_board(board, state)) == _feature_counts(board)
+
+
+def test_feature_lists_follow_moves(board):
+
+    state = _AnnealingState(board, {})
+
+    rng = np.random.default_rng(2)
+    moves = list(MOVES)
+
+    for _ in range(2000):
+        proposal = _propose(state, moves[rng.integers(len(moves))], rng.random(2).tolist(), len(board.colours))
+        if proposal is not None and rng.random() < 0.5:
+            _undo(state, proposal[1])
+
+    for kind, flags in enumerate((state.tunnel, state.locomotive)):
+        for colour, tracks in enumerate(state.feature_tracks[kind]):
+            assert sorted(tracks) == [track for track, flag in enumerate(flags) if flag and state.colour[track] == colour]
+
+        for track, slot in state.feature_slots[kind].items():
+            assert state.feature_tracks[kind][state.colour[track]][slot] == track
+
+
+def test_optimise_keeps_features_and_improves(board):
+
+    optimised = t2r.optimise_board_colouring(board, 3000, seed=1)[0]
+
+    assert _feature_counts(optimised) == _feature_counts(board)
+    assert board_scores(optimised)['score'] <= board_scores(board)['score']
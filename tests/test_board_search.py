@@ -0,0 +1,49 @@
+# Ticket to ride board search tests
+
+# Connections
+import numpy as np
+import pandas as pd
+import pytest
+
+import ticket_to_ride as t2r
+from ticket_to_ride.T2R_board_search import BOARD_METRICS
+
+
+@pytest.fixture(scope='module')
+def tracks(graph, connections):
+
+    routes, lengths = t2r.get_all_neighbours(graph)
+    double_routes, double_lengths = t2r.get_double_routes(connections)
+
+    return routes, lengths, double_routes, double_lengths
+
+
+def test_top_boards_match_recreated(tracks):
+
+    boards, scores = t2r.generate_board_colourings(*tracks, 200, seed=4, top_n=5, batch_size=64)
+
+    assert len(boards) == len(scores) == 5
+    assert np.all(np.diff(scores.score) >= 0)
+    assert np.all(np.isfinite(scores.score))
+
+    single = t2r.generate_board_colourings(*tracks, 200, seed=4, top_n=5, batch_size=200)[1]
+    pd.testing.assert_frame_equal(scores, single)    # same boards whatever the batches
+
+
+def test_unplayable_boards_dropped(tracks):
+
+    def every_other(colour_idx, layout):    # boards 1, 3, 5... unplayable
+        return np.where(np.arange(len(colour_idx)) % 2, np.inf, 1.0)
+
+    metrics = dict(BOARD_METRICS, every_other=every_other)
+
+    boards, scores = t2r.generate_board_colourings(*tracks, 6, seed=1, top_n=10, metrics=metrics, batch_size=6)
+
+    assert len(boards) == len(scores) == 3
+    assert sorted(scores.board) == [0, 2, 4]
+
+    def never(colour_idx, layout):
+        return np.full(len(colour_idx), np.inf)
+
+    with pytest.raises(ValueError):
+        t2r.generate_board_colourings(*tracks, 6, seed=1, metrics={'never':never})
@@ -0,0 +1,74 @@
+# Ticket to ride network cache tests
+
+# Connections
+import os
+
+import numpy as np
+import pytest
+
+import ticket_to_ride as t2r
+from ticket_to_ride.T2R_build_network import shortest_path_route
+
+
+def test_cold_and_warm_network_match(tmp_path, locations, connections, graph):
+
+    cache = t2r.NetworkCache(str(tmp_path))
+
+    cold = cache.network(locations, connections)
+    assert len(cache.keys()) == 1
+
+    warm = cache.network(locations, connections)
+    assert isinstance(warm[2], np.memmap)    # loaded from disk, memory mapped
+
+    data, dist = t2r.create_data_dictionary(graph)
+
+    for built_graph, data_dict, condensed, location_keys in (cold, warm):
+        assert sorted(built_graph.edges(data='weight')) == sorted(graph.edges(data='weight'))
+        assert built_graph.nodes(data='pos') == graph.nodes(data='pos')
+        np.testing.assert_array_equal(condensed, dist[np.triu_indices(len(location_keys), k=1)])
+        assert {length:list(pairs) for length, pairs in data_dict.items()} == {length:list(pairs) for length, pairs
+                                                                                  in data.items()}
+
+    np.testing.assert_array_equal(cache.network(locations, connections, condensed=False)[2],
+                                  shortest_path_route(graph)[0])
+
+
+def test_eviction_keeps_newest(tmp_path, locations, connections):
+
+    cache = t2r.NetworkCache(str(tmp_path))
+    cache.network(locations, connections)
+    entry_size = cache.size()
+
+    shorter = connections.assign(length=connections.length + 1)     # a different board
+    longer = connections.assign(length=connections.length + 2)
+
+    cache.max_size = 2*entry_size
+    first = cache.keys()[0]
+    os.utime(os.path.join(str(tmp_path), first), (1, 1))    # least recently used
+
+    cache.network(locations, shorter)
+    cache.network(locations, longer)
+
+    assert len(cache.keys()) == 2
+    assert first not in cache.keys()
+    assert cache.size() <= cache.max_size
+
+
+def test_invalidate(tmp_path, locations, connections):
+
+    cache = t2r.NetworkCache(str(tmp_path))
+    other = connections.assign(length=connections.length + 1)
+
+    cache.network(locations, connections)
+    cache.network(locations, other)
+
+    cache.invalidate(locations, other)
+    assert cache.keys() == [t2r.T2R_cache.frame_hash(locations, connections)]
+
+    for frames in ((locations,), (None, connections)):
+        with pytest.raises(ValueError):
+            cache.invalidate(*frames)
+    assert len(cache.keys()) == 1
+
+    cache.invalidate()
+    assert cache.keys() == []
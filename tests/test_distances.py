@@ -0,0 +1,139 @@
+# Ticket to ride distance engine tests
+
+# Connections
+import networkx as nx
+import numpy as np
+import pytest
+
+import ticket_to_ride as t2r
+from ticket_to_ride.T2R_build_network import shortest_path_route
+from ticket_to_ride import T2R_distances
+from ticket_to_ride.T2R_distances import (condensed_index, condensed_pairs, condensed_pair, condensed_size,
+                                          distance_matrix, graph_edge_arrays, LengthBuckets)
+
+
+def _random_edges(n_places, n_edges, seed):
+    '''
+    Random connections (with repeats and unconnected places) and lengths
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    place_1 = rng.integers(0, n_places, n_edges)
+    place_2 = (place_1 + rng.integers(1, n_places, n_edges)) % n_places     # no loops
+
+    return place_1, place_2, rng.integers(1, 7, n_edges)
+
+
+@pytest.mark.parametrize('n_places', [2, 3, 10, 45, 201])
+def test_condensed_round_trip(n_places):
+
+    row, col = np.triu_indices(n_places, k=1)
+    index = condensed_index(row, col, n_places)
+
+    np.testing.assert_array_equal(index, np.arange(condensed_size(n_places)))   # row order, no gaps
+
+    found_row, found_col = condensed_pairs(index, n_places)
+    np.testing.assert_array_equal(found_row, row)
+    np.testing.assert_array_equal(found_col, col)
+
+    assert [condensed_pair(i, n_places) for i in index.tolist()] == list(zip(row.tolist(), col.tolist()))
+
+
+@pytest.mark.parametrize('n_places', [50000, 3000000])
+def test_condensed_round_trip_large(n_places):
+
+    size = condensed_size(n_places)
+
+    rng = np.random.default_rng(n_places)
+    index = np.concatenate([[0, 1, size-2, size-1], rng.integers(0, size, 10000)])   # both ends of the vector
+    for row in (1, n_places//2, n_places-3, n_places-2):    # around row starts, where rounding goes wrong
+        start = int(condensed_index(row, row+1, n_places))
+        index = np.append(index, [start-1, start, start+1])
+    index = index[index < size]
+
+    row, col = condensed_pairs(index, n_places)
+
+    assert np.all((0 <= row) & (row < col) & (col < n_places))
+    np.testing.assert_array_equal(condensed_index(row, col, n_places), index)
+
+    assert [condensed_pair(i, n_places) for i in index.tolist()] == list(zip(row.tolist(), col.tolist()))
+
+
+def test_floyd_warshall_matches_dijkstra(monkeypatch):
+
+    pytest.importorskip('scipy')
+
+    n_places = 60
+    place_1, place_2, length = _random_edges(n_places, 90, seed=3)
+
+    dijkstra = distance_matrix(place_1, place_2, length, n_places, block_size=7)
+    dijkstra_condensed = distance_matrix(place_1, place_2, length, n_places, condensed=True)
+
+    monkeypatch.setattr(T2R_distances, '_sparse_dijkstra', lambda: (None, None))   # as without scipy
+
+    np.testing.assert_array_equal(distance_matrix(place_1, place_2, length, n_places), dijkstra)
+    np.testing.assert_array_equal(distance_matrix(place_1, place_2, length, n_places, condensed=True),
+                                  dijkstra_condensed)
+
+    sources = np.array([0, 5, 59])
+    np.testing.assert_array_equal(T2R_distances.source_distances(place_1, place_2, length, n_places, sources)[:, :10],
+                                  T2R_distances._dense_distances(place_1, place_2, length, n_places)[sources, :10])
+
+
+def test_shortest_path_route_matches_networkx(graph):
+
+    dist, location_keys = shortest_path_route(graph)
+
+    lengths = dict(nx.all_pairs_dijkstra_path_length(graph))   # network x version it replaced
+
+    assert location_keys.tolist() == sorted(graph.nodes)
+
+    expected = np.array([[round(lengths[a][b]*10) for b in location_keys] for a in location_keys])
+    np.testing.assert_array_equal(dist, np.triu(expected))
+
+    condensed, _ = shortest_path_route(graph, condensed=True)
+    np.testing.assert_array_equal(condensed, dist[np.triu_indices(len(location_keys), k=1)])
+
+
+def test_graph_edge_arrays_match_array_graph(locations, connections, graph):
+
+    array_graph = t2r.build_graph(locations, connections, array_graph=True)
+
+    def named_edges(graph):
+        location_keys, place_1, place_2, length = graph_edge_arrays(graph)
+        return location_keys.tolist(), sorted((*sorted(pair), w) for pair, w in
+                                              zip(zip(location_keys[place_1], location_keys[place_2]), length.tolist()))
+
+    assert named_edges(graph) == named_edges(array_graph)
+
+    dist, _ = shortest_path_route(array_graph)
+    np.testing.assert_array_equal(dist, shortest_path_route(graph)[0])
+
+
+def test_length_buckets_match_where_scan(graph):
+
+    data, dist = t2r.create_data_dictionary(graph)
+    _, location_keys = shortest_path_route(graph)
+
+    # one np.where scan of the full array per length, as create_data_dictionary used to
+    expected = {str(length): [[str(location_keys[i]), str(location_keys[j])] for i, j in zip(*np.where(dist == length))]
+                for length in np.unique(dist) if length > 0}
+
+    assert isinstance(data, LengthBuckets)
+    assert list(data) == list(expected)
+    for length, pairs in expected.items():
+        assert len(data[length]) == len(pairs)
+        assert list(data[length]) == pairs
+        assert list(data[length][3:7:2]) == pairs[3:7:2]     # slices are buckets too
+
+
+def test_length_buckets_arrays_round_trip(graph):
+
+    data, _ = t2r.create_data_dictionary(graph)
+
+    rebuilt = LengthBuckets.from_arrays(*data.to_arrays(), data.location_keys)
+
+    assert list(rebuilt) == list(data)
+    for length in data:
+        np.testing.assert_array_equal(rebuilt[length].positions, data[length].positions)
@@ -0,0 +1,35 @@
+# Ticket to ride import tests
+
+# Connections
+import subprocess
+import sys
+
+from .conftest import ROOT
+
+
+def _loaded(code):
+    '''
+    Top level packages imported by running code in a new python process
+    '''
+
+    script = code + "\nimport sys\nprint(' '.join(sorted({name.split('.')[0] for name in sys.modules})))"
+
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    return set(result.stdout.split())
+
+
+def test_ticket_functions_only_load_numpy():
+
+    loaded = _loaded("from ticket_to_ride import get_t2r_europe_ticket_counts, get_routes, generate_decks")
+
+    assert 'numpy' in loaded
+    assert not loaded & {'scipy', 'pandas', 'networkx', 'matplotlib'}
+
+
+def test_board_and_distance_functions_skip_scipy():
+
+    loaded = _loaded("from ticket_to_ride import create_board_colouring, optimise_board_colouring, BoardData\n"
+                     "from ticket_to_ride.T2R_distances import condensed_index, condensed_pairs, LengthBuckets")
+
+    assert 'scipy' not in loaded
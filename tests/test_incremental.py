@@ -0,0 +1,68 @@
+# Ticket to ride incremental graph tests
+
+# Connections
+import numpy as np
+import pytest
+
+import ticket_to_ride as t2r
+
+
+def _assert_matches_rebuild(incremental):
+    '''
+    Distances and length buckets equal a full recompute of the edited graph
+    '''
+
+    data, dist = t2r.create_data_dictionary(incremental.graph)
+
+    np.testing.assert_array_equal(incremental.shortest_path_route()[0], dist)
+
+    assert list(incremental.data_dict) == list(data)
+    for length in data:
+        assert list(incremental.data_dict[length]) == list(data[length]), length
+
+
+def test_new_graph_matches_rebuild(locations, connections):
+
+    _assert_matches_rebuild(t2r.IncrementalGraph(locations, connections))
+
+
+def test_random_edits_match_rebuild(locations, connections):
+
+    incremental = t2r.IncrementalGraph(locations, connections)
+    places = incremental.location_keys.tolist()
+
+    rng = np.random.default_rng(1)
+
+    for _ in range(150):
+        place_1, place_2 = rng.choice(places, 2, replace=False)
+
+        if rng.random() < 0.3 and incremental.graph.has_edge(place_1, place_2):
+            incremental.remove_connection(place_1, place_2)
+        else:   # new connection, or a shorter or longer track
+            incremental.set_connection(place_1, place_2, int(rng.integers(1, 7)))
+
+        _assert_matches_rebuild(incremental)
+
+
+def test_existing_tracks_longer_and_removed(locations, connections):
+
+    incremental = t2r.IncrementalGraph(locations, connections)
+
+    edges = list(incremental.graph.edges)[:10]
+
+    for place_1, place_2 in edges[:5]:
+        incremental.set_connection(place_1, place_2, 8)
+    for place_1, place_2 in edges[5:]:
+        incremental.remove_connection(place_1, place_2)
+
+    _assert_matches_rebuild(incremental)
+
+
+def test_remove_missing_connection(locations, connections):
+
+    incremental = t2r.IncrementalGraph(locations, connections)
+    place_1, place_2 = next((a, b) for a in incremental.location_keys for b in incremental.location_keys
+                            if a != b and not incremental.graph.has_edge(a, b))
+
+    with pytest.raises(KeyError):
+        incremental.remove_connection(place_1, place_2)
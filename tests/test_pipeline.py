@@ -0,0 +1,43 @@
+# Ticket to ride pipeline tests
+
+# Connections
+import os
+
+import pandas as pd
+
+import ticket_to_ride as t2r
+from ticket_to_ride.T2R_pipeline import STAGES
+
+
+def test_rerun_uses_caches(tmp_path, locations, connections):
+
+    locations_path, connections_path = str(tmp_path / 'locations.csv'), str(tmp_path / 'connections.csv')
+    locations.to_csv(locations_path, index=False)
+    connections.to_csv(connections_path, index=False)
+
+    output = str(tmp_path / 'output')
+
+    outputs, ran = t2r.run_pipeline(locations_path, connections_path, output, processes=1, verbose=False)
+    assert sorted(ran) == sorted(STAGES)
+
+    network_cache = t2r.NetworkCache(os.path.join(output, '.t2r_cache', 'network'))
+    assert len(network_cache.keys()) == 1
+
+    board = pd.read_csv(os.path.join(output, 'board.csv'))
+
+    cached, ran = t2r.run_pipeline(locations_path, connections_path, output, processes=1, verbose=False)
+    assert ran == []
+    assert cached['short_tickets']['routes'] == outputs['short_tickets']['routes']
+
+    network_cache.invalidate()     # graph and distances loaded again, the rest still cached
+    _, ran = t2r.run_pipeline(locations_path, connections_path, output, processes=1, verbose=False)
+    assert ran == ['network']
+    pd.testing.assert_frame_equal(pd.read_csv(os.path.join(output, 'board.csv')), board)
+
+    edited = connections.copy()
+    edited.loc[0, 'length'] += 1    # one track longer
+    edited.to_csv(connections_path, index=False)
+    _, ran = t2r.run_pipeline(locations_path, connections_path, output, processes=1, verbose=False,
+                              image_format='png')
+    assert sorted(ran) == sorted(STAGES)
+    assert len(network_cache.keys()) == 2
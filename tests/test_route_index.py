@@ -0,0 +1,84 @@
+# Ticket to ride route index tests
+
+# Connections
+import itertools
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import ticket_to_ride as t2r
+
+
+def _networkx_lengths(graph, place_1, place_2, k):
+    '''
+    Lengths of the k shortest simple paths found by network x
+    '''
+
+    paths = itertools.islice(nx.shortest_simple_paths(graph, place_1, place_2, weight='weight'), k)
+
+    return [int(round(10*nx.path_weight(graph, path, 'weight'))) for path in paths]
+
+
+@pytest.fixture(scope='module')
+def pairs(graph):
+
+    places = sorted(graph.nodes)
+    rng = np.random.default_rng(1)
+
+    return [tuple(places[i] for i in rng.choice(len(places), 2, replace=False)) for _ in range(30)]
+
+
+def test_k_shortest_lengths_match_networkx(graph, pairs):
+
+    index = t2r.route_difficulty_index(graph, pairs, k=4)
+
+    for place_1, place_2 in pairs:
+        paths = index.paths(place_1, place_2)
+
+        assert [length for length, _ in paths] == _networkx_lengths(graph, place_1, place_2, 4)
+
+        for length, tracks in paths:     # each path is a simple path of that length
+            assert sum(round(10*graph.edges[track]['weight']) for track in tracks) == length
+
+            path = nx.Graph(list(map(tuple, tracks)))
+            assert all(degree <= 2 for _, degree in path.degree)
+            assert nx.has_path(path, place_1, place_2)
+
+
+def test_subset_index_lookups(graph, pairs):
+
+    index = t2r.route_difficulty_index(graph, pairs)
+    full = t2r.route_difficulty_index(graph)
+
+    wanted = {frozenset(pair) for pair in pairs}
+
+    for place_1, place_2 in itertools.combinations(sorted(graph.nodes), 2):
+        assert ((place_1, place_2) in index) == (frozenset((place_1, place_2)) in wanted)
+
+    for place_1, place_2 in pairs:
+        assert index.paths(place_1, place_2) == index.paths(place_2, place_1) == full.paths(place_1, place_2)
+
+    np.testing.assert_array_equal(index.difficulty(pairs), full.difficulty(pairs))
+
+
+def test_unindexed_pair(graph, pairs):
+
+    index = t2r.route_difficulty_index(graph, pairs[:1])
+    place_1, place_2 = next(pair for pair in itertools.combinations(sorted(graph.nodes), 2)
+                            if pair not in index)
+
+    with pytest.raises(KeyError):
+        index.paths(place_1, place_2)
+
+
+def test_row_lookups(graph, pairs):
+
+    index = t2r.route_difficulty_index(graph, pairs)
+
+    assert sorted(index.row(*pair) for pair in pairs) == sorted(set(index.row(*pair) for pair in pairs))
+    assert [index.row(*pair) for pair in index.pairs()] == list(range(len(index)))
+    assert index.row(pairs[0][0], pairs[0][0]) == -1
+
+    with pytest.raises(ValueError):
+        index.row(pairs[0][0], 'not_a_place')
@@ -0,0 +1,108 @@
+# Ticket to ride ticket deck tests
+
+# Connections
+from collections import Counter
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import ticket_to_ride as t2r
+
+
+@pytest.fixture(scope='module')
+def data(graph):
+    return t2r.create_data_dictionary(graph)[0]
+
+
+def _route_length(graph, route):
+    return round(10*nx.shortest_path_length(graph, route[0], route[1], weight='weight'))
+
+
+def test_decks_keep_constraints(graph, data):
+
+    short_counts, long_counts = t2r.get_t2r_europe_ticket_counts()
+
+    for seed in range(5):
+        decks = t2r.generate_decks(data, [short_counts, long_counts], seed=seed, max_per_city=6)
+
+        pairs = [frozenset(route) for routes, _ in decks for route in routes]
+        assert len(pairs) == len(set(pairs)) == sum(short_counts.values()) + sum(long_counts.values())
+
+        assert max(Counter(place for pair in pairs for place in pair).values()) <= 6
+
+        for routes, points in decks:
+            assert points.shape == (len(routes), 1)
+            assert [_route_length(graph, route) for route in routes] == points.ravel().astype(int).tolist()
+
+        assert decks[0][0] == t2r.generate_decks(data, [short_counts, long_counts], seed=seed, max_per_city=6)[0][0]
+
+
+def test_decks_from_plain_lists(graph, data):
+
+    short_counts, _ = t2r.get_t2r_europe_ticket_counts()
+    plain = {length: list(data[length]) for length in data}   # dict of lists, as before LengthBuckets
+
+    routes, points = t2r.generate_decks(plain, [short_counts], seed=2)[0]
+
+    assert len({frozenset(route) for route in routes}) == len(routes) == sum(short_counts.values())
+    assert [_route_length(graph, route) for route in routes] == points.ravel().astype(int).tolist()
+
+
+def test_deck_fallback_lengths(graph, data):
+
+    wanted = len(data['24']) + 3    # more 24 point tickets than pairs of that length
+
+    routes, points = t2r.generate_decks(data, [{'24':wanted}], seed=1)[0]
+
+    assert Counter(points.ravel().astype(int).tolist()) == {24:len(data['24']), 23:3}   # shorter length first
+    assert [_route_length(graph, route) for route in routes] == points.ravel().astype(int).tolist()
+
+    with pytest.raises(ValueError):
+        t2r.generate_decks(data, [{'24':wanted}], seed=1, fallback=0)
+
+
+def test_too_few_cities_allowed(data):
+
+    short_counts, long_counts = t2r.get_t2r_europe_ticket_counts()
+
+    with pytest.raises(ValueError):
+        t2r.generate_decks(data, [short_counts, long_counts], seed=0, max_per_city=1)
+
+
+def test_get_routes_fallback(graph, data):
+
+    wanted = len(data['24']) + 3
+
+    routes, points = t2r.get_routes(data, {'24':wanted}, 1)
+
+    assert len({frozenset(route) for route in routes}) == wanted
+    assert Counter(points.ravel().astype(int).tolist()) == {24:len(data['24']), 23:3}
+    assert [_route_length(graph, route) for route in routes] == points.ravel().astype(int).tolist()
+
+    with pytest.raises(ValueError):
+        t2r.get_routes(data, {'24':wanted}, 1, fallback=0)
+
+
+def test_get_routes_unchanged_without_fallback(data):
+
+    short_counts, _ = t2r.get_t2r_europe_ticket_counts()
+
+    routes, points = t2r.get_routes(data, short_counts, 30)
+
+    # same draws as before the fallback: one choice over each whole bucket
+    random_state = np.random.RandomState(30)
+    expected = []
+    for point in short_counts:
+        bucket = data[point]
+        select = random_state.choice(np.linspace(0, len(bucket)-1, len(bucket)), short_counts[point], replace=False)
+        expected += [list(bucket[int(idx)]) for idx in select]
+
+    assert routes == expected
+
+
+def test_bucket_pair_ids(data):
+
+    for length in data:
+        row, col = data[length].pair_ids()
+        assert [data[length].pair_id(i) for i in range(len(data[length]))] == list(zip(row.tolist(), col.tolist()))
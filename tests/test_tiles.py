@@ -0,0 +1,43 @@
+# Ticket to ride board tile tests
+
+# Connections
+import json
+import os
+
+import pytest
+
+import ticket_to_ride as t2r
+
+
+@pytest.fixture(scope='module')
+def board(graph, connections):
+
+    routes, lengths = t2r.get_all_neighbours(graph)
+    double_routes, double_lengths = t2r.get_double_routes(connections)
+
+    return t2r.create_board_colouring(routes, lengths, double_routes, double_lengths, 10)[0]
+
+
+def test_area_keeps_tile_grid(tmp_path, graph, board):
+
+    folder = str(tmp_path)
+    paths = t2r.export_board_tiles(board, graph, folder, levels=3, tile_size=64)
+
+    assert paths and all(os.path.exists(path) for path in paths)
+    with open(os.path.join(folder, 'tiles.json')) as file:
+        metadata = json.load(file)
+    assert (metadata['levels'], metadata['tile_size']) == (3, 64)
+
+    x, y = graph.nodes[next(iter(graph.nodes))]['pos']
+    area = (x - 1, y - 1, x + 1, y + 1)
+
+    for levels, tile_size in ((4, 64), (3, 128)):
+        with pytest.raises(ValueError):
+            t2r.export_board_tiles(board, graph, folder, levels=levels, tile_size=tile_size, area=area)
+
+        with open(os.path.join(folder, 'tiles.json')) as file:
+            assert json.load(file) == metadata     # index still describes the tiles on disk
+
+    updated = t2r.export_board_tiles(board, graph, folder, levels=3, tile_size=64, area=area)
+
+    assert updated and set(updated) <= set(paths)
@@ -0,0 +1,362 @@
+# Ticket to ride board archive
+
+# Binary file of many boards and ticket decks for one map, memory mapped on load
+import os
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from .T2R_array_graph import ArrayGraph
+from .T2R_create_board import BoardData, EUROPE_TRACK_COLOURS
+from .T2R_distances import graph_edge_arrays
+
+ARCHIVE_MAGIC = b'T2RBOARD'
+
+ARCHIVE_VERSION = 1     # change when the layout changes, older files are then refused
+
+ALIGN = 64  # every section starts on a multiple of this many bytes
+
+# first bytes of the file (little endian), padded to HEADER_SIZE
+HEADER = np.dtype([('magic', 'S8'), ('version', '<u2'), ('header_size', '<u2'),
+                   ('n_places', '<u4'), ('name_width', '<u4'), ('n_colours', '<u4'), ('colour_width', '<u4'),
+                   ('n_edges', '<u4'), ('n_tracks', '<u4'), ('n_boards', '<u4'), ('n_decks', '<u4'),
+                   ('deck_size', '<u4')])
+
+HEADER_SIZE = 64
+
+# place pair and integer track length of each edge (graph) or track (boards)
+EDGE = np.dtype([('place_1', '<i4'), ('place_2', '<i4'), ('length', '<i2')])
+
+
+def _board_record(n_tracks):
+    '''
+    Fixed size record of one board: colour code (-1 no colour), tunnel and
+    locomotive flag of each track
+    '''
+
+    return np.dtype([('colour', 'i1', (n_tracks,)), ('tunnel', '?', (n_tracks,)), ('locomotive', '?', (n_tracks,))])
+
+
+def _deck_record(deck_size):
+    '''
+    Fixed size record of one deck: number of tickets, then place pair and
+    points of each ticket (padded with -1 up to deck_size tickets)
+    '''
+
+    return np.dtype([('size', '<u4'), ('place_1', '<i4', (deck_size,)), ('place_2', '<i4', (deck_size,)),
+                     ('points', '<i2', (deck_size,))])
+
+
+def _padding(size):
+    return -size % ALIGN
+
+
+def _layout(header):
+    '''
+    Offset, dtype and number of items of each section, all follow from the header
+    '''
+
+    sections = [('colours', np.dtype('S%d' % header['colour_width']), header['n_colours']),
+                ('places', np.dtype('S%d' % header['name_width']), header['n_places']),
+                ('coords', np.dtype('<f8'), 2*int(header['n_places'])),   # x, y of each place
+                ('edges', EDGE, header['n_edges']),
+                ('tracks', EDGE, header['n_tracks']),
+                ('boards', _board_record(int(header['n_tracks'])), header['n_boards']),
+                ('decks', _deck_record(int(header['deck_size'])), header['n_decks'])]
+
+    layout = {}
+    offset = int(header['header_size'])
+    for name, dtype, n_items in sections:
+        offset += _padding(offset)
+        layout[name] = (offset, dtype, int(n_items))
+        offset += dtype.itemsize*int(n_items)
+
+    return layout, offset
+
+
+def _encode(names):
+    '''
+    Names as fixed width utf-8 bytes
+    '''
+
+    encoded = [str(name).encode('utf-8') for name in names]
+
+    return np.array(encoded, dtype='S%d' % max([1] + [len(name) for name in encoded]))
+
+
+def _decode(names):
+    return np.array([name.decode('utf-8') for name in names.tolist()], dtype=str)
+
+
+def _graph_arrays(graph):
+    '''
+    Sorted place names, coordinates (nan if unknown) and edges of a graph
+    '''
+
+    places, place_1, place_2, length = graph_edge_arrays(graph)
+
+    pos = graph.pos() if isinstance(graph, ArrayGraph) else nx.get_node_attributes(graph, 'pos')
+    coords = np.array([pos.get(place, (np.nan, np.nan)) for place in places.tolist()], dtype=float).reshape(-1, 2)
+
+    edges = np.zeros(len(place_1), dtype=EDGE)
+    edges['place_1'], edges['place_2'], edges['length'] = place_1, place_2, length
+
+    return places, coords, edges
+
+
+def _board_tracks(board, index):
+    '''
+    Tracks of a board as archive place ids and lengths
+    '''
+
+    names = board.places.astype(str)
+    ids = index.get_indexer(names)
+
+    used = np.zeros(len(names), dtype=bool)
+    used[board.place_1] = used[board.place_2] = True
+    missing = used & (ids < 0)
+    if missing.any():
+        raise ValueError("Board places not in the graph: %s" % sorted(names[missing].tolist()))
+
+    tracks = np.zeros(len(board), dtype=EDGE)
+    tracks['place_1'], tracks['place_2'], tracks['length'] = ids[board.place_1], ids[board.place_2], board.track_length
+
+    return tracks
+
+
+def write_archive(path, graph, boards=(), decks=(), colours=None):
+    '''
+    Save a map with any number of boards and ticket decks as one binary
+    file. Every section is a fixed width array, so the file can be memory
+    mapped and one board or deck read without reading the others (see
+    BoardArchive). Boards are written as they come, so a generator of
+    boards is never held in memory.
+
+    Layout (little endian, sections start on 64 byte boundaries)
+    -------------------------------------------------------------
+    header : magic, version and the sizes below (64 bytes)
+    colours : n_colours fixed width utf-8 colour names
+    places : n_places fixed width utf-8 place names (sorted)
+    coords : n_places x 2 float64 coordinates (nan if unknown)
+    edges : n_edges graph edges, place ids and int16 track length
+    tracks : n_tracks board tracks, place ids and int16 track length
+    boards : n_boards records of int8 colour code (-1 no colour), tunnel
+             and locomotive flag of each track
+    decks : n_decks records of number of tickets, place ids and int16
+            points of each ticket (padded to the largest deck)
+
+    Parameters
+    ----------
+    path : string, file to save
+    graph : network X graph (or ArrayGraph) of the map
+    boards : iterable of board dataframes (or BoardData), all with the
+             same tracks (e.g. colourings of one map)
+    decks : list of (routes, points) for each deck, as get_routes or generate_decks
+    colours : list of colour names of dataframe boards (default Europe colours)
+
+    Returns
+    -------
+    n_boards : int, number of boards saved
+
+    '''
+
+    places, coords, edges = _graph_arrays(graph)
+    index = pd.Index(places)
+
+    deck_size = max([0] + [len(routes) for routes, _ in decks])
+    deck_rows = np.zeros(len(decks), dtype=_deck_record(deck_size))
+    deck_rows['place_1'] = deck_rows['place_2'] = deck_rows['points'] = -1
+    for row, (routes, points) in enumerate(decks):
+        names = np.asarray(routes, dtype=object).reshape(-1, 2).astype(str)
+        ends = index.get_indexer(names.ravel()).reshape(-1, 2)
+        if np.any(ends < 0):
+            raise ValueError("Ticket places not in the graph: %s" % sorted(set(names[ends < 0].tolist())))
+        size = len(ends)
+        deck_rows['size'][row] = size
+        deck_rows['place_1'][row, :size], deck_rows['place_2'][row, :size] = ends[:, 0], ends[:, 1]
+        deck_rows['points'][row, :size] = np.rint(np.asarray(points, dtype=float).ravel())
+
+    boards = iter(boards)
+    first = next(boards, None)
+    if first is not None and not isinstance(first, BoardData):
+        first = BoardData.from_frame(first, colours)
+
+    colours = list(EUROPE_TRACK_COLOURS) if first is None else first.colours
+    tracks = np.zeros(0, dtype=EDGE) if first is None else _board_tracks(first, index)
+
+    header = np.zeros((), dtype=HEADER)
+    header['magic'], header['version'], header['header_size'] = ARCHIVE_MAGIC, ARCHIVE_VERSION, HEADER_SIZE
+    colour_names, place_names = _encode(colours), _encode(places)
+    header['n_places'], header['name_width'] = len(places), place_names.itemsize
+    header['n_colours'], header['colour_width'] = len(colours), colour_names.itemsize
+    header['n_edges'], header['n_tracks'] = len(edges), len(tracks)
+    header['n_decks'], header['deck_size'] = len(decks), deck_size
+
+    layout, _ = _layout(header)
+    board_record = _board_record(len(tracks))
+
+    def write_section(file, name, array):
+        file.write(b'\0'*(layout[name][0] - file.tell()))    # padding up to the section
+        file.write(np.ascontiguousarray(array).tobytes())
+
+    n_boards = 0
+    with open(path + '.tmp', 'wb') as file:
+        file.write(b'\0'*HEADER_SIZE)   # header written last, with the number of boards
+        write_section(file, 'colours', colour_names)
+        write_section(file, 'places', place_names)
+        write_section(file, 'coords', coords)
+        write_section(file, 'edges', edges)
+        write_section(file, 'tracks', tracks)
+        file.write(b'\0'*(layout['boards'][0] - file.tell()))
+
+        board = first
+        while board is not None:
+            if not isinstance(board, BoardData):
+                board = BoardData.from_frame(board, colours)
+            if board.colours != colours or not np.array_equal(_board_tracks(board, index), tracks):
+                raise ValueError("Board %d has different tracks or colours to the first board" % n_boards)
+
+            record = np.zeros(1, dtype=board_record)
+            record['colour'], record['tunnel'], record['locomotive'] = board.colour, board.tunnel, board.locomotive
+            file.write(record.tobytes())
+
+            n_boards += 1
+            board = next(boards, None)
+
+        header['n_boards'] = n_boards
+        layout, _ = _layout(header)
+        write_section(file, 'decks', deck_rows)
+
+        file.seek(0)
+        file.write(header.tobytes())
+
+    os.replace(path + '.tmp', path)     # never leave a half written archive
+
+    return n_boards
+
+
+class BoardArchive:
+    '''
+    Read only view of a file saved by write_archive. The file is memory
+    mapped, only the header and place names are read on opening, each
+    board or deck is read from its own fixed position when asked for.
+
+    Parameters
+    ----------
+    path : string, archive file
+
+    '''
+
+    def __init__(self, path):
+
+        self.path = path
+
+        header = np.fromfile(path, dtype=HEADER, count=1)
+        if len(header) == 0 or header[0]['magic'] != ARCHIVE_MAGIC:
+            raise ValueError("%s is not a board archive" % path)
+        self.header = header[0]
+        if self.header['version'] != ARCHIVE_VERSION:
+            raise ValueError("%s is archive version %d, only version %d can be read"
+                             % (path, self.header['version'], ARCHIVE_VERSION))
+
+        layout, size = _layout(self.header)
+        if os.path.getsize(path) < size:
+            raise ValueError("%s is truncated" % path)
+
+        self._data = np.memmap(path, dtype=np.uint8, mode='r', shape=(size,))
+        self._sections = {name:self._data[offset:offset + dtype.itemsize*n_items].view(dtype) if n_items
+                          else np.zeros(0, dtype) for name, (offset, dtype, n_items) in layout.items()}
+
+        self.colours = _decode(self._sections['colours']).tolist()
+        self.places = _decode(self._sections['places'])
+
+    def __len__(self):
+        return int(self.header['n_boards'])
+
+    def __iter__(self):
+        return (self.board(index) for index in range(len(self)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        '''
+        Release the memory map
+        '''
+
+        self._sections = {}
+        self._data = None
+
+    @property
+    def n_decks(self):
+        return int(self.header['n_decks'])
+
+    @property
+    def coords(self):
+        return np.array(self._sections['coords']).reshape(-1, 2)
+
+    def graph(self, array_graph=False):
+        '''
+        Graph of the map, network X graph (as build_graph) or ArrayGraph
+        '''
+
+        edges = self._sections['edges']
+        graph = ArrayGraph(self.places, self.coords, edges['place_1'], edges['place_2'], edges['length']/10)
+
+        return graph if array_graph else graph.to_networkx()
+
+    def board(self, index, as_frame=False):
+        '''
+        One board of the archive
+
+        Parameters
+        ----------
+        index : int, position of the board (negative from the end)
+        as_frame : bool, return a pandas dataframe, otherwise BoardData arrays
+
+        Returns
+        -------
+        board_data : BoardData (or pandas dataframe) of the board
+
+        '''
+
+        record = self._sections['boards'][index]     # IndexError past the end
+        tracks = self._sections['tracks']
+
+        board = BoardData(self.places, tracks['place_1'], tracks['place_2'], tracks['length'], self.colours,
+                          record['colour'].copy(), record['tunnel'].copy(), record['locomotive'].copy())
+
+        return board.to_frame() if as_frame else board
+
+    def colour_array(self):
+        '''
+        Colour codes of every board as a (memory mapped) n_boards X n_tracks array
+        '''
+
+        return self._sections['boards']['colour']
+
+    def deck(self, index):
+        '''
+        One ticket deck of the archive
+
+        Parameters
+        ----------
+        index : int, position of the deck (negative from the end)
+
+        Returns
+        -------
+        routes : list of place pairs of each ticket
+        points : numpy array of points for each ticket, as get_routes
+
+        '''
+
+        record = self._sections['decks'][index]
+        size = int(record['size'])
+
+        routes = np.column_stack([self.places[record['place_1'][:size]], self.places[record['place_2'][:size]]])
+
+        return routes.tolist(), record['points'][:size].astype(float).reshape(-1, 1)
@@ -0,0 +1,210 @@
+# Ticket to ride array graph
+
+# Graph stored as numpy arrays (CSR adjacency) instead of networkx dicts
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+
+class ArrayGraph:
+    '''
+    Undirected graph with integer place ids, stored as arrays: place
+    names (the id is the position), place coordinates, one entry per
+    edge (place ids and weight) and a CSR adjacency (indptr, neighbour
+    ids and edge id of each neighbour). Uses much less memory than a
+    network X graph for large boards, and can be passed to the
+    T2R_build_network and T2R_plotting functions in place of one.
+
+    Like nx.Graph a place pair has at most one edge (the last weight
+    given is kept) and places in edges without coordinates are added
+    with nan coordinates.
+
+    Parameters
+    ----------
+    places : array of place names
+    coords : numpy array of size no.places X 2 of x, y coordinates
+    edge_1, edge_2 : numpy arrays of place ids at each end of each edge
+    weight : numpy array of weight of each edge (track length/10, as build_graph)
+
+    '''
+
+    def __init__(self, places, coords, edge_1, edge_2, weight):
+
+        self.places = np.array(list(places))
+        self.coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+
+        self._index = pd.Index(self.places)    # hashed name to id lookup
+
+        edge_1 = np.asarray(edge_1, dtype=np.int64)
+        edge_2 = np.asarray(edge_2, dtype=np.int64)
+        weight = np.asarray(weight, dtype=float)
+
+        # keep the last edge for each place pair, in order of first appearance
+        n_places = len(self.places)
+        key = np.minimum(edge_1, edge_2)*n_places + np.maximum(edge_1, edge_2)
+        _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+        last = np.zeros(len(first), dtype=np.int64)
+        last[inverse] = np.arange(len(key))    # later edges overwrite earlier ones
+        order = np.argsort(first, kind='stable')
+
+        self.edge_1 = edge_1[first[order]].astype(np.int32)
+        self.edge_2 = edge_2[first[order]].astype(np.int32)
+        self.weight = weight[last[order]]
+
+        # CSR adjacency, both directions of each edge
+        ends = np.concatenate([self.edge_1, self.edge_2])
+        others = np.concatenate([self.edge_2, self.edge_1])
+        edge_ids = np.tile(np.arange(len(self.edge_1), dtype=np.int32), 2)
+
+        adj_order = np.argsort(ends, kind='stable')
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(ends, minlength=n_places))]).astype(np.int64)
+        self.indices = others[adj_order].astype(np.int32)
+        self.adj_edges = edge_ids[adj_order]
+
+    @classmethod
+    def from_named_edges(cls, places, coords, place_1, place_2, weight):
+        '''
+        Graph from place names and coordinates and edges given by place
+        names, places only in the edges are added with nan coordinates
+        '''
+
+        places = list(places)
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+
+        names = pd.Index(places)
+
+        if not names.is_unique:     # keep the first position and last coordinates, as nx.Graph
+            codes, unique_places = pd.factorize(names)
+            last = np.zeros(len(unique_places), dtype=np.int64)
+            last[codes] = np.arange(len(codes))
+            places, coords = list(unique_places), coords[last]
+            names = pd.Index(places)
+
+        ends = np.concatenate([np.asarray(place_1, dtype=object), np.asarray(place_2, dtype=object)])
+        missing = pd.unique(ends[names.get_indexer(ends) < 0])    # places without coordinates
+
+        if len(missing):
+            places += list(missing)
+            coords = np.vstack([coords, np.full((len(missing), 2), np.nan)])
+            names = pd.Index(places)
+
+        ids = names.get_indexer(ends)
+
+        return cls(places, coords, ids[:len(ids)//2], ids[len(ids)//2:], weight)
+
+    @classmethod
+    def from_frames(cls, locations, connections):
+        '''
+        Graph from the locations and connections dataframes (as build_graph)
+        '''
+
+        return cls.from_named_edges(locations.place.tolist(), locations[['coord_x', 'coord_y']].to_numpy(),
+                                    connections.place_1.to_numpy(), connections.place_2.to_numpy(),
+                                    connections.length.to_numpy()/10)
+
+    @classmethod
+    def from_networkx(cls, graph):
+        '''
+        Graph from a network X graph with 'pos' and 'weight' attributes
+        '''
+
+        places = list(graph.nodes)
+        pos = nx.get_node_attributes(graph, 'pos')
+
+        coords = np.array([pos.get(place, (np.nan, np.nan)) for place in places], dtype=float).reshape(-1, 2)
+
+        edges = list(graph.edges(data='weight'))
+        place_1, place_2, weight = zip(*edges) if edges else ((), (), ())
+
+        index = pd.Index(places)
+
+        return cls(places, coords, index.get_indexer(list(place_1)), index.get_indexer(list(place_2)), weight)
+
+    def to_networkx(self):
+        '''
+        Network X graph with 'pos' node and 'weight' edge attributes (as build_graph)
+        '''
+
+        graph = nx.Graph()
+
+        has_pos = ~np.isnan(self.coords).any(axis=1)
+        coords = [tuple(xy) for xy in self.coords.tolist()]
+
+        graph.add_nodes_from((place, {'pos':xy} if ok else {}) for place, xy, ok in
+                             zip(self.places.tolist(), coords, has_pos.tolist()))
+        graph.add_weighted_edges_from(zip(self.places[self.edge_1].tolist(), self.places[self.edge_2].tolist(),
+                                          self.weight.tolist()))
+
+        return graph
+
+    def number_of_nodes(self):
+        return len(self.places)
+
+    def number_of_edges(self):
+        return len(self.edge_1)
+
+    def __len__(self):
+        return len(self.places)
+
+    def ids(self, places):
+        '''
+        Integer ids of place names
+        '''
+
+        ids = self._index.get_indexer(np.asarray(places, dtype=object).ravel())
+
+        if np.any(ids < 0):
+            raise KeyError("Unknown places: %s" % sorted(set(np.asarray(places, dtype=object).ravel()[ids < 0])))
+
+        return ids.reshape(np.shape(places))
+
+    def neighbours(self, place):
+        '''
+        Names of the neighbours of a place
+        '''
+
+        place_id = self.ids([place])[0]
+
+        return self.places[self.indices[self.indptr[place_id]:self.indptr[place_id+1]]]
+
+    def degree(self):
+        '''
+        Number of neighbours of each place
+        '''
+
+        return np.diff(self.indptr)
+
+    def edge_lengths(self):
+        '''
+        Integer track length of each edge
+        '''
+
+        return np.rint(self.weight*10).astype(int)
+
+    def pos(self):
+        '''
+        Dict of place name: (x, y) (as nx.get_node_attributes(graph, 'pos'))
+        '''
+
+        has_pos = ~np.isnan(self.coords).any(axis=1)
+
+        return {place:tuple(xy) for place, xy in zip(self.places[has_pos].tolist(), self.coords[has_pos].tolist())}
+
+    def sorted_edge_arrays(self):
+        '''
+        Edges with ids of the sorted place names (as graph_edge_arrays)
+
+        Returns
+        -------
+        location_keys : numpy array of all sorted place names
+        place_1, place_2 : numpy arrays of sorted place ids of each edge
+        length : numpy array of integer track length of each edge
+
+        '''
+
+        order = np.argsort(self.places, kind='stable')
+
+        rank = np.empty(len(order), dtype=np.int64)    # sorted position of each place id
+        rank[order] = np.arange(len(order))
+
+        return self.places[order], rank[self.edge_1], rank[self.edge_2], self.edge_lengths()
@@ -0,0 +1,422 @@
+# Ticket to ride board optimisation
+
+# Simulated annealing of a board colouring, tunnels and locomotives
+import math
+
+import numpy as np
+import pandas as pd
+
+from .T2R_create_board import EUROPE_TRACK_COLOURS, BoardData, _as_board
+from .T2R_board_search import BOARD_METRICS
+from .T2R_random import make_random_state, uniform_draws
+from .T2R_profile import stage, count
+
+OPTIMISE_METRICS = list(BOARD_METRICS) + ['feature_clustering']
+
+MOVES = {'swap':0.4, 'recolour':0.3, 'tunnel':0.15, 'locomotive':0.15}   # share of each kind of move
+
+
+def board_data_layout(board):
+    '''
+    Board layout (as board_layout) of BoardData tracks, tracks between the
+    same two places are double routes
+
+    Parameters
+    ----------
+    board : BoardData
+
+    Returns
+    -------
+    layout : dict as board_layout, for the board metrics
+
+    '''
+
+    low = np.minimum(board.place_1, board.place_2).astype(np.int64)
+    high = np.maximum(board.place_1, board.place_2)
+
+    order = np.argsort(low*len(board.places) + high, kind='stable')
+    key = (low*len(board.places) + high)[order]
+
+    same = np.flatnonzero(key[1:] == key[:-1])  # consecutive tracks between the same places
+    double_pairs = np.column_stack([order[same], order[same+1]]).reshape(-1, 2)
+
+    colours = list(board.colours)
+
+    return {'places':board.places,
+            'route_places':np.column_stack([board.place_1, board.place_2]),
+            'route_len':board.track_length.astype(int),
+            'double_pairs':double_pairs,
+            'colours':colours,
+            'grey':colours.index('grey') if 'grey' in colours else -1}
+
+
+def feature_clustering(board):
+    '''
+    Number of pairs of tunnels, and of locomotives, at the same city, per city
+
+    Parameters
+    ----------
+    board : BoardData
+
+    Returns
+    -------
+    score : float (lower is better)
+
+    '''
+
+    n_places = len(board.places)
+
+    score = 0
+    for mask in (board.tunnel, board.locomotive):
+        counts = np.bincount(np.concatenate([board.place_1[mask], board.place_2[mask]]), minlength=n_places)
+        score += (counts*(counts-1)//2).sum()
+
+    return score/max(n_places, 1)
+
+
+def board_scores(board_data, weights=None):
+    '''
+    Board metrics (BOARD_METRICS and feature_clustering) of one board
+
+    Parameters
+    ----------
+    board_data : BoardData or pandas dataframe with board data
+
+    weights : dict of name: weight for each metric (default 1)
+
+    Returns
+    -------
+    scores : dict of each metric and the weighted 'score' (lower is better)
+
+    '''
+
+    board, _ = _as_board(board_data, list(EUROPE_TRACK_COLOURS))
+
+    if weights is None:
+        weights = {}
+
+    layout = board_data_layout(board)
+
+    colour_idx = np.maximum(board.colour.astype(int), 0)[None, :]
+
+    scores = {name:float(metric(colour_idx, layout)[0]) for name, metric in BOARD_METRICS.items()}
+    scores['feature_clustering'] = float(feature_clustering(board))
+
+    scores['score'] = sum(weights.get(name, 1.0)*scores[name] for name in OPTIMISE_METRICS)
+
+    return scores
+
+
+class _AnnealingState:
+    '''
+    Board colouring with the counts the metrics are made of, each change
+    returns the change in the weighted score and only updates the two
+    cities at the ends of the track
+    '''
+
+    __slots__ = ('ends', 'length', 'colour', 'tunnel', 'locomotive', 'partner', 'counts', 'spaces', 'target',
+                 'tunnels', 'locomotives', 'feature_tracks', 'feature_slots', 'grey',
+                 'city_weight', 'budget_weight', 'double_weight', 'feature_weight')
+
+    def __init__(self, board, weights):
+
+        layout = board_data_layout(board)
+
+        n_places = max(len(board.places), 1)
+        n_colours = len(board.colours)
+
+        self.ends = list(zip(board.place_1.tolist(), board.place_2.tolist()))
+        self.length = board.track_length.astype(int).tolist()
+        self.colour = board.colour.astype(int).tolist()
+        self.tunnel = board.tunnel.tolist()
+        self.locomotive = board.locomotive.tolist()
+        self.grey = layout['grey']
+
+        # tunnel (0) and locomotive (1) tracks of each colour, and the position of each track in its list
+        self.feature_tracks = ([[] for _ in range(n_colours)], [[] for _ in range(n_colours)])
+        self.feature_slots = ({}, {})
+        for kind, flags in enumerate((self.tunnel, self.locomotive)):
+            for track in np.flatnonzero(flags).tolist():
+                self._add_feature(kind, track)
+
+        self.partner = [-1]*len(board)   # other track of a double route
+        for first, second in layout['double_pairs'].tolist():
+            self.partner[first], self.partner[second] = second, first
+
+        self.counts = [[0]*n_colours for _ in range(n_places)]    # tracks of each colour at each city
+        self.tunnels = [0]*n_places
+        self.locomotives = [0]*n_places
+        for track, (place_1, place_2) in enumerate(self.ends):
+            for place in (place_1, place_2):
+                self.counts[place][self.colour[track]] += 1
+                self.tunnels[place] += self.tunnel[track]
+                self.locomotives[place] += self.locomotive[track]
+
+        budget = np.array([EUROPE_TRACK_COLOURS.get(colour, 0) for colour in board.colours], dtype=float)
+        total = max(sum(self.length), 1)
+
+        self.spaces = np.bincount(board.colour.astype(int), weights=self.length, minlength=n_colours).tolist()
+        self.target = (total*budget/budget.sum()).tolist()  # as colour_target_deviation
+
+        self.city_weight = weights.get('city_clustering', 1.0)/n_places
+        self.budget_weight = weights.get('colour_targets', 1.0)/total
+        self.double_weight = weights.get('double_collisions', 1.0)
+        self.feature_weight = weights.get('feature_clustering', 1.0)/n_places
+
+    def _add_feature(self, kind, track):
+        tracks = self.feature_tracks[kind][self.colour[track]]
+        self.feature_slots[kind][track] = len(tracks)
+        tracks.append(track)
+
+    def _remove_feature(self, kind, track):
+        tracks = self.feature_tracks[kind][self.colour[track]]
+        slot = self.feature_slots[kind].pop(track)
+        last = tracks.pop()
+        if last != track:   # last track fills the gap
+            tracks[slot] = last
+            self.feature_slots[kind][last] = slot
+
+    def recolour(self, track, new):
+        '''
+        Change the colour of a track
+        '''
+
+        old = self.colour[track]
+
+        if old == new:
+            return 0.0
+
+        features = [kind for kind, flags in enumerate((self.tunnel, self.locomotive)) if flags[track]]
+        for kind in features:
+            self._remove_feature(kind, track)
+
+        grey = self.grey
+
+        city = 0
+        for place in self.ends[track]:
+            row = self.counts[place]
+            row[old] -= 1
+            if old != grey:
+                city -= row[old]    # pairs with the other tracks of the old colour
+            if new != grey:
+                city += row[new]
+            row[new] += 1
+
+        length = self.length[track]
+        spaces, target = self.spaces, self.target
+        budget = (abs(spaces[old] - length - target[old]) - abs(spaces[old] - target[old]) +
+                  abs(spaces[new] + length - target[new]) - abs(spaces[new] - target[new]))
+        spaces[old] -= length
+        spaces[new] += length
+
+        double = 0
+        other = self.partner[track]
+        if other >= 0:
+            double = (self.colour[other] == new and new != grey) - (self.colour[other] == old and old != grey)
+
+        self.colour[track] = new
+
+        for kind in features:
+            self._add_feature(kind, track)
+
+        return self.city_weight*city + self.budget_weight*budget + self.double_weight*double
+
+    def set_features(self, track, tunnel, locomotive):
+        '''
+        Set whether a track is a tunnel and has a locomotive
+        '''
+
+        features = 0
+
+        for kind, flags, counts, value in ((0, self.tunnel, self.tunnels, tunnel),
+                                           (1, self.locomotive, self.locomotives, locomotive)):
+            if flags[track] == value:
+                continue
+            for place in self.ends[track]:
+                if value:
+                    features += counts[place]
+                    counts[place] += 1
+                else:
+                    counts[place] -= 1
+                    features -= counts[place]
+            flags[track] = value
+            if value:
+                self._add_feature(kind, track)
+            else:
+                self._remove_feature(kind, track)
+
+        return self.feature_weight*features
+
+    def features(self, track):
+        return self.tunnel[track], self.locomotive[track]
+
+
+def _propose(state, move, picks, n_colours):
+    '''
+    Make a random move, returns the change in score and the changes to
+    undo it, or None if the picked tracks do not allow the move
+    '''
+
+    n_tracks = len(state.colour)
+    track = int(picks[0]*n_tracks)
+    colour = state.colour[track]
+
+    if move == 'swap':  # swap the colours (and tunnels and locomotives) of two tracks
+        other = int(picks[1]*n_tracks)
+        other_colour = state.colour[other]
+        if other_colour == colour:
+            return None
+
+        features, other_features = state.features(track), state.features(other)
+        if (features[0] and not 2 <= state.length[other] <= 3) or (other_features[0] and not 2 <= state.length[track] <= 3):
+            return None     # tunnels stay on 2-3 long tracks
+
+        delta = (state.recolour(track, other_colour) + state.recolour(other, colour) +
+                 state.set_features(track, *other_features) + state.set_features(other, *features))
+
+        return delta, [(track, colour, features), (other, other_colour, other_features)]
+
+    if move == 'recolour':  # new colour for a track without a tunnel or locomotive
+        new = int(picks[1]*(n_colours-1))
+        new += new >= colour
+        if state.tunnel[track] or state.locomotive[track]:
+            return None
+
+        return state.recolour(track, new), [(track, colour, (False, False))]
+
+    # move a tunnel or locomotive to another track of the same colour
+    tunnel = move == 'tunnel'
+
+    if state.tunnel[track] or state.locomotive[track] or (tunnel and not 2 <= state.length[track] <= 3):
+        return None
+
+    same = state.feature_tracks[0 if tunnel else 1][colour]
+    if not same:
+        return None
+
+    old = same[int(picks[1]*len(same))]
+    old_features = state.features(old)
+
+    # only the moved feature leaves the old track (a tunnel can also have a locomotive)
+    delta = (state.set_features(old, old_features[0] and not tunnel, old_features[1] and tunnel) +
+             state.set_features(track, tunnel, not tunnel))
+
+    return delta, [(old, colour, old_features), (track, colour, (False, False))]
+
+
+def _undo(state, changes):
+    for track, colour, features in changes:
+        state.recolour(track, colour)
+        state.set_features(track, *features)
+
+
+@stage('optimise_board_colouring')
+def optimise_board_colouring(board_data, n_steps=20000, seed=None, weights=None, temperature=None, cooling=1e-3):
+    '''
+    Improve a board colouring (e.g. from create_board_colouring) by
+    simulated annealing. Moves swap the colours of two tracks (tunnels and
+    locomotives move with their colour), recolour a track, or move a tunnel
+    or locomotive to another track of the same colour. The score is the
+    weighted sum of the BOARD_METRICS (colour budget, same colours at each
+    city, double routes with the same colour) and feature_clustering
+    (tunnels and locomotives at the same city). It is updated for the
+    cities at the ends of the changed tracks only, so each step takes the
+    same time whatever the board size.
+
+    Each colour keeps its number of tunnels (on tracks of length 2-3) and
+    locomotives (on other tracks).
+
+    Parameters
+    ----------
+    board_data : BoardData or pandas dataframe with board data (all tracks coloured)
+
+    n_steps : int, number of moves tried
+
+    seed : int, numpy RandomState, Generator or SeedSequence (see make_random_state)
+
+    weights : dict of name: weight for each metric (default 1)
+
+    temperature : float, start temperature (default the mean score increase of random moves)
+
+    cooling : float, end temperature as a fraction of the start temperature
+
+    Returns
+    -------
+    board_data : optimised board, same type as the input (the input is not changed)
+
+    scores : pandas dataframe of each metric and score at the 'start' and 'end'
+
+    '''
+
+    random_state = make_random_state(seed)
+
+    if weights is None:
+        weights = {}
+
+    board, is_frame = _as_board(board_data, list(EUROPE_TRACK_COLOURS))
+
+    if np.any(board.colour < 0):
+        raise ValueError("All tracks must be coloured to optimise the board")
+
+    board = BoardData(board.places, board.place_1, board.place_2, board.track_length, board.colours,
+                      board.colour.copy(), board.tunnel.copy(), board.locomotive.copy())
+
+    start_scores = board_scores(board, weights)
+
+    state = _AnnealingState(board, weights)
+
+    n_colours = len(board.colours)
+
+    moves = list(MOVES)
+    move_cdf = np.cumsum(list(MOVES.values()))/sum(MOVES.values())
+
+    def draws(n):
+        # move kind, two track/colour picks and the acceptance draw of each step
+        uniforms = uniform_draws(random_state, 4*n).reshape(n, 4)
+        kinds = np.minimum(np.searchsorted(move_cdf, uniforms[:, 0], side='right'), len(moves)-1)
+        return [moves[kind] for kind in kinds.tolist()], uniforms[:, 1:3].tolist(), uniforms[:, 3].tolist()
+
+    if len(board) < 2 or n_steps < 1:
+        return (board.to_frame() if is_frame else board), pd.DataFrame([start_scores, start_scores], index=['start', 'end'])
+
+    if temperature is None:     # mean increase of some random moves, which are undone
+        increases = []
+        for move, picks, _ in zip(*draws(200)):
+            result = _propose(state, move, picks, n_colours)
+            if result is not None:
+                if result[0] > 0:
+                    increases.append(result[0])
+                _undo(state, result[1])
+        temperature = np.mean(increases) if increases else 1.0
+
+    decay = cooling**(1/n_steps)    # geometric cooling to cooling*temperature
+
+    accepted = 0
+    step = 0
+    while step < n_steps:
+        block = min(n_steps - step, 4096)   # random numbers are drawn in blocks
+
+        for move, picks, uniform in zip(*draws(block)):
+            result = _propose(state, move, picks, n_colours)
+
+            if result is not None:
+                delta, changes = result
+                if delta <= 0 or uniform < math.exp(-delta/temperature):
+                    accepted += 1
+                else:
+                    _undo(state, changes)
+
+            temperature *= decay
+
+        step += block
+
+    count('annealing_steps', n_steps)
+    count('moves_accepted', accepted)
+
+    board.colour = np.array(state.colour, dtype=np.int8)
+    board.tunnel = np.array(state.tunnel, dtype=bool)
+    board.locomotive = np.array(state.locomotive, dtype=bool)
+
+    scores = pd.DataFrame([start_scores, board_scores(board, weights)], index=['start', 'end'])
+
+    return (board.to_frame() if is_frame else board), scores
@@ -0,0 +1,342 @@
+# Ticket to ride board search
+
+# Generate and score many board colourings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .T2R_create_board import EUROPE_TRACK_COLOURS, sample_track_colours_batch, create_board_colouring
+from .T2R_profile import stage, count
+
+
+def board_layout(route_list, route_len, double_routes_list, double_routes_len):
+    '''
+    Integer arrays describing the board tracks, used by the board metrics
+
+    Parameters
+    ----------
+    route_list : list of neighbouring routes
+
+    route_len : length of each neighbouring route
+
+    double_routes_list : list of neighbouring routes (duplicates)
+
+    double_routes_len : length of each neighbouring duplicate route
+
+    Returns
+    -------
+    layout : dict with
+             'places' : numpy array of place names
+             'route_places' : numpy array of size no.routes X 2 of place ids
+             'route_len' : numpy array of integer length of each route
+             'double_pairs' : numpy array of size no.double routes X 2,
+                              index of the single route and its double
+             'colours' : list of colour names, 'grey' : index of grey
+
+    '''
+
+    routes = list(route_list) + list(double_routes_list)  # same order as create_board_colouring
+
+    names = np.array([[str(place) for place in route] for route in routes]).reshape(-1, 2)
+
+    places, route_places = np.unique(names, return_inverse=True)
+    route_places = route_places.reshape(-1, 2)
+
+    # match each double route to its single route by sorted place ids
+    n_single = len(route_list)
+    low, high = route_places.min(axis=1), route_places.max(axis=1)
+    pair_key = low*len(places) + high
+
+    single_keys = pair_key[:n_single]
+    order = np.argsort(single_keys)
+    pos = np.searchsorted(single_keys[order], pair_key[n_single:])
+    pos = np.minimum(pos, max(n_single-1, 0))
+
+    double_idx = np.arange(n_single, len(routes))
+    matched = single_keys[order][pos] == pair_key[n_single:] if n_single else np.zeros(0, dtype=bool)
+    double_pairs = np.column_stack([order[pos][matched], double_idx[matched]])
+
+    colours = list(EUROPE_TRACK_COLOURS.keys())
+
+    return {'places':places,
+            'route_places':route_places,
+            'route_len':np.append(route_len, double_routes_len).astype(int),
+            'double_pairs':double_pairs,
+            'colours':colours,
+            'grey':colours.index('grey')}
+
+
+def colour_target_deviation(colour_idx, layout):
+    '''
+    Deviation of track spaces of each colour from the Europe colour
+    proportions, as a fraction of all track spaces
+
+    Parameters
+    ----------
+    colour_idx : numpy array of size no.boards X no.routes of colour indexes
+
+    layout : dict from board_layout
+
+    Returns
+    -------
+    score : numpy array of score for each board (lower is better)
+
+    '''
+
+    n_colours = len(layout['colours'])
+
+    budget = np.array(list(EUROPE_TRACK_COLOURS.values()), dtype=float)
+
+    total = layout['route_len'].sum()
+
+    target = total*budget/budget.sum()  # expected spaces of each colour
+
+    # spaces of each colour for each board
+    offsets = np.arange(colour_idx.shape[0])[:, None]*n_colours
+    spaces = np.bincount((colour_idx + offsets).ravel(), weights=np.broadcast_to(layout['route_len'], colour_idx.shape).ravel(),
+                         minlength=colour_idx.shape[0]*n_colours).reshape(-1, n_colours)
+
+    return np.abs(spaces - target).sum(axis=1)/total
+
+
+def city_colour_clustering(colour_idx, layout):
+    '''
+    Number of pairs of tracks at the same city with the same colour
+    (grey tracks not counted), per city
+
+    Parameters
+    ----------
+    colour_idx : numpy array of size no.boards X no.routes of colour indexes
+
+    layout : dict from board_layout
+
+    Returns
+    -------
+    score : numpy array of score for each board (lower is better)
+
+    '''
+
+    n_colours = len(layout['colours'])
+    n_places = len(layout['places'])
+    n_boards = colour_idx.shape[0]
+
+    # count colour of tracks at both ends of each route
+    ends = layout['route_places'].T[:, None, :]*n_colours + colour_idx[None, :, :]
+    ends = ends + (np.arange(n_boards)*n_places*n_colours)[None, :, None]
+
+    counts = np.bincount(ends.ravel(), minlength=n_boards*n_places*n_colours).reshape(n_boards, n_places, n_colours)
+
+    counts[:, :, layout['grey']] = 0
+
+    return (counts*(counts-1)//2).sum(axis=(1, 2)) / max(n_places, 1)
+
+
+def double_route_collisions(colour_idx, layout):
+    '''
+    Number of double routes with both tracks the same colour (grey allowed)
+
+    Parameters
+    ----------
+    colour_idx : numpy array of size no.boards X no.routes of colour indexes
+
+    layout : dict from board_layout
+
+    Returns
+    -------
+    score : numpy array of score for each board (lower is better)
+
+    '''
+
+    first = colour_idx[:, layout['double_pairs'][:, 0]]
+    second = colour_idx[:, layout['double_pairs'][:, 1]]
+
+    return ((first == second) & (first != layout['grey'])).sum(axis=1).astype(float)
+
+
+# default metrics for scoring boards, name: function(colour_idx, layout)
+BOARD_METRICS = {'colour_targets':colour_target_deviation,
+                 'city_clustering':city_colour_clustering,
+                 'double_collisions':double_route_collisions}
+
+
+def _playable(colour_idx, layout):
+    '''
+    Boards that did not run out of colours and where add_tunnels and
+    add_locomotives can place their tracks: every colour needs a route of
+    length 2 or 3 (tunnel) and at least one other route (locomotives)
+    '''
+
+    n_colours = len(layout['colours'])
+
+    if colour_idx.shape[1] == 0:
+        return np.zeros(colour_idx.shape[0], dtype=bool)
+
+    short = (layout['route_len'] >= 2) & (layout['route_len'] <= 3)
+
+    # number of routes, and of 2-3 length routes, of each colour
+    offsets = np.arange(colour_idx.shape[0])[:, None]*n_colours
+    flat = (np.maximum(colour_idx, 0) + offsets).ravel()
+    counts = np.bincount(flat, minlength=colour_idx.shape[0]*n_colours).reshape(-1, n_colours)
+    short_counts = np.bincount(flat, weights=np.broadcast_to(short, colour_idx.shape).ravel(),
+                               minlength=colour_idx.shape[0]*n_colours).reshape(-1, n_colours)
+
+    return (colour_idx[:, 0] >= 0) & np.all(counts >= 2, axis=1) & np.all(short_counts >= 1, axis=1)
+
+
+def _board_random_state(seed_sequence):
+    '''
+    RandomState for one board from its own seed sequence stream
+    (PCG64 as it is much quicker to seed than MT19937)
+    '''
+
+    return np.random.RandomState(np.random.PCG64(seed_sequence))
+
+
+def _score_batch(layout, seed_sequences, first_board, metrics, weights, top_n):
+    '''
+    Sample and score one batch of boards, only the top_n with a finite
+    score (playable boards) are returned
+
+    Returns
+    -------
+    board : numpy array of board numbers
+    score : numpy array of weighted score of each board
+    values : numpy array of size top_n X no.metrics of each metric
+
+    '''
+
+    n_routes = len(layout['route_len'])
+
+    uniforms = np.array([_board_random_state(seed).random_sample(n_routes) for seed in seed_sequences])
+    uniforms = uniforms.reshape(len(seed_sequences), n_routes)
+
+    colour_idx = sample_track_colours_batch(layout['route_len'], list(EUROPE_TRACK_COLOURS.values()), uniforms)
+
+    valid = _playable(colour_idx, layout)
+
+    values = np.column_stack([metrics[name](np.maximum(colour_idx, 0), layout) for name in metrics])
+    values[~valid] = np.inf  # boards that ran out of colours
+
+    score = values @ np.array([weights.get(name, 1.0) for name in metrics])
+
+    finite = np.flatnonzero(np.isfinite(score))     # unplayable boards are never kept
+    keep = finite[np.argsort(score[finite], kind='stable')[:top_n]]
+
+    return first_board + keep, score[keep], values[keep]
+
+
+@stage('generate_board_colourings')
+def generate_board_colourings(route_list, route_len, double_routes_list, double_routes_len, n_boards,
+                              seed=None, top_n=10, metrics=None, weights=None, processes=1, batch_size=1024):
+    '''
+    Generate many board colourings and keep the best scoring boards.
+    Every board has its own random stream (spawned from seed), boards are
+    sampled and scored in batches (across a process pool) and only the
+    top_n of each batch are kept, the DataFrames are only made for the
+    final top boards.
+
+    Parameters
+    ----------
+    route_list : list of neighbouring routes
+
+    route_len : length of each neighbouring route
+
+    double_routes_list : list of neighbouring routes (duplicates)
+
+    double_routes_len : length of each neighbouring duplicate route
+
+    n_boards : int, number of boards to generate
+
+    seed : int or numpy SeedSequence, random seed for all boards
+
+    top_n : int, number of best boards to return
+
+    metrics : dict of name: function(colour_idx, layout) returning a score
+              for each board, lower is better (default BOARD_METRICS)
+
+    weights : dict of name: weight for each metric (default 1)
+
+    processes : int, number of processes to score boards in
+
+    batch_size : int, number of boards sampled at once
+
+    Returns
+    -------
+    boards : list of (board_data, colour_counts) for the top boards, as
+             create_board_colouring (fewer than top_n if fewer boards are playable)
+    scores : pandas dataframe of board number, score and each metric for the top boards
+
+    '''
+
+    if n_boards < 1:
+        raise ValueError("n_boards must be at least 1")
+
+    if metrics is None:
+        metrics = BOARD_METRICS
+
+    if weights is None:
+        weights = {}
+
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+    layout = board_layout(route_list, route_len, double_routes_list, double_routes_len)
+
+    starts = range(0, n_boards, batch_size)
+
+    def batch_args(start):
+        # seed sequences are spawned per batch so they are never all held at once
+        children = [np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (board,),
+                                           pool_size=root.pool_size) for board in range(start, min(start+batch_size, n_boards))]
+        return layout, children, start, metrics, weights, top_n
+
+    results = []
+
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            for start in range(0, n_boards, batch_size*processes): # submit a round of batches at a time
+                futures = [pool.submit(_score_batch, *batch_args(batch)) for batch in
+                           range(start, min(start+batch_size*processes, n_boards), batch_size)]
+                results += [future.result() for future in futures]
+                results = [_merge_top(results, top_n)]
+    else:
+        for start in starts:
+            results = [_merge_top(results + [_score_batch(*batch_args(start))], top_n)]
+
+    board, score, values = _merge_top(results, top_n)
+    
+    count('boards_sampled', n_boards)
+
+    if len(board) == 0:
+        raise ValueError("None of the %d boards is playable (a colour ran out or has no tracks for "
+                         "tunnels and locomotives), try more boards" % n_boards)
+
+    scores = pd.DataFrame(values, columns=list(metrics))
+    scores.insert(0, 'score', score)
+    scores.insert(0, 'board', board)
+
+    boards = []
+    for number in board:  # recreate the top boards from their random stream
+        seed_sequence = np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (int(number),),
+                                               pool_size=root.pool_size)
+        boards.append(create_board_colouring(route_list, route_len, double_routes_list, double_routes_len,
+                                             _board_random_state(seed_sequence)))
+
+    return boards, scores
+
+
+def _merge_top(results, top_n):
+    '''
+    Combine batch results keeping the top_n scores
+    '''
+
+    if len(results) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0), np.zeros((0, 0))
+
+    board = np.concatenate([result[0] for result in results])
+    score = np.concatenate([result[1] for result in results])
+    values = np.concatenate([result[2] for result in results])
+
+    keep = np.lexsort((board, score))[:top_n]  # best score, then lowest board number
+
+    return board[keep], score[keep], values[keep]
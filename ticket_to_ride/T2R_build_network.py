@@ -1,11 +1,19 @@
 # Ticket to ride graph and nodes
 
 # Connections
+from concurrent.futures import ProcessPoolExecutor
+
 import networkx as nx
 import numpy as np
 
+from .T2R_distances import (graph_edge_arrays, distance_matrix, condensed_to_upper, LengthBuckets, place_ids,
+                            condensed_index, condensed_pairs)
+from .T2R_route_index import edge_adjacency, index_batch, RouteIndex
+from .T2R_profile import stage, count
+
 
-def build_graph(locations, connections):
+@stage('build_graph')
+def build_graph(locations, connections, array_graph=False):
     '''
     Creates the graph structure with nodes (places) and connections between
     them according to the map
@@ -14,31 +22,35 @@ def build_graph(locations, connections):
     ----------
     locations : pandas dataframe with location coordinates
     connections : pandas dataframe with place connections
+    array_graph : bool, return an ArrayGraph instead of a network X graph
 
     Returns
     -------
-    G : network X graph
+    G : network X graph (or ArrayGraph)
 
     '''
     
-    G = nx.Graph() # create empty graph
+    if array_graph:
+        from .T2R_array_graph import ArrayGraph     # imports pandas, only when used
+        G = ArrayGraph.from_frames(locations, connections)
+    else:
+        G = nx.Graph() # create empty graph
 
-    for idx, place in enumerate(locations.place): # add the node locations
-
-        x = locations.coord_x[idx]  # get x coordinate
-        y = locations.coord_y[idx]  # get y coordinate
-        
-        G.add_node(place, pos =(x,y)) # add node with place name and coordinates
+        # add the node locations with place name and coordinates
+        G.add_nodes_from(zip(locations.place.tolist(), ({'pos':pos} for pos in
+                             zip(locations.coord_x.tolist(), locations.coord_y.tolist()))))
         
-     
-    for idx in range(connections.shape[0]): # add the connections
-        
-        G.add_edge(connections.place_1[idx], connections.place_2[idx], weight=connections.length[idx]/10)
-
+        # add the connections
+        G.add_weighted_edges_from(zip(connections.place_1.tolist(), connections.place_2.tolist(),
+                                      (connections.length.to_numpy()/10).tolist()))
     
+    count('nodes', G.number_of_nodes())
+    count('edges', G.number_of_edges())
+
     return G
 
 
+@stage('get_double_routes')
 def get_double_routes(connections):
     '''
     Get list of double routes and their lengths
@@ -54,140 +66,177 @@ def get_double_routes(connections):
 
     '''
     
-    double_routes = []
-    double_routes_len = []
+    double = (connections.double_route == 'Y').to_numpy()    # rows with a double route
     
-    for idx in range(len(connections)):
-        
-        if connections.double_route[idx] == 'Y':
-            double_routes.append([connections.place_1[idx],connections.place_2[idx]])
-            double_routes_len.append(connections.length[idx])
-
+    double_routes = connections.loc[double, ['place_1', 'place_2']].to_numpy().tolist()
+    double_routes_len = connections.length[double].tolist()
 
     return double_routes, double_routes_len
 
 
-def shortest_path_route(graph):
+@stage('shortest_path_route')
+def shortest_path_route(graph, condensed=False):
     '''
     Get the shortest path between all place combinations using 
-    Dijkstra.
+    Dijkstra on a sparse adjacency matrix (see T2R_distances).
     
     Parameters
     ----------
-    graph : network X graph
+    graph : network X graph or ArrayGraph
+    
+    condensed : bool, if True return the condensed upper triangle vector
+                instead of the full array (avoids no.places X no.places array)
 
     Returns
     -------
     dist_upper : numpy array of size no.places X np.places
                  Shortest path distances between all places (upper half only as symmetric)
+                 If condensed, int32 vector of distances for each place pair
+                 (see condensed_pairs for the place ids of each position)
     location_keys : numpy array of all corresponding location keys to shortest path array
 
     '''
     
-    lengths = dict(nx.all_pairs_dijkstra_path_length(graph))    # Calculate all path lengths using network X function
+    location_keys, place_1, place_2, length = graph_edge_arrays(graph)    # sorted place names and integer edges
     
-    location_keys = np.sort(list(lengths.keys()))    # Convert to an array
+    dist_upper = distance_matrix(place_1, place_2, length, len(location_keys), condensed=condensed)
+
+    return dist_upper, location_keys    # return distance table and keys
+
+
+
+@stage('route_difficulty_index')
+def route_difficulty_index(graph, pairs=None, k=3, processes=1, batch_size=256):
+    '''
+    Index of the k shortest simple paths (Yen's algorithm) between place
+    pairs, their lengths and the tracks they all share, to tell tickets
+    with one bottleneck path from tickets with many alternatives. Pairs
+    are split into batches which can run across a process pool.
+    
+    Parameters
+    ----------
+    graph : network X graph or ArrayGraph
     
-    dist_table = np.zeros((len(location_keys),len(location_keys)))     # initialise array for distances
+    pairs : list of place pairs to index (e.g. candidate tickets), None for
+            all pairs with a path between them
     
-    # add data to array
-    for i in range(len(location_keys)):
-        for j in range(len(location_keys)):
-            dist_table[i,j] = round(lengths[location_keys[i]][location_keys[j]]*10)
+    k : int, number of shortest paths for each pair
     
-    dist_table = dist_table.astype(int)     # convert to integers
+    processes : int, number of processes to find paths in
     
-    dist_upper = np.triu(dist_table)     # get top part only
+    batch_size : int, number of pairs in each batch
 
-    return dist_upper, location_keys    # return distance table and keys
+    Returns
+    -------
+    route_index : RouteIndex, with constant time lookup of each place pair
 
+    '''
+    
+    location_keys, place_1, place_2, length = graph_edge_arrays(graph)
+    
+    n_places = len(location_keys)
+    
+    if pairs is None:   # every connected pair
+        positions = np.flatnonzero(distance_matrix(place_1, place_2, length, n_places, condensed=True))
+    else:
+        ids = place_ids(location_keys, np.array([[str(place) for place in pair] for pair in pairs]).reshape(-1, 2))
+        ids = ids.reshape(-1, 2)
+        ids = ids[ids[:, 0] != ids[:, 1]]
+        positions = np.unique(condensed_index(ids.min(axis=1), ids.max(axis=1), n_places))
+    
+    sources, targets = condensed_pairs(positions, n_places)
+    
+    adjacency = edge_adjacency(place_1, place_2, length, n_places)
+    
+    batches = [(sources[start:start+batch_size].tolist(), targets[start:start+batch_size].tolist())
+               for start in range(0, len(positions), batch_size)]
+    
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(index_batch, [adjacency]*len(batches), *zip(*batches), [k]*len(batches)))
+    else:
+        results = [index_batch(adjacency, batch_sources, batch_targets, k) for batch_sources, batch_targets in batches]
+    
+    if len(results) == 0:
+        results = [index_batch(adjacency, [], [], k)]
+    
+    lengths, path_sizes, path_edges = (np.concatenate(arrays) for arrays in zip(*results))
+    
+    count('pairs_indexed', len(positions))
+    
+    return RouteIndex(location_keys, np.column_stack([place_1, place_2]), length, positions,
+                      lengths, path_sizes, path_edges)
 
 
-def create_data_dictionary(graph):
+
+@stage('create_data_dictionary')
+def create_data_dictionary(graph, condensed=False):
     '''
     Create a new data dictionary split by route length
     no duplicates of routes included (reversed duplicates, need to keep double routes)    
 
+    Distances are sorted once, each length is a slice of the sorted place
+    pairs (see LengthBuckets). Place names are only created when a pair is used.
+
     Parameters
     ----------
-    graph : network X graph
+    graph : network X graph or ArrayGraph
+    
+    condensed : bool, if True return the condensed distance vector
+                instead of the full array
 
     Returns
     -------
-    data_dict : dictionary of length keys (number of unique shortest paths). 
-                List for each unique shortest path of all place pairs with that distance
+    data_dict : mapping of length keys (number of unique shortest paths). 
+                Sequence for each unique shortest path of all place pairs with that distance
     
     dist : Array of shortest distances from shortest_path_route
 
     '''
     
-    sh_path = shortest_path_route(graph)     # find shortest paths
-        
-    dist = sh_path[0]   # get array of distances
-    
-    loc_keys = sh_path[1]   # get corresponding place names
-    
-    unique_lengths,length_counts = np.unique(dist,return_counts=True) # get all the unique shortest lengths
+    dist, loc_keys = shortest_path_route(graph, condensed=True)     # find shortest paths (condensed vector)
     
-    unique_lengths = np.nonzero(unique_lengths)[0] # remove zero lengths (distance to selves)
+    data_dict = LengthBuckets(dist, loc_keys)    # bucket all pairs by length in one pass
     
-    length_counts =np.delete(length_counts,0) # remove the first element from length counts (number of zero counts)
-
-    data_dict = {}    # create dict
+    count('place_pairs', len(dist))
     
-    for counts_idx, length in enumerate(unique_lengths):
-        
-      d_locs =  list(zip(*np.where(dist == int(length))))   # find indexes in distance array that equal chosen length
-
-      data_dict[str(length)] = [] # initialise list at dictionary key
-      
-      for j, value in enumerate(d_locs): # cycle through each pair
-      
-          data_dict[str(length)].append([str(loc_keys[value[0]]), str(loc_keys[value[1]])]) # add locations to dictionary
+    if not condensed:
+        dist = condensed_to_upper(dist, len(loc_keys))    # full array of distances (upper half)
 
     return data_dict,dist            
 
 
 
+@stage('get_all_neighbours')
 def get_all_neighbours(graph):
     '''
     Gets list of all nodes which are neighbouring and length of the connection
 
+    The edges are read once into integer arrays (ids of the sorted place
+    names), each pair is put in order with min/max of the ids, so the
+    pairs are sorted by first then second place name.
+
     Parameters
     ----------
-    graph : network x graph
+    graph : network x graph or ArrayGraph
 
     Returns
     -------
-    all_routes : List of all nearest neighbour pairs
+    all_routes : list of all nearest neighbour pairs (names in each pair sorted)
     
-    route_len : Array of route lengths between neighbours
+    route_len : integer array of size no.pairs X 1 of route lengths between neighbours
 
     '''
 
-    all_routes = []     # create list of neighbour pairs
+    location_keys, place_1, place_2, length = graph_edge_arrays(graph)    # integer edges
     
-    nodes = list((graph._node).keys())     # get all individual node names
-
-    for node in nodes: # iterate through each node 'place' name
-        
-        neighbours = list(graph.neighbors(node))         # get all neighbours for each node
-         
-        for neighbour in neighbours:
-            all_routes.append(sorted([node,neighbour])) # sort neighbours and add to list
-
-            
-    all_routes_set = set(tuple(x) for x in all_routes)     # remove duplicate pairs
-
-    all_routes = [list(x) for x in all_routes_set]    # change to list
-   
-    data = graph.adj # extract atlas from graph (neighbours and distances)
+    low, high = np.minimum(place_1, place_2), np.maximum(place_1, place_2)
+    
+    # sort pairs (and remove any repeated pairs)
+    _, first = np.unique(low.astype(np.int64)*len(location_keys) + high, return_index=True)
     
-    route_len = np.zeros((len(all_routes),1)) # initialise array to hold route lengths
+    all_routes = np.column_stack([location_keys[low[first]], location_keys[high[first]]]).tolist()
     
-    # get length of routes for pairs using network x atlas
-    for idx in range(len(all_routes)):
-        route_len[idx] = int(data[all_routes[idx][0]][all_routes[idx][1]]['weight']*10) # add length of connection
+    route_len = length[first].reshape(-1, 1).astype(int)   # lengths as a column
         
     return all_routes, route_len
-   
@@ -0,0 +1,221 @@
+# Ticket to ride cache
+
+# On disk cache of graph, distances and length buckets
+import hashlib
+import os
+import shutil
+import tempfile
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from .T2R_build_network import build_graph, shortest_path_route
+from .T2R_distances import LengthBuckets, condensed_to_upper
+
+CACHE_VERSION = 1   # change when the stored arrays change
+
+
+def frame_hash(*frames):
+    '''
+    Content hash of pandas dataframes (column names, types and values)
+
+    Parameters
+    ----------
+    frames : pandas dataframes
+
+    Returns
+    -------
+    key : string, hex digest
+
+    '''
+
+    digest = hashlib.sha256(str(CACHE_VERSION).encode())
+
+    for frame in frames:
+        digest.update(repr(list(zip(frame.columns, map(str, frame.dtypes)))).encode())   # columns and types
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())  # row values
+
+    return digest.hexdigest()
+
+
+class NetworkCache:
+    '''
+    On disk cache of the outputs of build_graph, shortest_path_route and
+    create_data_dictionary, keyed by a content hash of the locations and
+    connections dataframes.
+
+    Each entry is a folder of .npy files which are memory mapped on load.
+    When the cache is larger than max_size the least recently used entries
+    are removed.
+
+    Parameters
+    ----------
+    cache_dir : string, folder to keep the cache in
+    max_size : int, maximum size of the cache in bytes
+
+    '''
+
+    def __init__(self, cache_dir='t2r_cache', max_size=512*1024**2):
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def network(self, locations, connections, condensed=True):
+        '''
+        Graph, length buckets and distances for the board, loaded from the
+        cache or built and stored if the inputs are not in the cache
+
+        Parameters
+        ----------
+        locations : pandas dataframe with location coordinates
+        connections : pandas dataframe with place connections
+        condensed : bool, return the condensed distance vector (memory
+                    mapped) instead of the full array
+
+        Returns
+        -------
+        graph : network X graph (same as build_graph)
+        data_dict : mapping of length keys (same as create_data_dictionary)
+        dist : distances (same as shortest_path_route)
+        location_keys : numpy array of all sorted place names
+
+        '''
+
+        key = frame_hash(locations, connections)
+
+        entry = self._load(key)
+
+        if entry is None:
+            graph = build_graph(locations, connections)
+
+            dist, location_keys = shortest_path_route(graph, condensed=True)
+
+            data_dict = LengthBuckets(dist, location_keys)
+
+            self._store(key, graph, dist, location_keys, data_dict)
+        else:
+            graph, dist, location_keys, data_dict = entry
+
+        if not condensed:
+            dist = condensed_to_upper(dist, len(location_keys))
+
+        return graph, data_dict, dist, location_keys
+
+    def _store(self, key, graph, dist, location_keys, data_dict):
+        '''
+        Write one entry to a temporary folder, then move it into place
+        '''
+
+        places = list(graph.nodes)
+        pos = nx.get_node_attributes(graph, 'pos')
+        edges = list(graph.edges(data='weight'))
+
+        lengths, positions = data_dict.to_arrays()
+
+        arrays = {'places':np.array(places, dtype=str),
+                  'coords':np.array([pos[place] for place in places]),
+                  'edge_place_1':np.array([edge[0] for edge in edges], dtype=str),
+                  'edge_place_2':np.array([edge[1] for edge in edges], dtype=str),
+                  'edge_weight':np.array([edge[2] for edge in edges], dtype=float),
+                  'dist':dist,
+                  'location_keys':location_keys,
+                  'bucket_lengths':lengths,
+                  'bucket_positions':positions}
+
+        tmp_path = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp_')
+
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, name + '.npy'), array, allow_pickle=False)
+
+        try:
+            os.rename(tmp_path, self._path(key))
+            os.utime(self._path(key))
+        except OSError:   # stored by another process in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        self._evict()
+
+    def _load(self, key):
+        '''
+        Read one entry with memory mapped arrays, None if not cached
+        '''
+
+        path = self._path(key)
+
+        if not os.path.isdir(path):
+            return None
+
+        arrays = {name[:-4]:np.load(os.path.join(path, name), mmap_mode='r', allow_pickle=False)
+                  for name in os.listdir(path)}
+
+        os.utime(path)  # mark as recently used
+
+        graph = nx.Graph()
+        graph.add_nodes_from((place, {'pos':tuple(coords)}) for place, coords in
+                             zip(arrays['places'].tolist(), np.asarray(arrays['coords'])))
+        graph.add_weighted_edges_from(zip(arrays['edge_place_1'].tolist(), arrays['edge_place_2'].tolist(),
+                                          arrays['edge_weight'].tolist()))
+
+        location_keys = np.asarray(arrays['location_keys'])   # place names are needed in memory
+
+        data_dict = LengthBuckets.from_arrays(arrays['bucket_lengths'], arrays['bucket_positions'], location_keys)
+
+        return graph, arrays['dist'], location_keys, data_dict
+
+    def size(self):
+        '''
+        Total size of the cache in bytes
+        '''
+
+        return sum(self._entry_size(key) for key in self.keys())
+
+    def keys(self):
+        '''
+        Keys of all cached entries
+        '''
+
+        return [name for name in os.listdir(self.cache_dir)
+                if not name.startswith('.') and os.path.isdir(self._path(name))]
+
+    def _entry_size(self, key):
+        path = self._path(key)
+
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    def _evict(self):
+        '''
+        Remove least recently used entries until the cache fits in max_size
+        '''
+
+        entries = sorted(self.keys(), key=lambda key: os.path.getmtime(self._path(key)))
+
+        total = sum(self._entry_size(key) for key in entries)
+
+        for key in entries[:-1]:    # always keep the newest entry
+            if total <= self.max_size:
+                break
+
+            total -= self._entry_size(key)
+            shutil.rmtree(self._path(key), ignore_errors=True)
+
+    def invalidate(self, locations=None, connections=None):
+        '''
+        Remove the entry for the given dataframes, or every entry if no
+        dataframes are given (both or neither must be given)
+        '''
+
+        if locations is None and connections is None:
+            keys = self.keys()
+        elif locations is None or connections is None:
+            raise ValueError("give both locations and connections, or neither to clear the cache")
+        else:
+            keys = [frame_hash(locations, connections)]
+
+        for key in keys:
+            shutil.rmtree(self._path(key), ignore_errors=True)
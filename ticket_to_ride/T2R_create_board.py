@@ -5,74 +5,297 @@ import numpy as np
 from collections import Counter
 import pandas as pd
 
-def add_locomotives(board_data,colours):
+from .T2R_random import make_random_state, spawn_random_states, uniform_draws
+from .T2R_profile import stage, count
+
+# number of track spaces for each colour (Ticket to ride Europe)
+EUROPE_TRACK_COLOURS = {'yellow':22,'blue':22,'green':22,'red':22,'purple':22,'black':22,'white':22,'orange':22,
+                        'grey':100}
+
+class BoardData:
+    '''
+    Board tracks stored as arrays: integer place ids and colour codes,
+    boolean tunnel and locomotive masks. Use to_frame for the pandas
+    dataframe (as returned by create_board_colouring).
+
+    Parameters
+    ----------
+    places : numpy array of place names
+    
+    place_1, place_2 : numpy arrays of place ids at each end of each track
+    
+    track_length : numpy array of length of each track
+    
+    colours : list of colour names
+    
+    colour : numpy array of colour index of each track (-1 for no colour)
+    
+    tunnel, locomotive : numpy boolean arrays, track is a tunnel/has a locomotive
+
+    '''
+    
+    def __init__(self, places, place_1, place_2, track_length, colours, colour=None, tunnel=None, locomotive=None):
+        
+        n_tracks = len(place_1)
+        
+        self.places = np.asarray(places)
+        self.place_1 = np.asarray(place_1, dtype=np.int32)
+        self.place_2 = np.asarray(place_2, dtype=np.int32)
+        self.track_length = np.asarray(track_length).astype(np.int16).ravel()
+        self.colours = list(colours)
+        self.colour = np.full(n_tracks, -1, dtype=np.int8) if colour is None else np.asarray(colour, dtype=np.int8)
+        self.tunnel = np.zeros(n_tracks, dtype=bool) if tunnel is None else np.asarray(tunnel, dtype=bool)
+        self.locomotive = np.zeros(n_tracks, dtype=bool) if locomotive is None else np.asarray(locomotive, dtype=bool)
+    
+    @classmethod
+    def from_routes(cls, route_list, route_len, colours):
+        '''
+        Uncoloured board from a list of place pairs and their lengths
+        '''
+        
+        names = np.asarray(route_list, dtype=object).reshape(-1, 2).astype(str)    # list of pairs or array
+        
+        places, ids = np.unique(names, return_inverse=True)     # integer place ids
+        ids = ids.reshape(-1, 2)
+        
+        return cls(places, ids[:, 0], ids[:, 1], route_len, colours)
+    
+    @classmethod
+    def from_frame(cls, board_data, colours=None):
+        '''
+        Board from a board_data dataframe
+        '''
+        
+        if colours is None:
+            colours = list(EUROPE_TRACK_COLOURS.keys())
+        
+        board = cls.from_routes(board_data[['place1', 'place2']].to_numpy(), board_data.trackLength.to_numpy(), colours)
+        
+        board.colour = pd.Categorical(board_data.trackColour, categories=colours).codes.astype(np.int8)  # -1 for 'None'
+        board.tunnel = (board_data.tunnel == 'Y').to_numpy()
+        board.locomotive = (board_data.locomotive == 'Y').to_numpy()
+        
+        return board
+    
+    def __len__(self):
+        return len(self.place_1)
+    
+    def track_colours(self):
+        '''
+        Colour name of each track ('None' if not coloured)
+        '''
+        
+        return np.array(self.colours + ['None'], dtype=object)[self.colour]
+    
+    def colour_counts(self):
+        '''
+        Counter of number of tracks of each colour
+        '''
+        
+        return Counter(self.track_colours().tolist())
+    
+    def to_frame(self):
+        '''
+        Board as a pandas dataframe with columns place1, place2, trackLength,
+        trackColour, tunnel and locomotive ('Y' or 'None')
+        '''
+        
+        flags = np.array(['None', 'Y'], dtype=object)
+        
+        return pd.DataFrame({'place1':self.places[self.place_1].astype(object),
+                             'place2':self.places[self.place_2].astype(object),
+                             'trackLength':self.track_length.astype(float),
+                             'trackColour':self.track_colours(),
+                             'tunnel':flags[self.tunnel.astype(int)],
+                             'locomotive':flags[self.locomotive.astype(int)]})
+
+
+def _as_board(board_data, colours):
+    '''
+    BoardData for a BoardData or dataframe, and whether it was a dataframe
+    '''
+    
+    if isinstance(board_data, BoardData):
+        return board_data, False
+    
+    return BoardData.from_frame(board_data, colours), True
+
+
+@stage('add_locomotives')
+def add_locomotives(board_data,colours,random_state=None):
     '''
     Add locomotives to non-tunnel track
 
     Parameters
     ----------
-    board_data : pandas dataframe with board data
+    board_data : BoardData or pandas dataframe with board data
+    
+    colours : List of colours
+    
+    random_state : numpy RandomState or Generator to draw from, or seed (see make_random_state)
 
     Returns
     -------
-    board_data : pandas dataframe with 'Y' added to column locomotive if track have a locomotive
+    board_data : board with locomotive set for tracks that have a locomotive
+                 ('Y' added to column locomotive for a dataframe)
 
     '''
     # add two locomotives for each
     
-    # for each colour select randomly select route with 2 or 3 length
+    random_state = make_random_state(random_state)
+    
+    board, is_frame = _as_board(board_data, colours)
+    
+    # for each colour randomly select 2 non-tunnel routes
     for i in range(len(colours)):
         
-        # get index of all routes with those colours
-        all_indexes = board_data[board_data.trackColour == colours[i]]
-
-        # get routes between 2 and 3 
-        all_indexes = all_indexes[all_indexes.tunnel == 'None'].index
+        # get index of all non-tunnel routes with those colours
+        all_indexes = np.flatnonzero((board.colour == i) & ~board.tunnel)
 
-        # randomly select from indexes
-        idx_choice = np.random.choice(all_indexes,2)
-        
-        # add 'Y' to the data dict
-        board_data.at[idx_choice, 'locomotive'] = 'Y'
+        # randomly select 2 different routes from indexes
+        board.locomotive[random_state.choice(all_indexes,min(2,len(all_indexes)),replace=False)] = True
+    
+    if is_frame:
+        board_data.loc[board_data.index[board.locomotive], 'locomotive'] = 'Y' # add 'Y' to the data dict
+        return board_data
     
-    return board_data
+    return board
     
     
-def add_tunnels(board_data, colours):
+@stage('add_tunnels')
+def add_tunnels(board_data, colours, random_state=None):
     '''
     Adding tunnels- each colour has 1 tunnels totaling 2 or 3 spaces
 
     Parameters
     ----------
-    board_data : pandas dataframe with board data
+    board_data : BoardData or pandas dataframe with board data
         
     colours : List of colours
+    
+    random_state : numpy RandomState or Generator to draw from, or seed (see make_random_state)
         
     Returns
     -------
-    board_data : pandas dataframe with 'Y' added to column tunnel if track should be tunnel
+    board_data : board with tunnel set for tracks that should be tunnels
+                 ('Y' added to column tunnel for a dataframe)
 
     '''
     
+    random_state = make_random_state(random_state)
+    
+    board, is_frame = _as_board(board_data, colours)
+    
+    short = (board.track_length >= 2) & (board.track_length <= 3)  # routes between 2 and 3 
+    
     # for each colour select randomly select route with 2 or 3 length
     for i in range(len(colours)):
         
         # get index of all routes with those colours
-        all_indexes = board_data[board_data.trackColour == colours[i]]
-        
-        # get routes between 2 and 3 
-        all_indexes = all_indexes[all_indexes['trackLength'].between(2, 3)].index
+        all_indexes = np.flatnonzero((board.colour == i) & short)
 
         # randomly select from indexes
-        idx_choice = np.random.choice(all_indexes)
+        board.tunnel[random_state.choice(all_indexes)] = True
+    
+    if is_frame:
+        board_data.loc[board_data.index[board.tunnel], 'tunnel'] = 'Y'   # add 'Y' to the data dict
+        return board_data
+    
+    return board
+    
+
+def sample_track_colours_batch(route_len, colour_budget, uniforms):
+    '''
+    Select a colour for each track of many boards at once, with
+    probability proportional to the track spaces left for each colour
+    (colours with no spaces left are not chosen). Boards are vectorised,
+    routes are done in order as each choice changes the budgets. 
+    Selections are the same as np.random.choice given the same uniforms.
+
+    Parameters
+    ----------
+    route_len : length of each route
+    
+    colour_budget : list of starting number of track spaces for each colour
+    
+    uniforms : numpy array of size no.boards X no.routes of uniform [0, 1) draws
+
+    Returns
+    -------
+    colour_idx : numpy array of size no.boards X no.routes, index of the 
+                 selected colour for each route (-1 for boards that ran
+                 out of colours)
+
+    '''
+    
+    route_len = np.asarray(route_len).astype(int).ravel()    # whole track spaces
+    
+    n_boards = uniforms.shape[0]
+    
+    budget = np.tile(np.array(colour_budget, dtype=np.float32), (n_boards, 1))   # spaces left for each colour
+    
+    colour_idx = np.zeros((n_boards, len(route_len)), dtype=int)
+    
+    prob = np.zeros(budget.shape, dtype=np.float32)
+    cdf = np.zeros(budget.shape)
+    boards = np.arange(n_boards)
+    valid = np.ones(n_boards, dtype=bool)
+    
+    for idx in range(len(route_len)):
+        
+        np.maximum(budget, 0, out=prob)     # no probability for used up colours
+        
+        total = prob.sum(axis=1, keepdims=True)
+        
+        valid &= total[:, 0] > 0    # boards with no colours left
+        
+        np.divide(prob, total, out=prob, where=total > 0)
+        
+        np.cumsum(prob, axis=1, dtype=float, out=cdf)    # cumulative probabilities (as np.random.choice)
+        cdf /= np.where(cdf[:, -1:] > 0, cdf[:, -1:], 1)
+        
+        choice = np.minimum((cdf <= uniforms[:, idx, None]).sum(axis=1), budget.shape[1]-1)   # searchsorted side='right'
         
-        # add 'Y' to the data dict
-        board_data.at[idx_choice, 'tunnel'] = 'Y'
+        colour_idx[:, idx] = choice
+        
+        budget[boards, choice] -= route_len[idx]    # update numbers of colours
     
-    return board_data
+    colour_idx[~valid] = -1
     
+    return colour_idx
+
 
-def create_board_colouring(route_list ,route_len, double_routes_list, double_routes_len, seed):
+def sample_track_colours(route_len, colour_budget, random_state):
+    '''
+    Select a colour for each track of one board (see sample_track_colours_batch)
+    All random numbers are drawn in one call.
+
+    Parameters
+    ----------
+    route_len : length of each route
+    
+    colour_budget : list of starting number of track spaces for each colour
+    
+    random_state : numpy RandomState or Generator to draw from
+
+    Returns
+    -------
+    colour_idx : numpy array of index of the selected colour for each route
+
+    '''
+    
+    uniforms = uniform_draws(random_state, len(route_len))  # one draw for each route
+    
+    colour_idx = sample_track_colours_batch(route_len, colour_budget, uniforms[None, :])[0]
+    
+    if len(colour_idx) and colour_idx[0] < 0:
+        raise ValueError("No track colours left for all routes, increase the colour budget")
+    
+    return colour_idx
+
+
+@stage('create_board_colouring')
+def create_board_colouring(route_list ,route_len, double_routes_list, double_routes_len, seed, as_frame=True):
     '''
     Create the colouring for the board based on europe game counts. 
     Adds suggested locomotive and tunnel placement.
@@ -91,7 +314,7 @@ def create_board_colouring(route_list ,route_len, double_routes_list, double_rou
     
     Parameters
     ----------
-    route_list : list of neighbouring routes
+    route_list : list (or array) of neighbouring routes
     
     route_len : length of each neighbouring route
     
@@ -99,73 +322,106 @@ def create_board_colouring(route_list ,route_len, double_routes_list, double_rou
     
     double_routes_len : length of each neighbouring duplicate route
         
-    seed : int, random seed setting
+    seed : int, random seed setting, or numpy RandomState, Generator or SeedSequence.
+           An int seed (or RandomState) is one stream for the whole board, 
+           same boards as np.random.seed(seed) gave. A SeedSequence or 
+           Generator spawns separate streams for colours, tunnels and locomotives.
+    
+    as_frame : bool, return a pandas dataframe, otherwise BoardData arrays
 
     Returns
     -------
-    board_data : pandas dataframe with information about board 
+    board_data : pandas dataframe (or BoardData) with information about board 
                  colouring, tunnel and locomotive placement.
+    
+    colour_counts : Counter of number of tracks of each colour
     '''
     
-    # add seed
-    np.random.seed(seed)
+    colour_state, tunnel_state, locomotive_state = spawn_random_states(seed, 3)   # streams for each part of the board
     
-    # append the extra route
-    route_list = route_list + double_routes_list
+    # append the extra route (lists of pairs or arrays)
+    route_list = np.concatenate([np.asarray(route_list, dtype=object).reshape(-1, 2),
+                                 np.asarray(double_routes_list, dtype=object).reshape(-1, 2)])
    
     route_len = np.append(route_len,double_routes_len) # append double routes to route list
         
     # create initial number of track colours dict
-    track_colour_dict ={'yellow':22,'blue':22,'green':22,'red':22,'purple':22,'black':22,'white':22,'orange':22,
-           'grey':100}
+    track_colour_dict = dict(EUROPE_TRACK_COLOURS)
     
     colours = list(track_colour_dict.keys()) # get list of colours from dictionary
     
-    # convert to probabilities
-    prob = np.array([*track_colour_dict.values()], dtype=np.float32)
-
-    prob = prob/np.sum(prob)
+    # create board arrays
+    board = BoardData.from_routes(route_list, route_len, colours)
+    
+    # create color for each track section between two nodes
+    board.colour = sample_track_colours(route_len, [*track_colour_dict.values()], colour_state).astype(np.int8)
+    
+    count('tracks', len(board))
+    
+    # add random tunnels to board
+    board = add_tunnels(board, colours, tunnel_state)
     
-    select_array = np.linspace(0,len(prob)-1,len(prob))
+    # add random locomotives
+    board = add_locomotives(board, colours, locomotive_state)
+    
+    # count number of each board colour
+    colour_counts = board.colour_counts()
+    
+    if as_frame:
+        return board.to_frame(), colour_counts
+
+    return board, colour_counts
 
-    # create dataframe
-    board_data = pd.DataFrame(route_list, columns= ['place1', 'place2'])
-    board_data['trackLength'] = route_len
-    board_data['trackColour'] = ['None'] * len(route_list)
-    board_data['tunnel'] = ['None'] * len(route_list)
-    board_data['locomotive'] = ['None'] * len(route_list)
+
+def write_boards(path, graph, boards, decks=(), colours=None):
+    '''
+    Save boards of one map (and optionally its ticket decks) as a binary
+    board archive (see T2R_archive.write_archive), e.g. many colourings
+    from create_board_colouring or generate_board_colourings
+
+    Parameters
+    ----------
+    path : string, archive file to save
     
+    graph : network x graph (or ArrayGraph) of the map
     
-    # create color for each track section between two nodes
-    for idx, route_length in enumerate(route_len):
+    boards : iterable of board dataframes (or BoardData) with the same tracks
+    
+    decks : list of (route, points) for each ticket deck, as get_routes
+    
+    colours : list of colour names of dataframe boards (default Europe colours)
 
-        idx_choice = np.random.choice(select_array, 1, p=prob) # select color based on probabilities
-        
-        # index of selected colour
-        colour_sel = colours[int(idx_choice)] # get the random colour index
-        
-        # update numbers of colours list
-        track_colour_dict[colour_sel] -= int(route_length)
-        
-        # update probabilities
-        prob = np.array([*track_colour_dict.values()], dtype=np.float32)
-        
-        for p, item in enumerate(prob): # check that no item is less than 0
-            if item < 0:
-                prob[p] = 0 # set probability to zero if less than zero
-        
-        prob = prob/np.sum(prob)
+    Returns
+    -------
+    n_boards : int, number of boards saved
 
-        # add colour to list
-        board_data.at[idx, 'trackColour'] = colour_sel
+    '''
     
-    # add random tunnels to board
-    board_data = add_tunnels(board_data, colours)
+    from .T2R_archive import write_archive
     
-    # add random locomotives
-    board_data = add_locomotives(board_data, colours)
+    return write_archive(path, graph, boards, decks, colours)
+
+
+def read_board(path, index=0, as_frame=True):
+    '''
+    Read one board of a board archive, only that board's tracks are read
+    from the memory mapped file
+
+    Parameters
+    ----------
+    path : string, archive file (from write_boards)
     
-    # count number of each board colour
-    colour_counts = Counter(board_data.trackColour)
+    index : int, position of the board in the archive
+    
+    as_frame : bool, return a pandas dataframe (as create_board_colouring), otherwise BoardData arrays
 
-    return board_data, colour_counts
+    Returns
+    -------
+    board_data : pandas dataframe (or BoardData) of the board
+
+    '''
+    
+    from .T2R_archive import BoardArchive
+    
+    with BoardArchive(path) as archive:
+        return archive.board(index, as_frame)
@@ -0,0 +1,547 @@
+# Ticket to ride distances
+
+# Array based all pairs shortest path engine
+import math
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+
+def _sparse_dijkstra():
+    '''
+    scipy coo_matrix and dijkstra functions, (None, None) without scipy
+    (imported when first used, scipy is slow to import)
+    '''
+
+    try:
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import dijkstra
+    except ImportError: # scipy is optional, numpy Floyd-Warshall used instead
+        return None, None
+
+    return coo_matrix, dijkstra
+
+
+def place_ids(location_keys, places):
+    '''
+    Convert place names to integer ids (positions in the sorted location keys)
+
+    Parameters
+    ----------
+    location_keys : sorted numpy array of all place names
+
+    places : array or list of place names
+
+    Returns
+    -------
+    ids : numpy array of integer ids for each place
+
+    '''
+
+    places = np.asarray(places).astype(str)
+
+    ids = np.searchsorted(location_keys, places)   # find position of each place in sorted keys
+
+    ids = np.minimum(ids, len(location_keys)-1)
+
+    missing = location_keys[ids] != places     # names not found in the keys
+
+    if np.any(missing):
+        raise ValueError("Unknown places in connections: %s" % sorted(set(places[missing])))
+
+    return ids
+
+
+def graph_edge_arrays(graph):
+    '''
+    Extract the edges of the graph as integer arrays
+
+    Parameters
+    ----------
+    graph : network X graph or ArrayGraph
+
+    Returns
+    -------
+    location_keys : numpy array of all sorted place names
+    place_1 : numpy array of integer ids for first place of each edge
+    place_2 : numpy array of integer ids for second place of each edge
+    length : numpy array of integer track length of each edge
+
+    '''
+
+    if hasattr(graph, 'sorted_edge_arrays'):    # ArrayGraph
+        return graph.sorted_edge_arrays()
+
+    location_keys = np.sort(list(graph.nodes))    # sorted place names, ids are positions
+
+    edges = list(graph.edges(data='weight'))
+
+    if len(edges) == 0:
+        empty = np.zeros(0, dtype=int)
+        return location_keys, empty, empty, empty
+
+    place_1, place_2, weight = zip(*edges)
+
+    length = np.rint(np.array(weight, dtype=float)*10).astype(int)   # weights are stored as length/10
+
+    return location_keys, place_ids(location_keys, place_1), place_ids(location_keys, place_2), length
+
+
+def connection_edge_arrays(locations, connections):
+    '''
+    Extract the edges straight from the connections dataframe as integer
+    arrays, without building a network X graph
+
+    Parameters
+    ----------
+    locations : pandas dataframe with location coordinates
+    connections : pandas dataframe with place connections
+
+    Returns
+    -------
+    location_keys : numpy array of all sorted place names
+    place_1 : numpy array of integer ids for first place of each edge
+    place_2 : numpy array of integer ids for second place of each edge
+    length : numpy array of integer track length of each edge
+
+    '''
+
+    location_keys = np.unique(locations.place.to_numpy().astype(str))  # sorted place names
+
+    place_1 = place_ids(location_keys, connections.place_1.to_numpy())
+    place_2 = place_ids(location_keys, connections.place_2.to_numpy())
+
+    length = connections.length.to_numpy().astype(int)
+
+    return location_keys, place_1, place_2, length
+
+
+def adjacency_matrix(place_1, place_2, length, n_places):
+    '''
+    Sparse adjacency matrix of track lengths. Each connection is stored
+    once (smaller id first), repeated connections keep the shortest length
+
+    Parameters
+    ----------
+    place_1 : numpy array of integer ids for first place of each edge
+    place_2 : numpy array of integer ids for second place of each edge
+    length : numpy array of integer track length of each edge
+    n_places : int, number of places
+
+    Returns
+    -------
+    adjacency : scipy sparse csr matrix of size no.places X no.places
+
+    '''
+
+    coo_matrix, _ = _sparse_dijkstra()
+
+    if coo_matrix is None:
+        raise ImportError("scipy is required for the sparse adjacency matrix")
+
+    low = np.minimum(place_1, place_2)    # store each connection in the upper half
+    high = np.maximum(place_1, place_2)
+
+    # sort by pair then length, keep the first (shortest) of each pair
+    order = np.lexsort((length, high, low))
+    low, high, length = low[order], high[order], length[order]
+
+    first = np.ones(len(low), dtype=bool)
+    first[1:] = (low[1:] != low[:-1]) | (high[1:] != high[:-1])
+
+    adjacency = coo_matrix((length[first].astype(float), (low[first], high[first])),
+                           shape=(n_places, n_places))
+
+    return adjacency.tocsr()
+
+
+def condensed_size(n_places):
+    '''
+    Number of place pairs (upper triangle, no diagonal) for no.places
+    '''
+
+    return n_places*(n_places-1)//2
+
+
+def condensed_index(row, col, n_places):
+    '''
+    Position of place pairs (row < col) in the condensed upper triangle vector
+
+    Parameters
+    ----------
+    row : int or numpy array, id of first place
+    col : int or numpy array, id of second place (larger than row)
+    n_places : int, number of places
+
+    Returns
+    -------
+    index : int or numpy array of positions in the condensed vector
+
+    '''
+
+    row = np.asarray(row, dtype=np.int64)
+    col = np.asarray(col, dtype=np.int64)
+
+    return row*n_places - row*(row+1)//2 + (col - row - 1)
+
+
+def _row_start(row, n_places):
+    '''
+    Position of the first pair of a row in the condensed vector
+    (row = no.places gives the vector length)
+    '''
+
+    return condensed_index(row, row+1, n_places)
+
+
+def condensed_pairs(index, n_places):
+    '''
+    Place ids for positions in the condensed upper triangle vector
+    (inverse of condensed_index)
+
+    Parameters
+    ----------
+    index : numpy array of positions in the condensed vector
+    n_places : int, number of places
+
+    Returns
+    -------
+    row : numpy array of ids for first place
+    col : numpy array of ids for second place
+
+    '''
+
+    index = np.asarray(index, dtype=np.int64)
+
+    # solve row from the quadratic for the start of each row, then fix rounding
+    b = 2*n_places - 1
+    row = np.floor((b - np.sqrt(b*b - 8.0*index))/2).astype(np.int64)
+    row = np.clip(row, 0, max(n_places-2, 0))
+
+    row = np.where(_row_start(row, n_places) > index, row-1, row)   # start of row is after index
+
+    row = np.where(_row_start(row+1, n_places) <= index, row+1, row)  # index belongs to next row
+
+    col = index - _row_start(row, n_places) + row + 1
+
+    return row, col
+
+
+def condensed_pair(index, n_places):
+    '''
+    Place ids for one position in the condensed vector, as condensed_pairs
+    but in integer maths without numpy (for single lookups)
+    '''
+
+    b = 2*n_places - 1
+    row = max((b - math.isqrt(b*b - 8*index))//2, 0)
+
+    while row > 0 and row*n_places - row*(row+1)//2 > index:   # start of row is after index
+        row -= 1
+    while (row+1)*n_places - (row+1)*(row+2)//2 <= index:   # index belongs to next row
+        row += 1
+
+    return row, index - (row*n_places - row*(row+1)//2) + row + 1
+
+
+def _floyd_warshall(adjacency_dense):
+    '''
+    All pairs shortest paths on a dense array (used when scipy is missing)
+    '''
+
+    dist = adjacency_dense
+
+    for k in range(dist.shape[0]):
+        np.minimum(dist, dist[:, k, None] + dist[None, k, :], out=dist)
+
+    return dist
+
+
+def _dense_distances(place_1, place_2, length, n_places):
+    '''
+    Float distances between all places with Floyd-Warshall (inf when no path)
+    '''
+
+    dist = np.full((n_places, n_places), np.inf)
+    np.fill_diagonal(dist, 0)
+
+    lengths = np.asarray(length, dtype=float)
+    np.minimum.at(dist, (place_1, place_2), lengths)   # keep shortest of repeated connections
+    np.minimum.at(dist, (place_2, place_1), lengths)
+
+    return _floyd_warshall(dist)
+
+
+def _distance_blocks(place_1, place_2, length, n_places, block_size):
+    '''
+    Yield (start, end, distances) for blocks of source places, distances
+    is a float array of size block X no.places
+    '''
+
+    _, dijkstra = _sparse_dijkstra()
+
+    if dijkstra is None:
+        yield 0, n_places, _dense_distances(place_1, place_2, length, n_places)
+        return
+
+    adjacency = adjacency_matrix(place_1, place_2, length, n_places)
+
+    for start in range(0, n_places, block_size):
+        end = min(start + block_size, n_places)
+
+        yield start, end, dijkstra(adjacency, directed=False, indices=np.arange(start, end))
+
+
+def source_distances(place_1, place_2, length, n_places, sources):
+    '''
+    Shortest path distances from some source places to all places
+
+    Parameters
+    ----------
+    place_1 : numpy array of integer ids for first place of each edge
+    place_2 : numpy array of integer ids for second place of each edge
+    length : numpy array of integer track length of each edge
+    n_places : int, number of places
+    sources : numpy array of ids of source places
+
+    Returns
+    -------
+    dist : float numpy array of size no.sources X no.places (inf when no path)
+
+    '''
+
+    _, dijkstra = _sparse_dijkstra()
+
+    if dijkstra is None:
+        return _dense_distances(place_1, place_2, length, n_places)[sources]
+
+    adjacency = adjacency_matrix(place_1, place_2, length, n_places)
+
+    return dijkstra(adjacency, directed=False, indices=sources).reshape(len(sources), n_places)
+
+
+def distance_matrix(place_1, place_2, length, n_places, condensed=False, block_size=256):
+    '''
+    Integer shortest path distances between all places. Uses repeated
+    Dijkstra on a sparse adjacency matrix (scipy), computed in blocks of
+    source places so only block_size rows are held as floats at once.
+
+    Places with no path between them get distance 0 (same as a place to itself)
+
+    Parameters
+    ----------
+    place_1 : numpy array of integer ids for first place of each edge
+    place_2 : numpy array of integer ids for second place of each edge
+    length : numpy array of integer track length of each edge
+    n_places : int, number of places
+    condensed : bool, return condensed upper triangle vector instead of full array
+    block_size : int, number of source places computed at once
+
+    Returns
+    -------
+    dist : numpy array of size no.places X no.places (upper half only),
+           or if condensed int32 vector of size no.places*(no.places-1)/2
+           ordered as condensed_index
+
+    '''
+
+    if condensed:
+        dist = np.zeros(condensed_size(n_places), dtype=np.int32)
+    else:
+        dist = np.zeros((n_places, n_places), dtype=int)
+
+    for start, end, block in _distance_blocks(place_1, place_2, length, n_places, block_size):
+
+        block[~np.isfinite(block)] = 0    # no path between places
+
+        block = np.rint(block)
+
+        if condensed:
+            # upper triangle of the block rows is one contiguous run of the vector
+            upper = np.arange(n_places)[None, :] > np.arange(start, end)[:, None]
+
+            dist[_row_start(start, n_places):_row_start(end, n_places)] = block[upper]
+        else:
+            dist[start:end] = np.triu(block, k=start)
+
+    return dist
+
+
+def condensed_to_upper(dist, n_places):
+    '''
+    Expand a condensed distance vector to the upper half array
+
+    Parameters
+    ----------
+    dist : numpy array, condensed distance vector
+    n_places : int, number of places
+
+    Returns
+    -------
+    dist_upper : numpy array of size no.places X no.places (upper half only)
+
+    '''
+
+    dist_upper = np.zeros((n_places, n_places), dtype=int)
+
+    for row in range(n_places-1):  # copy one row of the upper triangle at a time
+        dist_upper[row, row+1:] = dist[_row_start(row, n_places):_row_start(row+1, n_places)]
+
+    return dist_upper
+
+
+class LengthBucket(Sequence):
+    '''
+    All place pairs with one shortest path length. Holds a view into the
+    sorted positions of the condensed distance vector, place names are only
+    created when a pair is accessed.
+    '''
+
+    def __init__(self, positions, location_keys):
+        self.positions = positions  # positions in the condensed vector (view, no copy)
+        self.location_keys = location_keys
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return LengthBucket(self.positions[idx], self.location_keys)
+
+        row, col = condensed_pairs(self.positions[idx], len(self.location_keys))
+
+        return [str(self.location_keys[row]), str(self.location_keys[col])]
+
+    def __repr__(self):
+        return 'LengthBucket(%d pairs)' % len(self)
+
+    def pair_id(self, idx):
+        '''
+        Integer place ids of one pair in the bucket (no place names made)
+        '''
+
+        return condensed_pair(int(self.positions[idx]), len(self.location_keys))
+
+    def pair_ids(self):
+        '''
+        Integer place ids of all pairs in the bucket
+
+        Returns
+        -------
+        row : numpy array of ids for first place
+        col : numpy array of ids for second place
+
+        '''
+
+        return condensed_pairs(self.positions, len(self.location_keys))
+
+
+class LengthBuckets(Mapping):
+    '''
+    Place pairs split by shortest path length, keyed by the length as a
+    string (same keys as the ticket counts dicts). Built with one sort of
+    the condensed distance vector, each bucket is a slice of the sorted
+    positions.
+
+    Parameters
+    ----------
+    dist : numpy array, condensed distance vector
+    location_keys : numpy array of all sorted place names
+
+    '''
+
+    def __init__(self, dist, location_keys):
+
+        self.location_keys = location_keys
+
+        order = np.argsort(dist, kind='stable')   # stable keeps pairs in row order within a length
+
+        lengths, starts, counts = np.unique(dist[order], return_index=True, return_counts=True)
+
+        # one view of the sorted positions per length, zero lengths removed (no path between places)
+        self._buckets = {str(length): order[start:start+count] for length, start, count in
+                         zip(lengths, starts, counts) if length > 0}
+
+    @classmethod
+    def from_arrays(cls, lengths, positions, location_keys):
+        '''
+        Rebuild the buckets from to_arrays output (e.g. memory mapped
+        arrays), each bucket is a view of positions
+
+        Parameters
+        ----------
+        lengths : numpy array of bucket lengths, one per sorted position
+        positions : numpy array of positions in the condensed vector, sorted by length
+        location_keys : numpy array of all sorted place names
+
+        '''
+
+        buckets = cls.__new__(cls)
+        buckets.location_keys = location_keys
+
+        keys, starts, counts = np.unique(lengths, return_index=True, return_counts=True)
+
+        buckets._buckets = {str(length): positions[start:start+count] for length, start, count in zip(keys, starts, counts)}
+
+        return buckets
+
+    def to_arrays(self):
+        '''
+        All buckets as two flat arrays
+
+        Returns
+        -------
+        lengths : numpy array of bucket lengths, one per sorted position
+        positions : numpy array of positions in the condensed vector, sorted by length
+
+        '''
+
+        if len(self._buckets) == 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+
+        lengths = np.repeat([int(key) for key in self._buckets], [len(positions) for positions in self._buckets.values()])
+
+        return lengths.astype(np.int32), np.concatenate(list(self._buckets.values()))
+
+    def __getitem__(self, length):
+        return LengthBucket(self._buckets[str(length)], self.location_keys)
+
+    def __iter__(self):
+        return iter(self._buckets)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def __repr__(self):
+        return 'LengthBuckets(%s)' % ', '.join('%s: %d' % (key, len(positions)) for key, positions in self._buckets.items())
+
+    def update(self, positions, old_lengths, new_lengths):
+        '''
+        Move place pairs whose distance changed to their new length bucket.
+        Only the buckets of the old and new lengths are changed.
+
+        Parameters
+        ----------
+        positions : numpy array of changed positions in the condensed vector
+        old_lengths : numpy array of distances before the change
+        new_lengths : numpy array of distances after the change
+
+        '''
+
+        for length in np.unique(old_lengths[old_lengths > 0]):  # remove from old buckets
+            key = str(length)
+
+            remaining = np.setdiff1d(self._buckets[key], positions[old_lengths == length], assume_unique=True)
+
+            if len(remaining):
+                self._buckets[key] = remaining
+            else:
+                del self._buckets[key]
+
+        for length in np.unique(new_lengths[new_lengths > 0]):  # add to new buckets (kept in pair order)
+            key = str(length)
+
+            self._buckets[key] = np.union1d(self._buckets.get(key, np.zeros(0, dtype=np.int64)),
+                                            positions[new_lengths == length])
+
+        self._buckets = dict(sorted(self._buckets.items(), key=lambda item: int(item[0])))    # keys in length order
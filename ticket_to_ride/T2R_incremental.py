@@ -0,0 +1,270 @@
+# Ticket to ride incremental graph
+
+# Connections can be edited without recomputing all distances
+import numpy as np
+
+from .T2R_build_network import build_graph, get_all_neighbours
+from .T2R_distances import (graph_edge_arrays, place_ids, source_distances, condensed_index,
+                            condensed_pairs, LengthBuckets)
+
+
+class IncrementalGraph:
+    '''
+    Graph of the board with all pairs shortest path distances and the
+    length buckets of create_data_dictionary, kept up to date as
+    connections are added, removed or change length.
+
+    Only the rows of the distance array that can change are updated:
+    - shorter or new connection (u, v, w): rows i with D[i,u] + w < D[i,v]
+      (or the reverse) are relaxed through the new connection
+    - longer or removed connection: rows i where the old connection was
+      the only shortest way into its far end (D[i,u] + w_old == D[i,v] and
+      no other neighbour x of v with D[i,x] + w(x,v) == D[i,v]) are
+      recomputed with Dijkstra
+
+    Parameters
+    ----------
+    locations : pandas dataframe with location coordinates
+    connections : pandas dataframe with place connections
+
+    '''
+
+    def __init__(self, locations, connections):
+
+        self.graph = build_graph(locations, connections)
+
+        self.location_keys, place_1, place_2, length = graph_edge_arrays(self.graph)
+
+        self.n_places = len(self.location_keys)
+
+        self._lengths = {}  # integer length of each connection, keyed by sorted id pair
+        self._neighbours = [{} for _ in range(self.n_places)]    # lengths to neighbours of each place
+        for i, j, w in zip(place_1, place_2, length):
+            self._lengths[(min(i, j), max(i, j))] = w
+            self._neighbours[i][j] = w
+            self._neighbours[j][i] = w
+
+        # full symmetric distances (inf when no path) for row updates
+        self._dist = source_distances(place_1, place_2, length, self.n_places, np.arange(self.n_places))
+
+        self._condensed = self._to_condensed(self._dist[np.triu_indices(self.n_places, k=1)])
+
+        self.data_dict = LengthBuckets(self._condensed, self.location_keys)
+
+    @staticmethod
+    def _to_condensed(dist):
+        '''
+        Integer distances with 0 for no path, same as distance_matrix
+        '''
+
+        dist = np.where(np.isfinite(dist), dist, 0)
+
+        return np.rint(dist).astype(np.int32)
+
+    def _edge(self, place_1, place_2):
+        '''
+        Sorted integer ids of a connection
+        '''
+
+        i, j = place_ids(self.location_keys, [place_1, place_2])
+
+        if i == j:
+            raise ValueError("Connection must be between two different places: %s" % place_1)
+
+        return min(i, j), max(i, j)
+
+    def _set_length(self, i, j, length):
+        '''
+        Store the length of connection (i, j), None removes it
+        '''
+
+        if length is None:
+            del self._lengths[(i, j)]
+            del self._neighbours[i][j]
+            del self._neighbours[j][i]
+        else:
+            self._lengths[(i, j)] = length
+            self._neighbours[i][j] = length
+            self._neighbours[j][i] = length
+
+    def _edge_arrays(self):
+        '''
+        Integer edge arrays of the current connections
+        '''
+
+        if len(self._lengths) == 0:
+            empty = np.zeros(0, dtype=int)
+            return empty, empty, empty
+
+        pairs = np.array(list(self._lengths.keys()))
+
+        return pairs[:, 0], pairs[:, 1], np.array(list(self._lengths.values()))
+
+    def _shorter(self, i, j, length):
+        '''
+        Relax rows that get a shorter path through the connection (i, j)
+        '''
+
+        via_i = self._dist[:, i] + length   # distance to j going through i first
+        via_j = self._dist[:, j] + length
+
+        rows = np.flatnonzero((via_i < self._dist[:, j]) | (via_j < self._dist[:, i]))
+
+        old = self._dist[rows]
+
+        new = np.minimum(old, via_i[rows, None] + self._dist[None, j, :])
+        np.minimum(new, via_j[rows, None] + self._dist[None, i, :], out=new)
+
+        return rows, old, new
+
+    def _tight(self, near, far, length):
+        '''
+        Rows where the connection near -> far is the only shortest way into far
+        '''
+
+        tight = np.isfinite(self._dist[:, far]) & (self._dist[:, near] + length == self._dist[:, far])
+
+        # best distance into far through any other neighbour
+        alternative = np.full(self.n_places, np.inf)
+        for neighbour, neighbour_length in self._neighbours[far].items():
+            if neighbour != near:
+                np.minimum(alternative, self._dist[:, neighbour] + neighbour_length, out=alternative)
+
+        return tight & (alternative > self._dist[:, far])
+
+    def _longer_rows(self, i, j, old_length):
+        '''
+        Rows where the connection (i, j) is needed for a shortest path
+        '''
+
+        return np.flatnonzero(self._tight(i, j, old_length) | self._tight(j, i, old_length))
+
+    def _recompute(self, rows):
+        '''
+        Dijkstra from the rows on the current connections
+        '''
+
+        old = self._dist[rows]
+
+        new = source_distances(*self._edge_arrays(), self.n_places, rows)
+
+        return rows, old, new
+
+    def _apply(self, rows, old, new):
+        '''
+        Write changed rows (and the matching columns), then patch the
+        condensed distances and the length buckets
+
+        Returns
+        -------
+        changed : int, number of place pairs with a new distance
+
+        '''
+
+        self._dist[rows] = new
+        self._dist[:, rows] = new.T  # distances are symmetric
+
+        row_idx, col = np.nonzero(old != new)
+
+        if len(row_idx) == 0:
+            return 0
+
+        row = rows[row_idx]
+
+        low, high = np.minimum(row, col), np.maximum(row, col)
+
+        positions = np.unique(condensed_index(low, high, self.n_places))
+
+        old_lengths = self._condensed[positions]
+
+        self._condensed[positions] = self._to_condensed(self._dist[condensed_pairs(positions, self.n_places)])
+
+        self.data_dict.update(positions, old_lengths, self._condensed[positions])
+
+        return len(positions)
+
+    def set_connection(self, place_1, place_2, length):
+        '''
+        Add a new connection, or change the length of an existing connection
+
+        Parameters
+        ----------
+        place_1 : string, first place name
+        place_2 : string, second place name
+        length : int, track length of the connection
+
+        Returns
+        -------
+        changed : int, number of place pairs with a new shortest path distance
+
+        '''
+
+        i, j = self._edge(place_1, place_2)
+
+        old_length = self._lengths.get((i, j))
+
+        length = int(length)
+
+        self.graph.add_edge(place_1, place_2, weight=length/10)
+
+        if old_length is None or length < old_length:
+            self._set_length(i, j, length)
+            return self._apply(*self._shorter(i, j, length))
+
+        if length > old_length:
+            rows = self._longer_rows(i, j, old_length)   # found before the length changes
+            self._set_length(i, j, length)
+            return self._apply(*self._recompute(rows))
+
+        return 0
+
+    def remove_connection(self, place_1, place_2):
+        '''
+        Remove a connection between two places
+
+        Parameters
+        ----------
+        place_1 : string, first place name
+        place_2 : string, second place name
+
+        Returns
+        -------
+        changed : int, number of place pairs with a new shortest path distance
+
+        '''
+
+        i, j = self._edge(place_1, place_2)
+
+        if (i, j) not in self._lengths:
+            raise KeyError("No connection between %s and %s" % (place_1, place_2))
+
+        rows = self._longer_rows(i, j, self._lengths[(i, j)])
+
+        self._set_length(i, j, None)
+        self.graph.remove_edge(place_1, place_2)
+
+        return self._apply(*self._recompute(rows))
+
+    def shortest_path_route(self, condensed=False):
+        '''
+        Current distances, same output as T2R_build_network.shortest_path_route
+
+        Returns
+        -------
+        dist_upper : numpy array of size no.places X np.places (upper half only)
+                     or condensed int32 vector if condensed
+        location_keys : numpy array of all corresponding location keys
+
+        '''
+
+        if condensed:
+            return self._condensed.copy(), self.location_keys
+
+        return np.triu(self._to_condensed(self._dist).astype(int)), self.location_keys
+
+    def get_all_neighbours(self):
+        '''
+        Neighbouring pairs and lengths of the current graph (see get_all_neighbours)
+        '''
+
+        return get_all_neighbours(self.graph)
@@ -0,0 +1,134 @@
+# Ticket to ride loader
+
+# Stream locations and connections from CSV or Parquet files into the graph
+import os
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from .T2R_array_graph import ArrayGraph
+from .T2R_profile import stage, count
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, only needed for Parquet files
+    pq = None
+
+LOCATION_COLUMNS = ['place', 'coord_x', 'coord_y']
+CONNECTION_COLUMNS = ['place_1', 'place_2', 'length', 'double_route']
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+
+def read_chunks(source, columns, chunksize=100000):
+    '''
+    Read a table in chunks of rows
+
+    Parameters
+    ----------
+    source : path of a .csv or .parquet file, or a pandas dataframe
+    columns : list of columns to read
+    chunksize : int, number of rows in each chunk
+
+    Returns
+    -------
+    chunks : iterator of pandas dataframes with the columns
+
+    '''
+
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunksize):
+            yield source[columns].iloc[start:start+chunksize]
+        return
+
+    if os.path.splitext(str(source))[1].lower() in PARQUET_EXTENSIONS:
+        if pq is None:
+            raise ImportError("pyarrow is needed to read Parquet files: %s" % source)
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    for chunk in pd.read_csv(source, usecols=columns, chunksize=chunksize):
+        yield chunk[columns]
+
+
+@stage('load_board')
+def load_board(locations, connections, chunksize=100000, array_graph=False):
+    '''
+    Build the graph and double route lists in one pass over the files,
+    without loading them whole. Nodes and edges are added in bulk for
+    each chunk, and connections to places that are not in the locations
+    are reported with their row numbers.
+
+    Parameters
+    ----------
+    locations : path of the locations .csv or .parquet file (or a pandas dataframe)
+    connections : path of the connections .csv or .parquet file (or a pandas dataframe)
+    chunksize : int, number of rows read at a time
+    array_graph : bool, return an ArrayGraph instead of a network X graph
+
+    Returns
+    -------
+    G : network X graph (same as build_graph) or ArrayGraph
+    double_routes : list of lists with two place names (same as get_double_routes)
+    double_routes_len : list of corresponding lengths for each pair
+
+    '''
+
+    G = nx.Graph()
+
+    location_chunks = []    # place names and coordinates for an ArrayGraph
+    edge_chunks = []
+
+    for chunk in read_chunks(locations, LOCATION_COLUMNS, chunksize):
+        if array_graph:
+            location_chunks.append((chunk.place.to_numpy(dtype=object), chunk[['coord_x', 'coord_y']].to_numpy(dtype=float)))
+        else:
+            G.add_nodes_from(zip(chunk.place.tolist(), ({'pos':pos} for pos in
+                                 zip(chunk.coord_x.tolist(), chunk.coord_y.tolist()))))
+
+    if array_graph:
+        place_names = np.concatenate([names for names, _ in location_chunks]) if location_chunks else np.zeros(0, dtype=object)
+        places = pd.Index(place_names)
+    else:
+        places = pd.Index(list(G.nodes))    # hashed place names for the dangling checks
+
+    double_routes = []
+    double_routes_len = []
+
+    row = 0     # row number of the start of the chunk
+    for chunk in read_chunks(connections, CONNECTION_COLUMNS, chunksize):
+        place_1 = chunk.place_1.to_numpy()
+        place_2 = chunk.place_2.to_numpy()
+
+        known_1 = chunk.place_1.isin(places).to_numpy()    # place names in the locations
+        known_2 = chunk.place_2.isin(places).to_numpy()
+        if not (known_1.all() and known_2.all()):
+            names = sorted(set(place_1[~known_1]) | set(place_2[~known_2]))
+            rows = np.flatnonzero(~(known_1 & known_2)) + row
+            raise ValueError("Connections to unknown places %s in rows %s" % (names, rows.tolist()))
+
+        length = chunk.length.to_numpy()
+
+        if array_graph:
+            edge_chunks.append((place_1, place_2, length/10))
+        else:
+            G.add_weighted_edges_from(zip(place_1.tolist(), place_2.tolist(), (length/10).tolist()))
+
+        double = (chunk.double_route == 'Y').to_numpy()
+        double_routes += np.column_stack([place_1[double], place_2[double]]).tolist()
+        double_routes_len += length[double].tolist()
+
+        row += len(chunk)
+
+    if array_graph:
+        coords = np.concatenate([xy for _, xy in location_chunks]) if location_chunks else np.zeros((0, 2))
+        edges = [np.concatenate(arrays) for arrays in zip(*edge_chunks)] if edge_chunks else [np.zeros(0)]*3
+        G = ArrayGraph.from_named_edges(place_names, coords, *edges)
+
+    count('nodes', G.number_of_nodes())
+    count('edges', G.number_of_edges())
+
+    return G, double_routes, double_routes_len
@@ -0,0 +1,369 @@
+# Ticket to ride pipeline
+
+# Board and ticket creation as a graph of stages, run headless from the command line
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import matplotlib
+import pandas as pd
+
+from .T2R_build_network import get_double_routes, get_all_neighbours
+from .T2R_cache import NetworkCache, frame_hash
+from .T2R_create_board import create_board_colouring, write_boards
+from .T2R_tickets import get_routes, get_t2r_europe_ticket_counts
+from .T2R_plotting import draw_graph, show_board_colour, create_tickets, ticket_font
+
+PIPELINE_VERSION = 1    # change when stage outputs change, so cached outputs are made again
+
+
+def _file_hash(path):
+    '''
+    Content hash of a file, None for no file
+    '''
+
+    if path is None:
+        return None
+
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024**2), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _network(params):
+    '''
+    Graph, routes and length buckets of the board, the graph and length
+    buckets are kept in a NetworkCache (keyed by frame_hash of the .csv data)
+    '''
+
+    locations, connections = params['frames']
+
+    graph, data, _, _ = NetworkCache(params['network_cache']).network(locations, connections)
+
+    double_routes, double_len = get_double_routes(connections)
+
+    routes, route_len = get_all_neighbours(graph)
+
+    return {'graph':graph, 'routes':routes, 'route_len':route_len,
+            'double_routes':double_routes, 'double_len':double_len, 'data':data}
+
+
+def _colouring(network, params):
+
+    board_data, colour_counts = create_board_colouring(network['routes'], network['route_len'],
+                                                       network['double_routes'], network['double_len'], params['seed'])
+
+    path = os.path.join(params['output'], 'board.csv')
+    board_data.to_csv(path, index=False)
+
+    return {'board_data':board_data, 'colour_counts':colour_counts, 'files':[path]}
+
+
+def _tickets(network, params):
+
+    short_counts, long_counts = get_t2r_europe_ticket_counts()
+
+    counts = short_counts if params['deck'] == 'short' else long_counts
+
+    routes, points = get_routes(network['data'], counts, params['seed'])
+
+    path = os.path.join(params['output'], params['deck'] + '_tickets.csv')
+    pd.DataFrame({'place1':[route[0] for route in routes], 'place2':[route[1] for route in routes],
+                  'points':points[:, 0].astype(int)}).to_csv(path, index=False)
+
+    return {'routes':routes, 'points':points, 'files':[path]}
+
+
+def _archive(network, colouring, short_tickets, long_tickets, params):
+
+    path = os.path.join(params['output'], 'board.t2r')
+
+    write_boards(path, network['graph'], [colouring['board_data']],
+                 [(short_tickets['routes'], short_tickets['points']), (long_tickets['routes'], long_tickets['points'])])
+
+    return {'files':[path]}
+
+
+def _graph_image(network, params):
+
+    path = os.path.join(params['output'], 'weighted_graph.' + params['format'])
+
+    draw_graph(network['graph'], path, headless=True)
+
+    return {'files':[path]}
+
+
+def _board_image(network, colouring, params):
+
+    path = os.path.join(params['output'], 'board.' + params['format'])
+
+    show_board_colour(colouring['board_data'], network['graph'], path, headless=True)
+
+    return {'files':[path]}
+
+
+def _ticket_images(network, tickets, params):
+
+    paths = create_tickets(tickets['routes'], network['graph'], tickets['points'], ticket_font(params['font']),
+                           os.path.join(params['output'], params['deck']), headless=True)
+
+    return {'files':paths}
+
+
+# stage name: (stages it needs the outputs of, function, parameters it uses), the
+# network stage is kept in a NetworkCache, the others in the stage cache
+STAGES = {'network':((), _network, ('frames', 'network_cache')),
+          'colouring':(('network',), _colouring, ('seed', 'output')),
+          'short_tickets':(('network',), _tickets, ('ticket_seed', 'output')),
+          'long_tickets':(('network',), _tickets, ('ticket_seed', 'output')),
+          'archive':(('network', 'colouring', 'short_tickets', 'long_tickets'), _archive, ('output',)),
+          'graph_image':(('network',), _graph_image, ('format', 'output')),
+          'board_image':(('network', 'colouring'), _board_image, ('format', 'output')),
+          'short_cards':(('network', 'short_tickets'), _ticket_images, ('font', 'output')),
+          'long_cards':(('network', 'long_tickets'), _ticket_images, ('font', 'output'))}
+
+
+def _stage_params(name, settings):
+    '''
+    Parameters passed to a stage function
+    '''
+
+    params = {setting:settings[setting] for setting in STAGES[name][2]}
+
+    if 'ticket_seed' in params:
+        params['seed'] = params.pop('ticket_seed')
+
+    if name.endswith(('_tickets', '_cards')):
+        params['deck'] = name.split('_')[0]
+
+    return params
+
+
+def _stage_key(name, params, dependency_keys, digests):
+    '''
+    Hash of everything a stage output depends on: the stage, its
+    parameters (file contents instead of input file names) and the keys
+    of the stages it needs
+    '''
+
+    inputs = {setting:digests.get(setting, value) for setting, value in params.items()}
+
+    text = json.dumps([PIPELINE_VERSION, name, inputs, dependency_keys], sort_keys=True, default=str)
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _cached_output(cache_dir, name, key):
+    '''
+    Stored output of a stage if it was made with the same key and its
+    files still exist, otherwise None
+    '''
+
+    path = os.path.join(cache_dir, name + '.pkl')
+
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as file:
+            stored_key, output = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):    # unreadable, make it again
+        return None
+
+    if stored_key != key or not all(os.path.exists(file) for file in output.get('files', [])):
+        return None
+
+    return output
+
+
+def _store_output(cache_dir, name, key, output):
+    '''
+    Save the output of a stage (written to a temporary file, then moved)
+    '''
+
+    path = os.path.join(cache_dir, name + '.pkl')
+
+    with open(path + '.tmp', 'wb') as file:
+        pickle.dump((key, output), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(path + '.tmp', path)
+
+
+def _run_stage(name, inputs, params):
+    '''
+    Run one stage (in a worker process), headless
+    '''
+
+    matplotlib.use('Agg')
+
+    start = time.perf_counter()
+
+    output = STAGES[name][1](*inputs, params)
+
+    return output, time.perf_counter() - start
+
+
+def run_pipeline(locations, connections, output='t2r_output', seed=10, ticket_seed=30, font=None,
+                 image_format='pdf', processes=None, cache_dir=None, force=False, verbose=True):
+    '''
+    Create the board and tickets from the locations and connections .csv
+    files: network (graph and distances) -> colouring and decks -> images.
+    Stages run as soon as the stages they need are done, independent
+    stages (board images, short and long decks and their tickets) run at
+    the same time across a process pool. The output of each stage is
+    cached, a stage is skipped when its inputs and settings are unchanged
+    and its files still exist. The graph and distances are kept in a
+    NetworkCache (cache_dir/network), keyed by the content of the .csv
+    data. Nothing is shown on screen.
+
+    Parameters
+    ----------
+    locations : path of the locations .csv file
+    connections : path of the connections .csv file
+    output : string, folder to save the board, tickets and images in
+    seed : int, random seed for the board colouring
+    ticket_seed : int, random seed for the ticket decks
+    font : path of a font file for the ticket text (default matplotlib font)
+    image_format : string, 'pdf', 'png' or 'svg' for the graph and board images
+    processes : int, number of stages to run at the same time (default number of CPUs)
+    cache_dir : string, folder for the stage outputs (default output/.t2r_cache)
+    force : bool, run every stage even if its output is cached
+    verbose : bool, print each stage as it finishes
+
+    Returns
+    -------
+    outputs : dict of stage name: dict of stage outputs
+    ran : list of stages that were run (the others came from the cache)
+
+    '''
+
+    if cache_dir is None:
+        cache_dir = os.path.join(output, '.t2r_cache')
+
+    os.makedirs(output, exist_ok=True)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    frames = (pd.read_csv(locations), pd.read_csv(connections))
+
+    network_cache = NetworkCache(os.path.join(cache_dir, 'network'))
+
+    settings = {'frames':frames, 'network_cache':network_cache.cache_dir, 'output':output, 'seed':seed,
+                'ticket_seed':ticket_seed, 'font':font, 'format':image_format}
+
+    digests = {'font':_file_hash(font)}
+
+    keys = {}
+    outputs = {}
+    ran = []
+
+    waiting = list(STAGES)
+    running = {}    # future: stage name
+
+    def report(name, message):
+        if verbose:
+            print('%-14s %s' % (name, message))
+
+    def start_ready(pool):
+        # start (or take from the cache) every stage whose inputs are done
+        progress = True
+        while progress:
+            progress = False
+            for name in list(waiting):
+                needs = STAGES[name][0]
+                if not all(need in outputs for need in needs):
+                    continue
+
+                waiting.remove(name)
+                progress = True
+
+                params = _stage_params(name, settings)
+
+                if name == 'network':   # in the NetworkCache, loaded (memory mapped) or made in this process
+                    keys[name] = frame_hash(*frames)
+                    if force:
+                        network_cache.invalidate(*frames)
+                    if keys[name] in network_cache.keys():
+                        outputs[name] = _run_stage(name, [], params)[0]
+                        report(name, 'cached')
+                    else:
+                        finish(name, _run_stage(name, [], params))
+                    continue
+
+                keys[name] = _stage_key(name, params, [keys[need] for need in needs], digests)
+
+                cached = None if force else _cached_output(cache_dir, name, keys[name])
+                if cached is not None:
+                    outputs[name] = cached
+                    report(name, 'cached')
+                    continue
+
+                inputs = [outputs[need] for need in needs]
+
+                if pool is None:
+                    finish(name, _run_stage(name, inputs, params))
+                else:
+                    running[pool.submit(_run_stage, name, inputs, params)] = name
+
+    def finish(name, result):
+        outputs[name], wall_time = result
+        if name != 'network':   # already stored by the NetworkCache
+            _store_output(cache_dir, name, keys[name], outputs[name])
+        ran.append(name)
+        report(name, 'done in %.2fs' % wall_time)
+
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            start_ready(pool)
+            while running:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(running.pop(future), future.result())
+                start_ready(pool)
+    else:
+        start_ready(None)
+
+    return outputs, ran
+
+
+def main(argv=None):
+    '''
+    ticket2ride command line entry point
+    '''
+
+    parser = argparse.ArgumentParser(prog='ticket2ride', description='Create a custom ticket to ride board and tickets')
+    parser.add_argument('locations', help='.csv file of place names and coordinates')
+    parser.add_argument('connections', help='.csv file of connections between places')
+    parser.add_argument('-o', '--output', default='t2r_output', help='folder for the board, tickets and images')
+    parser.add_argument('--seed', type=int, default=10, help='random seed for the board colouring')
+    parser.add_argument('--ticket-seed', type=int, default=30, help='random seed for the ticket decks')
+    parser.add_argument('--font', help='font file for the ticket text (default matplotlib font)')
+    parser.add_argument('--format', default='pdf', choices=['pdf', 'png', 'svg'], help='graph and board image format')
+    parser.add_argument('-j', '--processes', type=int, help='stages to run at the same time (default number of CPUs)')
+    parser.add_argument('--cache-dir', help='folder for the stage outputs (default OUTPUT/.t2r_cache)')
+    parser.add_argument('--force', action='store_true', help='run every stage, ignoring the cache')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print the stages')
+    args = parser.parse_args(argv)
+
+    matplotlib.use('Agg')   # never open windows
+
+    start = time.perf_counter()
+
+    _, ran = run_pipeline(args.locations, args.connections, args.output, args.seed, args.ticket_seed, args.font,
+                          args.format, args.processes, args.cache_dir, args.force, not args.quiet)
+
+    if not args.quiet:
+        print('%d of %d stages run in %.2fs, outputs in %s' % (len(ran), len(STAGES), time.perf_counter() - start,
+                                                                args.output))
+
+    return 0
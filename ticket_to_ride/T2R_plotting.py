@@ -1,53 +1,237 @@
 # Ticket to ride graph and nodes
 
 # Connections
-import matplotlib.pyplot as plt
+# pyplot (and so the matplotlib backend) is only imported to show figures, saved
+# files are drawn on off screen Agg figures
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+import matplotlib.font_manager as fm
 import networkx as nx
 import numpy as np
+import pandas as pd
 import os
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.image import imread, imsave
 
-def draw_graph(graph):
+from .T2R_create_board import BoardData
+from .T2R_array_graph import ArrayGraph
+from .T2R_distances import graph_edge_arrays
+from .T2R_profile import stage, count
+
+TICKET_SIZE = (3.5, 2.5)   # ticket size in inches
+
+PAPER_SIZES = {'A4':(210, 297), 'Letter':(215.9, 279.4)}  # paper sizes in mm (portrait)
+
+
+# RGB colour of each track colour ('None' for tracks with no colour)
+TRACK_RGB = {'yellow':[1,1,0],'blue':[0,0,1],'green':[0,1,0],'red':[1,0,0],'purple':[0.5,0,0.5],'black':[0,0,0],
+             'white':[0.9,0.9,0.9],'orange':[1,0.7,0],'grey':[0.5,0.5,0.5],'None':[0.8,0.8,0.8]}
+
+NODE_COLOUR = '#1f78b4'  # network x default node colour
+
+NODE_SIZE = 70  # marker size of places on the board (points^2)
+
+TRACK_WIDTH = 1.5   # line width of tracks on the board (points)
+
+
+def _graph_coords(graph):
+    '''
+    Place names and coordinate array of a network x graph or ArrayGraph
+    '''
+    
+    if isinstance(graph, ArrayGraph):
+        has_pos = ~np.isnan(graph.coords).any(axis=1)
+        return graph.places[has_pos], graph.coords[has_pos]
+    
+    pos = nx.get_node_attributes(graph, 'pos')
+    
+    return np.array(list(pos.keys()), dtype=object), np.array(list(pos.values()), dtype=float).reshape(-1, 2)
+
+
+def _segments(places, coords, place_1, place_2):
+    '''
+    Start and end coordinates of each track, array of size no.tracks X 2 X 2
+    '''
+    
+    index = pd.Index(places)
+    
+    ids = index.get_indexer(np.concatenate([np.asarray(place_1, dtype=object), np.asarray(place_2, dtype=object)]))
+    
+    if np.any(ids < 0):
+        missing = set(np.concatenate([place_1, place_2])[ids < 0].tolist())
+        raise ValueError("No coordinates for places: %s" % sorted(missing))
+    
+    ids = ids.reshape(2, -1)
+    
+    return np.stack([coords[ids[0]], coords[ids[1]]], axis=1)
+
+
+def _double_offsets(segments, pair_key, offset):
+    '''
+    Move tracks between the same places sideways so they are drawn next
+    to each other, offset apart
+    '''
+    
+    order = np.argsort(pair_key, kind='stable')
+    _, start, count = np.unique(pair_key[order], return_index=True, return_counts=True)
+    
+    rank = np.empty(len(pair_key))  # number of the track within its pair of places
+    rank[order] = np.arange(len(order)) - np.repeat(start, count)
+    
+    n_tracks = np.empty(len(pair_key))
+    n_tracks[order] = np.repeat(count, count)
+    
+    # unit normal of each track (tracks of a pair must go the same direction)
+    direction = segments[:, 1] - segments[:, 0]
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    normal = np.column_stack([-direction[:, 1], direction[:, 0]])/np.where(length > 0, length, 1)[:, None]
+    
+    shift = (rank - (n_tracks - 1)/2)*offset
+    
+    return segments + (shift[:, None]*normal)[:, None, :]
+
+
+def _figure(figsize, headless):
+    '''
+    Figure to draw on, off screen if headless
+    '''
+    
+    if headless:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+    else:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=figsize)
+    
+    return fig, fig.add_subplot(1, 1, 1)
+
+
+def _finish(fig, filename, dpi, headless):
+    '''
+    Save the figure (format from the file extension: .png, .svg or .pdf)
+    and show it unless headless
+    '''
+    
+    if filename is not None:
+        fig.savefig(filename, dpi=dpi)
+    
+    if not headless:
+        import matplotlib.pyplot as plt
+        plt.show()
+
+
+def board_segments(board_data, G, double_offset=None):
     '''
-    Visualise the graph
+    Coordinates and colours of all board tracks, as drawn by show_board_colour
 
     Parameters
     ----------
-    graph : network x graph
+    board_data : pandas dataframe (or BoardData) with board data
+    
+    G : network x graph (or ArrayGraph)
+    
+    double_offset : float, distance between double route tracks in map
+                    units (default 1% of the map size)
+
+    Returns
+    -------
+    segments : numpy array of size no.tracks X 2 X 2 of track start and end coordinates
+    colour : numpy array of size no.tracks X 3 of RGB colour of each track
+    coords : numpy array of size no.places X 2 of place coordinates
 
     '''
     
-    plt.figure(figsize=(13,7))
+    if not isinstance(board_data, BoardData):
+        board_data = BoardData.from_frame(board_data)
     
-    edges,weights = zip(*nx.get_edge_attributes(graph,'weight').items())
+    places, coords = _graph_coords(G)
     
-    pos = nx.get_node_attributes(graph, 'pos')
+    segments = _segments(places, coords, board_data.places[board_data.place_1], board_data.places[board_data.place_2])
+    
+    if double_offset is None:
+        double_offset = 0.01*np.max(np.ptp(coords, axis=0), initial=0) if len(coords) else 0
+    
+    low = np.minimum(board_data.place_1, board_data.place_2).astype(np.int64)
+    high = np.maximum(board_data.place_1, board_data.place_2)
+    
+    # same direction for both tracks of a double route so offsets go to opposite sides
+    flip = board_data.place_1 > board_data.place_2
+    segments[flip] = segments[flip][:, ::-1]
+    
+    segments = _double_offsets(segments, low*len(board_data.places) + high, double_offset)
+    
+    colour = np.array([TRACK_RGB[name] for name in board_data.colours + ['None']])[board_data.colour]  # RGB of each track
+    
+    return segments, colour, coords
 
-    # draw nodes
-    nx.draw_networkx_nodes(graph, pos, node_size=70)
+
+@stage('draw_graph')
+def draw_graph(graph, filename="weighted_graph.pdf", dpi=None, headless=False):
+    '''
+    Visualise the graph, all connections are drawn as one line collection
+
+    Parameters
+    ----------
+    graph : network x graph (or ArrayGraph)
+    
+    filename : string, file to save (.png, .svg or .pdf), None to not save
+    
+    dpi : int, resolution of the saved file (default matplotlib savefig dpi)
     
-    # draw edges
-    nx.draw_networkx_edges(graph, pos, node_color='b', edge_color=weights, 
-                           edge_cmap=plt.cm.Blues, edgelist=edges,
-                           width=2)
+    headless : bool, draw off screen and do not show the figure
+
+    '''
+    
+    places, coords = _graph_coords(graph)
+    
+    location_keys, place_1, place_2, length = graph_edge_arrays(graph)
+    
+    segments = _segments(places, coords, location_keys[place_1], location_keys[place_2])
+    
+    fig, ax = _figure((13,7), headless)
+    
+    # draw edges coloured by weight
+    edges = LineCollection(segments, array=length/10, cmap='Blues', linewidths=2)
+    edges.set_clim(np.min(length/10, initial=0), np.max(length/10, initial=1))
+    ax.add_collection(edges)
+    
+    # draw nodes
+    ax.scatter(coords[:, 0], coords[:, 1], s=70, c=NODE_COLOUR, zorder=2)
     
     # add labels
-    nx.draw_networkx_labels(graph, pos, font_size=5, label_pos=1, font_family='sans-serif')
+    for place, (x, y) in zip(places.tolist(), coords.tolist()):
+        ax.text(x, y, place, fontsize=5, family='sans-serif', ha='center', va='center', zorder=3)
     
-    plt.axis('off')
-    plt.gca().invert_yaxis()
-    plt.savefig("weighted_graph.pdf")
-    plt.show()
+    ax.autoscale_view()
+    ax.axis('off')
+    ax.invert_yaxis()
+    
+    _finish(fig, filename, dpi, headless)
 
 
-def show_board_colour(board_data,G):    
+@stage('show_board_colour')
+def show_board_colour(board_data, G, filename="colour_graph.pdf", dpi=None, headless=False, double_offset=None):
     '''
-    Recreate board colouring on the graph, plots and saves as .pdf file
+    Recreate board colouring on the graph, plots and saves the board.
+    All tracks are drawn as one line collection, tracks between the same
+    two places (double routes) are drawn side by side.
 
     Parameters
     ----------
-    board_colour : pandas dataframe with board data
+    board_colour : pandas dataframe (or BoardData) with board data
         
-    G : network x graph
+    G : network x graph (or ArrayGraph)
+    
+    filename : string, file to save (.png, .svg or .pdf), None to not save
+    
+    dpi : int, resolution of the saved file (default matplotlib savefig dpi)
+    
+    headless : bool, draw off screen and do not show the figure
+    
+    double_offset : float, distance between double route tracks in map
+                    units (default 1% of the map size)
 
     Returns
     -------
@@ -55,84 +239,184 @@ def show_board_colour(board_data,G):
 
     '''
     
-    edges,weights = zip(*nx.get_edge_attributes(G,'weight').items())   # get list of nodes locations
+    segments, colour, coords = board_segments(board_data, G, double_offset)
+    
+    fig, ax = _figure(None, headless)
+    
+    ax.add_collection(LineCollection(segments, colors=colour, linewidths=TRACK_WIDTH))
+    
+    ax.scatter(coords[:, 0], coords[:, 1], s=NODE_SIZE, c=NODE_COLOUR, zorder=2)     # plot nodes
+    
+    count('tracks_drawn', len(segments))
+    
+    ax.autoscale_view()
+    ax.axis("off")
+    
+    _finish(fig, filename, dpi, headless)
+         
 
-    node_locations = nx.get_node_attributes(G, 'pos')  # get list of nodes locations
+def ticket_font(path=None):
+    '''
+    Font for the ticket text, the matplotlib default font if no file is given
+    '''
+    
+    return fm.FontProperties() if path is None else fm.FontProperties(fname=path)
 
-    colours = {'yellow':[1,1,0],'blue':[0,0,1],'green':[0,1,0],'red':[1,0,0],'purple':[0.5,0,0.5],'black':[0,0,0],'white':[0.9,0.9,0.9],'orange':[1,0.7,0],
-           'grey':[0.5,0.5,0.5]}
     
+def ticket_base(graph, dpi=None):
+    '''
+    Draw the grey network shared by all tickets once and cache the
+    rendered background
+
+    Parameters
+    ----------
+    graph : network x graph (or ArrayGraph)
+    
+    dpi : int, resolution of the ticket (default matplotlib figure dpi)
+
+    Returns
+    -------
+    fig : matplotlib figure (Agg canvas, never shown)
+    ax : axes of the figure, limits fixed to the full map
+    background : cached raster of the base map
+    pos : dict of node positions
 
-    nx.draw_networkx_nodes(G, node_locations, node_size=70)     # plot nodes
+    '''
     
-    duplicates = board_data.pivot_table(index=['place1','place2'], aggfunc='size')
+    fig = Figure(edgecolor='k')
+    FigureCanvasAgg(fig)    # off screen canvas
+    ax = fig.subplots(1)
+    fig.set_size_inches(TICKET_SIZE)
     
-    duplicate_split = len(duplicates)   # find locations of duplicates
+    if dpi is not None:
+        fig.set_dpi(dpi)
     
-    X_all = []
-    Y_all = []
-    colour = np.zeros((len(board_data),3))
+    places, coords = _graph_coords(graph)
     
-    # plot connections for single routes
-    for idx in range(duplicate_split):
-        
-        # extract coordinates of two neighbours
-        pair = [board_data.place1[idx],board_data.place2[idx]]
-        
-        X = [node_locations[pair[0]][0], node_locations[pair[1]][0]]
-        Y = [node_locations[pair[0]][1], node_locations[pair[1]][1]]
-        
-        X_all.append(X)     # append to array of all x coords
-        Y_all.append(Y)     # append to array of all y coords
-        
-        colour[idx,:] = colours[board_data.trackColour[idx]]    # add colour RGB code
+    pos = dict(zip(places.tolist(), map(tuple, coords.tolist())))
     
-     # show double routes
-     # find distances between two nodes. Plot until halfway
-    for idx in range(duplicate_split+1,len(board_data)):
-        
-        # extract coordinates of two neighbours
-        pair = [board_data.place1[idx],board_data.place2[idx]]
-        
-        X_dup = [node_locations[pair[0]][0], node_locations[pair[1]][0]]
-        Y_dup = [node_locations[pair[0]][1], node_locations[pair[1]][1]]
+    location_keys, place_1, place_2, length = graph_edge_arrays(graph)
+    
+    # edges
+    if len(place_1):
+        segments = _segments(places, coords, location_keys[place_1], location_keys[place_2])
         
-        # find midpoint between two coords
-        X_dup[1] = (X_dup[0] + X_dup[1])/2
-        Y_dup[1] = (Y_dup[0] + Y_dup[1])/2
+        ax.add_collection(LineCollection(segments, colors='gray', linewidths=2, antialiaseds=(1,),
+                                         linestyle='solid', zorder=1))
         
-        X_all.append(X_dup)     # append to array of all x coords
-        Y_all.append(Y_dup)     # append to array of all y coords
+        low, high = segments.reshape(-1, 2).min(axis=0), segments.reshape(-1, 2).max(axis=0)
+        pad = 0.05*(high - low)
+        ax.update_datalim([low - pad, high + pad])    # same margin as network x draws
+    
+    # nodes
+    ax.scatter(coords[:, 0], coords[:, 1], s=40, c='gray', zorder=2)
+    
+    ax.axis('off')     # turn box off around map
+    ax.invert_yaxis()
+    ax.autoscale_view()
+    ax.set_autoscale_on(False)  # ticket overlays must not move the map
+    
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)     # cache base map
+    
+    return fig, ax, background, pos
+
+
+def draw_ticket(fig, ax, background, pos, route, point, font):
+    '''
+    Draw one ticket on top of the cached base map
+
+    Parameters
+    ----------
+    fig, ax, background, pos : base map from ticket_base
+    
+    route : pair of place names
+    
+    point : number of points for the route
+    
+    font : font properties for ticket text
+
+    Returns
+    -------
+    image : numpy array RGBA image of the ticket
+
+    '''
+    
+    fig.canvas.restore_region(background)   # start from the cached base map
+    
+    # X,Y coords for route line plotting
+    X = [pos[route[0]][0],pos[route[1]][0]]
+    Y = [pos[route[0]][1],pos[route[1]][1]]
+    
+    # route text
+    points_text = "Points: " + str(int(point))
+    route_text_1 = route[0].replace("_", " ") 
+    route_text_2 = route[1].replace("_", " ")   
+    
+    overlay = [ax.scatter(X, Y, s=150, c='maroon', zorder=2), # draw key nodes bigger
+               ax.text(20, 55, points_text,  fontproperties=font, fontsize=15),   # add points text
+               ax.text(40, -3, route_text_1.title() + " To ", ha='center', fontproperties=font,  fontsize=10),
+               ax.text(40, 1, route_text_2.title() ,ha='center', fontproperties=font,  fontsize=10),
+               ax.plot(X,Y,color='maroon',linestyle="--",linewidth=4)[0]]    # add line between places
+    
+    for artist in sorted(overlay, key=lambda artist: artist.get_zorder()):
+        ax.draw_artist(artist)  # only draw the ticket specific parts
+    
+    image = np.array(fig.canvas.buffer_rgba())   # copy of rendered ticket
+    
+    for artist in overlay:
+        artist.remove()
+    
+    return image
+
+
+def _render_ticket_batch(graph, routes, points, font, paths):
+    '''
+    Render a batch of tickets sharing one base map, saves each as .png file
+
+    Returns
+    -------
+    paths : list of saved file names
 
-        colour[idx,:] =  colours[board_data.trackColour[idx]]     # add colour RGB code
+    '''
+    
+    fig, ax, background, pos = ticket_base(graph)
     
-    for idx in range(len(X_all)):
-        plt.plot(X_all[idx],Y_all[idx],color=colour[idx,:]) # plot all the coords
+    for route, point, path in zip(routes, points, paths):
+        image = draw_ticket(fig, ax, background, pos, route, point, font)
         
-    plt.axis("off")
-    plt.savefig("colour_graph.pdf")
-    plt.show()
-         
+        imsave(path, image, dpi=fig.dpi)
     
-def create_tickets(routes,graph,points,font,filename):
+    return list(paths)
+
+
+@stage('create_tickets')
+def create_tickets(routes,graph,points,font,filename,processes=1,headless=False):
     '''
     Creates tickets for ticket2ride game, saves each as .png file
+    
+    The grey network is drawn once for each batch of tickets and cached,
+    only the route highlight, line and text are drawn for each ticket.
 
     Parameters
     ----------
     routes : all ticket routes
         
-    graph : network x graph
+    graph : network x graph (or ArrayGraph)
     
     points : number of points for each route
     
     font : string, font file location
         
     filename : string, whether the ticket is a short or long route
+    
+    processes : int, number of processes to render tickets in
+    
+    headless : bool, if True never show the tickets (only save files)
 
     Returns
     -------
-    None.
+    paths : list of saved ticket file names
 
     '''
     
@@ -146,53 +430,182 @@ def create_tickets(routes,graph,points,font,filename):
     else:
         print ("Created directory %s " % filepath)
     
+    name = os.path.basename(filename)   # filename can include a folder
+    paths = [os.path.join(filepath, name + '_' + route[0] + '_' + route[1] + '_graph.png') for route in routes]
     
-    for i in range(len(routes)):
-        
-        fig, ax = plt.subplots(1,edgecolor='k')
-        fig.set_size_inches(3.5,2.5)
-        
-        edges,weights = zip(*nx.get_edge_attributes(graph,'weight').items())
-        
-        pos = nx.get_node_attributes(graph, 'pos')
-        
-        # edges
-        nx.draw_networkx_edges(graph, pos, node_color='b', edge_color='gray', edgelist=edges,
-                               width=2)
-        
-        # nodes
-        nx.draw_networkx_nodes(graph, pos, node_size=40, node_color='gray', ax=ax)
-        
-        # draw key nodes bigger
-        # node 1- plot in colour
-        nx.draw_networkx_nodes(graph, pos, node_size=150, nodelist = routes[i],  node_color='maroon',ax=ax)
-        
-        # X,Y coords for route line plotting
-        X = [pos[routes[i][0]][0],pos[routes[i][1]][0]]
-        Y = [pos[routes[i][0]][1],pos[routes[i][1]][1]]
+    points = [point[0] for point in points]
+    
+    if processes > 1 and len(routes) > 1:
+        # split tickets into one batch per process
+        batches = [idx for idx in np.array_split(np.arange(len(routes)), processes) if len(idx)]
         
-        # add text to cards
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(_render_ticket_batch, graph, [routes[i] for i in idx],
+                                   [points[i] for i in idx], font, [paths[i] for i in idx]) for idx in batches]
+            
+            for future in futures:
+                future.result()
+    else:
+        _render_ticket_batch(graph, routes, points, font, paths)
+    
+    count('tickets_rendered', len(paths))
+    
+    if not headless:
+        import matplotlib.pyplot as plt
+        for path in paths: # show saved tickets
+            plt.figure(figsize=(3.5,2.5))
+            plt.imshow(imread(path))
+            plt.axis('off')
+            plt.show()
+            plt.close()
+    
+    return paths
+
+
+def _sheet_layout(paper, rows, cols, margin, dpi):
+    '''
+    Pixel positions of the ticket slots on a sheet
+
+    Parameters
+    ----------
+    paper : string, key of PAPER_SIZES
+    rows, cols : int, grid size (None to fit as many as possible)
+    margin : float, page margin in mm
+    dpi : int, resolution of the sheet
+
+    Returns
+    -------
+    page_shape : (height, width) of the sheet in pixels
+    slots : list of (top, left) pixel positions for each ticket, row by row
+    ticket_shape : (height, width) of a ticket in pixels
+
+    '''
+    
+    page_w, page_h = (int(round(size/25.4*dpi)) for size in PAPER_SIZES[paper])   # mm to pixels
+    
+    ticket_w, ticket_h = (int(round(size*dpi)) for size in TICKET_SIZE)
+    
+    margin_px = int(round(margin/25.4*dpi))
+    
+    max_cols = (page_w - 2*margin_px) // ticket_w  # tickets that fit inside the margins
+    max_rows = (page_h - 2*margin_px) // ticket_h
+    
+    cols = max_cols if cols is None else cols
+    rows = max_rows if rows is None else rows
+    
+    if cols < 1 or rows < 1 or cols > max_cols or rows > max_rows:
+        raise ValueError("%d x %d tickets do not fit on %s paper with %s mm margin (max %d x %d)"
+                         % (rows, cols, paper, margin, max_rows, max_cols))
+    
+    # centre the grid on the page
+    top = (page_h - rows*ticket_h) // 2
+    left = (page_w - cols*ticket_w) // 2
+    
+    slots = [(top + r*ticket_h, left + c*ticket_w) for r in range(rows) for c in range(cols)]
+    
+    return (page_h, page_w), slots, (ticket_h, ticket_w)
+
+
+def _ticket_pages(routes, graph, points, font, paper, rows, cols, margin, dpi, cut_lines):
+    '''
+    Generator of sheet images, each ticket is drawn straight onto the
+    sheet so only one page is held in memory
+
+    Yields
+    ------
+    page : numpy array RGBA uint8 image of one sheet
+
+    '''
+    
+    page_shape, slots, ticket_shape = _sheet_layout(paper, rows, cols, margin, dpi)
+    
+    fig, ax, background, pos = ticket_base(graph, dpi=dpi)
+    
+    for start in range(0, len(routes), len(slots)):
         
-        # route text
-        # Points string
-        points_text = "Points: " + str(int(points[i][0]))
-        plt.text(20, 55, points_text,  fontproperties=font, fontsize=15)    # add points text
+        page = np.full(page_shape + (4,), 255, dtype=np.uint8)     # white page
         
-        # Add ticket name 
-        route_text_1 = routes[i][0].replace("_", " ") 
-        plt.text(40, -3, route_text_1.title() + " To ", ha='center', fontproperties=font,  fontsize=10)
+        for (top, left), route, point in zip(slots, routes[start:start+len(slots)], points[start:start+len(slots)]):
+            
+            image = draw_ticket(fig, ax, background, pos, route, point, font)
+            
+            height, width = min(ticket_shape[0], image.shape[0]), min(ticket_shape[1], image.shape[1])
+            
+            page[top:top+height, left:left+width] = image[:height, :width]
+            
+            if cut_lines: # grey border to cut along
+                page[[top, top+height-1], left:left+width, :3] = 150
+                page[top:top+height, [left, left+width-1], :3] = 150
         
-        route_text_2 = routes[i][1].replace("_", " ")   
-        plt.text(40, 1, route_text_2.title() ,ha='center', fontproperties=font,  fontsize=10)
+        yield page
 
-        plt.axis('off')     # turn box off around map
-        
-        plt.plot(X,Y,color='maroon',linestyle="--",linewidth=4)     # add line between places
+
+@stage('create_ticket_sheets')
+def create_ticket_sheets(routes,graph,points,font,filename,output='pdf',paper='A4',
+                         rows=None,cols=None,margin=10,dpi=300,cut_lines=True):
+    '''
+    Lays out tickets on printable sheets, as one multi-page .pdf file or
+    one .png file per sheet. Pages are written as they are rendered,
+    no file is saved for single tickets.
+
+    Parameters
+    ----------
+    routes : all ticket routes
         
-        plt.gca().invert_yaxis()
+    graph : network x graph (or ArrayGraph)
+    
+    points : number of points for each route
+    
+    font : string, font file location
         
-        plt.savefig(filepath + '/' + filename + '_' + routes[i][0] + '_' + routes[i][1] + '_graph.png')
+    filename : string, whether the ticket is a short or long route
+    
+    output : string, 'pdf' or 'png'
+    
+    paper : string, paper size 'A4' or 'Letter'
+    
+    rows, cols : int, number of tickets down and across each sheet
+                 (default as many as fit inside the margins)
+    
+    margin : float, minimum page margin in mm
+    
+    dpi : int, print resolution
+    
+    cut_lines : bool, draw a thin grey border around each ticket
+
+    Returns
+    -------
+    paths : list of saved file names
+
+    '''
+    
+    if output not in ('pdf', 'png'):
+        raise ValueError("output must be 'pdf' or 'png', not %r" % output)
+    
+    points = [point[0] for point in points]
+    
+    pages = _ticket_pages(routes, graph, points, font, paper, rows, cols, margin, dpi, cut_lines)
+    
+    paths = []
+    
+    if output == 'pdf':
+        path = filename + '_sheets.pdf'
         
-        plt.show()
+        with PdfPages(path) as pdf:
+            for page in pages:
+                fig = Figure(figsize=(page.shape[1]/dpi, page.shape[0]/dpi), dpi=dpi)
+                fig.figimage(page)   # page raster fills the figure
+                pdf.savefig(fig, dpi=dpi)
         
-        plt.close()
\ No newline at end of file
+        paths.append(path)
+    else:
+        for number, page in enumerate(pages):
+            path = filename + '_sheet_' + str(number+1) + '.png'
+            
+            imsave(path, page, dpi=dpi)
+            
+            paths.append(path)
+    
+    count('tickets_rendered', len(routes))
+    
+    return paths
@@ -0,0 +1,256 @@
+# Ticket to ride profiling
+
+# Stage timings, peak memory and counters for the generation pipeline
+import atexit
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+_active = None  # Profiler collecting results, None when profiling is off
+
+
+class Profiler:
+    '''
+    Collects the wall time, number of calls and peak traced memory (bytes
+    above the memory in use when the stage started) of each pipeline
+    stage (functions marked with stage) and named counters. Times and
+    peaks of a stage include the stages it calls.
+
+    Parameters
+    ----------
+    memory : bool, trace peak memory with tracemalloc (slows Python code down)
+    cprofile : bool, also run cProfile (see dump_stats)
+
+    '''
+
+    def __init__(self, memory=True, cprofile=False):
+
+        self.memory = memory
+        self.stages = {}    # name: dict of calls, wall_time and peak_memory
+        self.counters = {}
+        self.wall_time = 0.0
+
+        self._peaks = []    # highest peak of the stages called by each running stage
+        self._cprofile = cProfile.Profile() if cprofile else None
+        self._tracing = False
+        self._start = None
+
+    def start(self):
+        '''
+        Start collecting
+        '''
+
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True    # stop tracing again at the end
+
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+        self._start = time.perf_counter()
+
+    def stop(self):
+        '''
+        Stop collecting
+        '''
+
+        if self._start is not None:
+            self.wall_time += time.perf_counter() - self._start
+            self._start = None
+
+        if self._cprofile is not None:
+            self._cprofile.disable()
+
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Time one call of a stage
+        '''
+
+        tracing = self.memory and tracemalloc.is_tracing()
+
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._peaks:     # keep the peak of the calling stage so far
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start
+
+            result = self.stages.setdefault(name, {'calls':0, 'wall_time':0.0, 'peak_memory':0})
+            result['calls'] += 1
+            result['wall_time'] += wall_time
+
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], self._peaks.pop())
+                result['peak_memory'] = max(result['peak_memory'], peak - current)   # above the memory in use at the start
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+
+    def count(self, name, n=1):
+        '''
+        Add n to a counter
+        '''
+
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        '''
+        Results as a dict of stages, counters and total wall time
+        '''
+
+        return {'wall_time':self.wall_time, 'stages':self.stages, 'counters':self.counters}
+
+    def report(self):
+        '''
+        Stage results as a pandas dataframe, slowest first
+        '''
+
+        import pandas as pd     # only needed for reports
+
+        report = pd.DataFrame.from_dict(self.stages, orient='index', columns=['calls', 'wall_time', 'peak_memory'])
+
+        return report.sort_values('wall_time', ascending=False)
+
+    def to_json(self, path):
+        '''
+        Save the results as a .json file
+        '''
+
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def dump_stats(self, path):
+        '''
+        Save the cProfile results (for pstats or snakeviz)
+        '''
+
+        if self._cprofile is None:
+            raise ValueError("cProfile was not enabled, use profile(cprofile=True)")
+
+        self._cprofile.dump_stats(path)
+
+
+@contextlib.contextmanager
+def profile(memory=True, cprofile=False, json_path=None, stats_path=None):
+    '''
+    Profile the ticket to ride functions called inside the block
+
+    Parameters
+    ----------
+    memory : bool, trace peak memory of each stage
+    cprofile : bool, also run cProfile
+    json_path : string, save the results to this .json file at the end
+    stats_path : string, save the cProfile results to this file at the end
+
+    Returns
+    -------
+    profiler : Profiler with the results
+
+    Example
+    -------
+    with t2r.profile(json_path='timings.json') as profiler:
+        graph = t2r.build_graph(locations, connections)
+    print(profiler.report())
+
+    '''
+
+    global _active
+
+    profiler = Profiler(memory=memory, cprofile=cprofile or stats_path is not None)
+
+    previous = _active
+    _active = profiler
+    profiler.start()
+
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active = previous
+
+        if json_path is not None:
+            profiler.to_json(json_path)
+        if stats_path is not None:
+            profiler.dump_stats(stats_path)
+
+
+def stage(name):
+    '''
+    Decorator marking a function as a pipeline stage, timed when
+    profiling is on (only a global check when it is off)
+    '''
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active
+
+            if profiler is None:
+                return func(*args, **kwargs)
+
+            with profiler.stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, n=1):
+    '''
+    Add n to a counter when profiling is on
+    '''
+
+    if _active is not None:
+        _active.count(name, n)
+
+
+def _profile_from_environment():
+    '''
+    Profile the whole run when T2R_PROFILE is set to a results file name
+    (.json for stage results, .prof for a cProfile dump, which also saves
+    the .json next to it). T2R_PROFILE_MEMORY=0 turns off memory tracing.
+    '''
+
+    global _active
+
+    path = os.environ.get('T2R_PROFILE')
+
+    if not path:
+        return
+
+    cprofile = path.endswith('.prof')
+
+    profiler = Profiler(memory=os.environ.get('T2R_PROFILE_MEMORY', '1') != '0', cprofile=cprofile)
+
+    _active = profiler
+    profiler.start()
+
+    def save():
+        profiler.stop()
+        if cprofile:
+            profiler.dump_stats(path)
+            profiler.to_json(os.path.splitext(path)[0] + '.json')
+        else:
+            profiler.to_json(path)
+
+    atexit.register(save)
+
+
+_profile_from_environment()
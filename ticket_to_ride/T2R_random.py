@@ -0,0 +1,83 @@
+# Ticket to ride random streams
+
+# Explicit random number streams instead of the global numpy random state
+import numpy as np
+
+
+def make_random_state(seed=None):
+    '''
+    Random stream to draw from
+
+    Parameters
+    ----------
+    seed : int or None - numpy RandomState seeded with it (same numbers as
+                         np.random.seed(seed) gave)
+           numpy RandomState or Generator - used as is
+           numpy SeedSequence - new Generator from it
+
+    Returns
+    -------
+    random_state : numpy RandomState or Generator
+
+    '''
+
+    if isinstance(seed, (np.random.RandomState, np.random.Generator)):
+        return seed
+
+    if isinstance(seed, np.random.SeedSequence):
+        return np.random.Generator(np.random.PCG64(seed))
+
+    return np.random.RandomState(seed)
+
+
+def spawn_random_states(seed, n_streams):
+    '''
+    Independent random streams, e.g. one for each part of the board
+    creation or for each parallel worker
+
+    Parameters
+    ----------
+    seed : int, None or numpy RandomState - the same stream is returned
+           n_streams times, so results match the single stream code
+           numpy SeedSequence or Generator - n_streams independent child
+           Generators are spawned
+
+    n_streams : int, number of streams
+
+    Returns
+    -------
+    random_states : list of numpy RandomState or Generator
+
+    '''
+
+    if isinstance(seed, np.random.Generator):
+        seed = _generator_seed_sequence(seed)
+
+    if isinstance(seed, np.random.SeedSequence):
+        return [np.random.Generator(np.random.PCG64(child)) for child in seed.spawn(n_streams)]
+
+    return [make_random_state(seed)] * n_streams
+
+
+def _generator_seed_sequence(generator):
+    '''
+    Seed sequence to spawn child streams of a Generator from
+    '''
+
+    seed_seq = getattr(generator.bit_generator, 'seed_seq', None)    # numpy >= 1.25
+
+    if isinstance(seed_seq, np.random.SeedSequence):
+        return seed_seq
+
+    return np.random.SeedSequence(generator.integers(2**63, size=4))    # seed from the generator itself
+
+
+def uniform_draws(random_state, size):
+    '''
+    Uniform [0, 1) numbers from a RandomState or Generator
+    '''
+
+    if isinstance(random_state, np.random.Generator):
+        return random_state.random(size)
+
+    return random_state.random_sample(size)
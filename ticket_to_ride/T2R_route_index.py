@@ -0,0 +1,360 @@
+# Ticket to ride route index
+
+# k shortest simple paths between place pairs, to rate how hard tickets are
+import heapq
+
+import numpy as np
+
+from .T2R_distances import condensed_index, condensed_pairs
+
+
+def edge_adjacency(place_1, place_2, length, n_places):
+    '''
+    Adjacency lists of (neighbour, edge id, length) for each place
+
+    Parameters
+    ----------
+    place_1, place_2 : numpy arrays of integer place ids of each edge
+    length : numpy array of integer length of each edge
+    n_places : int, number of places
+
+    Returns
+    -------
+    adjacency : list of lists for each place
+
+    '''
+
+    adjacency = [[] for _ in range(n_places)]
+
+    for edge, (i, j, w) in enumerate(zip(place_1.tolist(), place_2.tolist(), length.tolist())):
+        adjacency[i].append((j, edge, w))
+        adjacency[j].append((i, edge, w))
+
+    return adjacency
+
+
+def _dijkstra_path(adjacency, source, target, removed_edges, removed_places):
+    '''
+    Shortest path avoiding some edges and places
+
+    Returns
+    -------
+    (cost, places, edges) or None if there is no path
+
+    '''
+
+    dist = {source:0}
+    previous = {}
+    heap = [(0, source)]
+
+    while heap:
+        cost, place = heapq.heappop(heap)
+
+        if place == target:
+            break
+        if cost > dist[place]:
+            continue
+
+        for neighbour, edge, length in adjacency[place]:
+            if edge in removed_edges or neighbour in removed_places:
+                continue
+
+            new_cost = cost + length
+            if neighbour not in dist or new_cost < dist[neighbour]:
+                dist[neighbour] = new_cost
+                previous[neighbour] = (place, edge)
+                heapq.heappush(heap, (new_cost, neighbour))
+
+    if target not in dist:
+        return None
+
+    places = [target]
+    edges = []
+    while places[-1] != source:
+        place, edge = previous[places[-1]]
+        places.append(place)
+        edges.append(edge)
+
+    return dist[target], places[::-1], edges[::-1]
+
+
+def k_shortest_paths(adjacency, source, target, k):
+    '''
+    Yen's algorithm for the k shortest simple paths between two places
+
+    Parameters
+    ----------
+    adjacency : list of (neighbour, edge id, length) lists (from edge_adjacency)
+    source, target : int, place ids
+    k : int, number of paths
+
+    Returns
+    -------
+    paths : list of up to k (length, edge ids) in order of length
+            (ties broken by number of edges, then edge ids)
+
+    '''
+
+    first = _dijkstra_path(adjacency, source, target, set(), set())
+
+    if first is None:
+        return []
+
+    found = [first]
+    candidates = []     # heap of (cost, no.edges, edge ids, places)
+    seen = {tuple(first[2])}
+
+    while len(found) < k:
+        _, places, edges = found[-1]
+
+        root_cost = 0
+        for spur in range(len(places) - 1):
+            root_places = places[:spur+1]
+
+            # edges leaving the spur place used by found paths with the same root
+            removed_edges = {path_edges[spur] for _, path_places, path_edges in found
+                             if path_places[:spur+1] == root_places}
+
+            spur_path = _dijkstra_path(adjacency, places[spur], target, removed_edges, set(root_places[:-1]))
+
+            if spur_path is not None:
+                new_edges = tuple(edges[:spur] + spur_path[2])
+                if new_edges not in seen:
+                    seen.add(new_edges)
+                    heapq.heappush(candidates, (root_cost + spur_path[0], len(new_edges), new_edges,
+                                                root_places[:-1] + spur_path[1]))
+
+            root_cost += _edge_length(adjacency, places[spur], edges[spur])
+
+        if not candidates:
+            break
+
+        cost, _, new_edges, new_places = heapq.heappop(candidates)
+        found.append((cost, new_places, list(new_edges)))
+
+    return [(cost, edges) for cost, _, edges in found]
+
+
+def _edge_length(adjacency, place, edge):
+    '''
+    Length of an edge at a place
+    '''
+
+    for _, other_edge, length in adjacency[place]:
+        if other_edge == edge:
+            return length
+
+    raise KeyError(edge)
+
+
+def index_batch(adjacency, sources, targets, k):
+    '''
+    k shortest paths for a batch of place pairs
+
+    Returns
+    -------
+    lengths : numpy array of size no.pairs X k of path lengths (-1 for no path)
+    path_sizes : numpy array of size no.pairs X k of number of edges of each path
+    path_edges : numpy array of edge ids of all paths, in order
+
+    '''
+
+    lengths = np.full((len(sources), k), -1, dtype=np.int32)
+    path_sizes = np.zeros((len(sources), k), dtype=np.int32)
+    path_edges = []
+
+    for row, (source, target) in enumerate(zip(sources, targets)):
+        for col, (cost, edges) in enumerate(k_shortest_paths(adjacency, source, target, k)):
+            lengths[row, col] = cost
+            path_sizes[row, col] = len(edges)
+            path_edges += edges
+
+    return lengths, path_sizes, np.array(path_edges, dtype=np.int32)
+
+
+class RouteIndex:
+    '''
+    k shortest simple paths for place pairs, with the edges shared by all
+    of them (bottlenecks). Lookups by place pair are two dict lookups
+    (place name to id, condensed position to row), so the index only
+    takes memory for the places and the pairs in it.
+
+    Parameters
+    ----------
+    location_keys : numpy array of sorted place names
+    edge_places : numpy array of size no.edges X 2 of place ids of each edge
+    edge_length : numpy array of length of each edge
+    positions : numpy array of condensed positions of the indexed pairs
+    lengths : numpy array of size no.pairs X k of path lengths (-1 for no path)
+    path_sizes : numpy array of size no.pairs X k of number of edges of each path
+    path_edges : numpy array of edge ids of all paths, in order
+
+    '''
+
+    def __init__(self, location_keys, edge_places, edge_length, positions, lengths, path_sizes, path_edges):
+
+        self.location_keys = location_keys
+        self.n_places = len(location_keys)
+        self.edge_places = np.asarray(edge_places, dtype=np.int32).reshape(-1, 2)
+        self.edge_length = np.asarray(edge_length, dtype=np.int32)
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int32)
+        self.path_sizes = np.asarray(path_sizes, dtype=np.int32)
+        self.path_edges = np.asarray(path_edges, dtype=np.int32)
+        self.k = self.lengths.shape[1]
+
+        # start of each path in path_edges
+        self.path_offsets = np.concatenate([[0], np.cumsum(self.path_sizes.ravel())]).astype(np.int64)
+
+        self._place_ids = {place:i for i, place in enumerate(np.asarray(location_keys).tolist())}
+        self._rows = {position:row for row, position in enumerate(self.positions.tolist())}   # row of each pair
+
+        self.shared_length = self._shared_lengths()
+
+    def _shared_lengths(self):
+        '''
+        Total length of the edges on every path of each pair
+        '''
+
+        shared = np.zeros(len(self.positions), dtype=np.int32)
+
+        n_paths = self.n_paths()
+
+        for row in np.flatnonzero(n_paths):
+            common = None
+            for col in range(n_paths[row]):
+                edges = set(self._path(row, col).tolist())
+                common = edges if common is None else common & edges
+            shared[row] = self.edge_length[list(common)].sum()
+
+        return shared
+
+    def _path(self, row, col):
+        start = self.path_offsets[row*self.k + col]
+        return self.path_edges[start:start + self.path_sizes[row, col]]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def row(self, place_1, place_2):
+        '''
+        Row of a place pair in the index arrays, -1 if it is not indexed
+        '''
+
+        i, j = self._place_ids.get(str(place_1)), self._place_ids.get(str(place_2))
+
+        if i is None or j is None:
+            raise ValueError("Unknown places: %s" % sorted({str(place_1), str(place_2)} - set(self._place_ids)))
+
+        if i == j:
+            return -1
+
+        return self._rows.get(int(condensed_index(min(i, j), max(i, j), self.n_places)), -1)
+
+    def __contains__(self, pair):
+        return self.row(*pair) >= 0
+
+    def _checked_row(self, place_1, place_2):
+        row = self.row(place_1, place_2)
+
+        if row < 0:
+            raise KeyError("Pair not in route index: %s, %s" % (place_1, place_2))
+
+        return row
+
+    def n_paths(self):
+        '''
+        Number of paths found for each indexed pair
+        '''
+
+        return (self.lengths >= 0).sum(axis=1)
+
+    def paths(self, place_1, place_2):
+        '''
+        k shortest paths between two places
+
+        Returns
+        -------
+        paths : list of (length, list of place name pairs of each track)
+
+        '''
+
+        row = self._checked_row(place_1, place_2)
+
+        paths = []
+        for col in range(self.n_paths()[row]):
+            places = self.location_keys[self.edge_places[self._path(row, col)]]
+            paths.append((int(self.lengths[row, col]), places.tolist()))
+
+        return paths
+
+    def shared_edges(self, place_1, place_2):
+        '''
+        Tracks used by all k shortest paths (list of place name pairs)
+        '''
+
+        row = self._checked_row(place_1, place_2)
+
+        common = set(self._path(row, 0).tolist())
+        for col in range(1, self.n_paths()[row]):
+            common &= set(self._path(row, col).tolist())
+
+        return self.location_keys[self.edge_places[sorted(common)]].tolist()
+
+    def difficulty(self, routes=None):
+        '''
+        Difficulty of tickets: share of the shortest path length on tracks
+        used by every one of the k shortest paths (1 when there is only one
+        path, near 0 when there are separate alternatives)
+
+        Parameters
+        ----------
+        routes : list of place pairs, None for all indexed pairs
+
+        Returns
+        -------
+        difficulty : numpy array of difficulty of each pair (nan for pairs with no path)
+
+        '''
+
+        if routes is None:
+            rows = np.arange(len(self.positions))
+        else:
+            rows = np.array([self._checked_row(*pair) for pair in routes], dtype=int)
+
+        shortest = self.lengths[rows, 0].astype(float)
+
+        return np.where(shortest > 0, self.shared_length[rows]/np.where(shortest > 0, shortest, 1), np.nan)
+
+    def alternatives(self, routes=None, slack=0):
+        '''
+        Number of paths no more than slack longer than the shortest path
+
+        Parameters
+        ----------
+        routes : list of place pairs, None for all indexed pairs
+        slack : int, extra length allowed
+
+        Returns
+        -------
+        alternatives : numpy array of number of paths for each pair
+
+        '''
+
+        if routes is None:
+            rows = np.arange(len(self.positions))
+        else:
+            rows = np.array([self._checked_row(*pair) for pair in routes], dtype=int)
+
+        lengths = self.lengths[rows]
+
+        return ((lengths >= 0) & (lengths <= lengths[:, :1] + slack)).sum(axis=1)
+
+    def pairs(self):
+        '''
+        Place names of each indexed pair
+        '''
+
+        rows, cols = condensed_pairs(self.positions, self.n_places)
+
+        return np.column_stack([self.location_keys[rows], self.location_keys[cols]]).tolist()
@@ -0,0 +1,549 @@
+# Ticket to ride render server
+
+# Local HTTP service rendering single tickets and board images on demand
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from urllib.parse import urlsplit, unquote, parse_qs
+
+import matplotlib
+import networkx as nx
+import pandas as pd
+from matplotlib.image import imsave
+
+from .T2R_loader import load_board
+from .T2R_build_network import get_all_neighbours
+from .T2R_create_board import create_board_colouring, read_board
+from .T2R_array_graph import ArrayGraph
+from .T2R_plotting import ticket_base, draw_ticket, ticket_font, show_board_colour
+from .T2R_profile import count
+
+# allowed style settings: type, minimum, maximum
+STYLES = {'board':{'dpi':(int, 20, 600), 'offset':(float, 0, None)},
+          'ticket':{'dpi':(int, 20, 600), 'points':(int, 0, 1000)}}
+
+MAX_REQUEST_LINE = 8192     # bytes of the request line and each header
+
+STATUS_TEXT = {200:'OK', 400:'Bad Request', 404:'Not Found', 405:'Method Not Allowed', 500:'Internal Server Error'}
+
+
+# worker process state: boards, font and the ticket base maps already drawn
+_worker = {'boards':{}, 'font':None, 'bases':{}}
+
+
+def _init_worker(boards, font):
+    '''
+    Set up a render worker with the boards (sent once, not with every request)
+    '''
+
+    matplotlib.use('Agg')   # never open windows
+
+    _worker['boards'] = boards
+    _worker['font'] = ticket_font(font)
+    _worker['bases'] = {}
+
+
+def _render_board(name, style):
+    '''
+    Board image of a registered board as PNG bytes (in a worker process)
+    '''
+
+    graph, board_data = _worker['boards'][name]
+
+    buffer = io.BytesIO()
+    show_board_colour(board_data, graph, buffer, dpi=style.get('dpi'), headless=True,
+                      double_offset=style.get('offset'))    # no extension, saved as png
+
+    return buffer.getvalue()
+
+
+def _render_ticket(name, route, style):
+    '''
+    One ticket of a registered board as PNG bytes (in a worker process),
+    the base map of each board and resolution is drawn once and reused
+    '''
+
+    graph, _ = _worker['boards'][name]
+
+    key = (name, style.get('dpi'))
+    if key not in _worker['bases']:
+        _worker['bases'][key] = ticket_base(graph, style.get('dpi'))
+    fig, ax, background, pos = _worker['bases'][key]
+
+    point = style.get('points')
+    if point is None:   # shortest route length, as the points of get_routes (weights are length/10)
+        point = round(10*nx.shortest_path_length(graph, route[0], route[1], weight='weight'))
+
+    image = draw_ticket(fig, ax, background, pos, route, point, _worker['font'])
+
+    buffer = io.BytesIO()
+    imsave(buffer, image, dpi=fig.dpi, format='png')
+
+    return buffer.getvalue()
+
+
+class PNGCache:
+    '''
+    Least recently used cache of rendered images, limited by their total size
+
+    Parameters
+    ----------
+    max_bytes : int, total size of the images kept
+
+    '''
+
+    def __init__(self, max_bytes=64*1024**2):
+
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._images = OrderedDict()     # key: png bytes, oldest first
+
+    def __len__(self):
+        return len(self._images)
+
+    def __contains__(self, key):
+        return key in self._images
+
+    def get(self, key):
+        '''
+        Image for the key (now the most recently used), None if not cached
+        '''
+
+        image = self._images.get(key)
+
+        if image is not None:
+            self._images.move_to_end(key)
+
+        return image
+
+    def put(self, key, image):
+        '''
+        Add an image, dropping the least recently used ones over the size limit
+        '''
+
+        if len(image) > self.max_bytes:     # never fits
+            return
+
+        if key in self._images:
+            self.size -= len(self._images.pop(key))
+
+        self._images[key] = image
+        self.size += len(image)
+
+        while self.size > self.max_bytes:
+            _, old = self._images.popitem(last=False)
+            self.size -= len(old)
+
+
+def _board_digest(graph, board_data):
+    '''
+    Hash of the board contents, so a board registered again under the same
+    name is never served from images of the old one
+    '''
+
+    if hasattr(board_data, 'to_frame'):     # BoardData
+        board_data = board_data.to_frame()
+
+    digest = hashlib.sha256(pd.util.hash_pandas_object(board_data, index=False).to_numpy().tobytes())
+
+    edges = sorted((str(a), str(b), str(weight)) for a, b, weight in graph.edges(data='weight'))
+    places = sorted((str(place), str(pos)) for place, pos in graph.nodes(data='pos'))
+    digest.update(json.dumps([edges, places]).encode())
+
+    return digest.hexdigest()[:16]
+
+
+class HTTPError(Exception):
+    '''
+    Error answered to the client with an HTTP status
+    '''
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RenderServer:
+    '''
+    Asyncio HTTP service rendering ticket and board images on request.
+    Images are rendered in a process pool and kept in an LRU cache keyed
+    by board, route and style, concurrent requests for the same image
+    wait for one render. Nothing is fetched from the network.
+
+    Endpoints (GET or HEAD)
+    -----------------------
+    /boards : json list of boards and their places
+    /board/<board>.png?dpi=&offset= : board image (offset between double routes)
+    /ticket/<board>/<place1>/<place2>.png?dpi=&points= : ticket image
+        (default points: the route length)
+    /stats : json cache and render counts
+
+    Parameters
+    ----------
+    boards : dict of board name: (graph, board_data), network X graph (or
+             ArrayGraph) and board dataframe (or BoardData)
+    processes : int, number of render processes
+    cache_bytes : int, total size of the cached images
+    font : path of a font file for the ticket text (default matplotlib font)
+
+    '''
+
+    def __init__(self, boards, processes=1, cache_bytes=64*1024**2, font=None):
+
+        # network X graphs for the place and path checks of each request
+        self.boards = {name:(graph.to_networkx() if isinstance(graph, ArrayGraph) else graph, board_data)
+                       for name, (graph, board_data) in boards.items()}
+        self.digests = {name:_board_digest(*board) for name, board in self.boards.items()}
+
+        self.processes = processes
+        self.font = font
+
+        self.cache = PNGCache(cache_bytes)
+        self.stats = {'requests':0, 'hits':0, 'renders':0, 'coalesced':0, 'errors':0, 'render_time':0.0}
+
+        self._pending = {}   # key: future of an image being rendered
+        self._pool = None
+        self._server = None
+
+    def _executor(self):
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                             initargs=(self.boards, self.font))
+        return self._pool
+
+    def _style(self, kind, query):
+        '''
+        Checked style settings of a request, sorted for the cache key
+        '''
+
+        style = {}
+        for setting, values in query.items():
+            if setting not in STYLES[kind]:
+                raise HTTPError(400, 'Unknown setting %r for a %s' % (setting, kind))
+
+            convert, low, high = STYLES[kind][setting]
+            try:
+                value = convert(values[-1])
+            except ValueError:
+                raise HTTPError(400, 'Bad value %r for %s' % (values[-1], setting))
+
+            if not math.isfinite(value):    # nan and inf pass the range check
+                raise HTTPError(400, 'Bad value %r for %s' % (values[-1], setting))
+
+            if value < low or (high is not None and value > high):
+                raise HTTPError(400, '%s must be between %s and %s' % (setting, low, high))
+
+            style[setting] = value
+
+        return tuple(sorted(style.items()))
+
+    def _board(self, name):
+
+        if name not in self.boards:
+            raise HTTPError(404, 'Unknown board %r' % name)
+
+        return self.boards[name]
+
+    async def render(self, kind, name, route=None, style=()):
+        '''
+        PNG bytes of a board ('board') or ticket ('ticket') image, from the
+        cache, from a render already running or rendered in the pool
+
+        Parameters
+        ----------
+        kind : string, 'board' or 'ticket'
+        name : string, board name
+        route : pair of place names (tickets only)
+        style : tuple of sorted (setting, value) pairs
+
+        Returns
+        -------
+        image : bytes of the png file
+
+        '''
+
+        graph, _ = self._board(name)
+
+        if route is not None:
+            route = tuple(route)
+            unknown = [place for place in route if place not in graph]
+            if unknown:
+                raise HTTPError(404, 'Unknown places %s on board %r' % (unknown, name))
+            if route[0] == route[1]:
+                raise HTTPError(400, 'A ticket needs two different places, not %s twice' % route[0])
+            if not nx.has_path(graph, *route):
+                raise HTTPError(404, 'No path between %s and %s' % route)
+
+        key = (kind, name, self.digests[name], route, style)
+
+        image = self.cache.get(key)
+        if image is not None:
+            self.stats['hits'] += 1
+            return image
+
+        if key in self._pending:    # same image being rendered: wait for it
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self._pending[key])
+
+        # the render is a task of its own, a requester that is cancelled
+        # (client gone) never stops it or leaves the others waiting
+        render = asyncio.ensure_future(self._render(key, kind, name, route, style))
+        render.add_done_callback(lambda task: task.cancelled() or task.exception())   # error seen by someone
+        self._pending[key] = render
+
+        return await asyncio.shield(render)
+
+    async def _render(self, key, kind, name, route, style):
+        '''
+        Render an image in the pool and cache it
+        '''
+
+        loop = asyncio.get_running_loop()
+
+        start = time.perf_counter()
+        try:
+            if kind == 'board':
+                image = await loop.run_in_executor(self._executor(), _render_board, name, dict(style))
+            else:
+                image = await loop.run_in_executor(self._executor(), _render_ticket, name, route, dict(style))
+        finally:
+            del self._pending[key]
+            self.stats['renders'] += 1
+            self.stats['render_time'] += time.perf_counter() - start
+
+        self.cache.put(key, image)
+        count('images_rendered')
+
+        return image
+
+    async def _route(self, path, query):
+        '''
+        Body and content type of the answer to a request path
+        '''
+
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+
+        if parts == ['boards']:
+            boards = {name:sorted(map(str, graph.nodes)) for name, (graph, _) in self.boards.items()}
+            return json.dumps(boards).encode(), 'application/json'
+
+        if parts == ['stats']:
+            stats = dict(self.stats, cached_images=len(self.cache), cache_bytes=self.cache.size,
+                         rendering=len(self._pending))
+            return json.dumps(stats).encode(), 'application/json'
+
+        if len(parts) == 2 and parts[0] == 'board' and parts[1].endswith('.png'):
+            image = await self.render('board', parts[1][:-4], None, self._style('board', query))
+            return image, 'image/png'
+
+        if len(parts) == 4 and parts[0] == 'ticket' and parts[3].endswith('.png'):
+            route = (parts[2], parts[3][:-4])
+            image = await self.render('ticket', parts[1], route, self._style('ticket', query))
+            return image, 'image/png'
+
+        raise HTTPError(404, 'Unknown path %r' % path)
+
+    async def handle(self, reader, writer):
+        '''
+        Answer the requests of one connection (kept open if the client asks)
+        '''
+
+        try:
+            while True:
+                try:
+                    request_line = await reader.readuntil(b'\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readuntil(b'\r\n')
+                    if line == b'\r\n':
+                        break
+                    field, _, value = line.decode('latin-1').partition(':')
+                    headers[field.strip().lower()] = value.strip()
+
+                self.stats['requests'] += 1
+
+                method, target, version = (request_line.decode('latin-1').split() + ['', '', ''])[:3]
+                keep_alive = (headers.get('connection', '').lower() == 'keep-alive' if version == 'HTTP/1.0'
+                              else headers.get('connection', '').lower() != 'close')
+
+                try:
+                    if method not in ('GET', 'HEAD'):
+                        raise HTTPError(405, 'Only GET and HEAD requests')
+                    url = urlsplit(target)
+                    body, content_type = await self._route(url.path, parse_qs(url.query))
+                    status = 200
+                except HTTPError as error:
+                    status, body, content_type = error.status, (str(error) + '\n').encode(), 'text/plain'
+                    self.stats['errors'] += 1
+                except Exception as error:  # render failed, the server keeps running
+                    status, body = 500, ('%s: %s\n' % (type(error).__name__, error)).encode()
+                    content_type = 'text/plain'
+                    self.stats['errors'] += 1
+
+                head = ['HTTP/1.1 %d %s' % (status, STATUS_TEXT[status]),
+                        'Content-Type: ' + content_type,
+                        'Content-Length: %d' % len(body),
+                        'Connection: ' + ('keep-alive' if keep_alive else 'close')]
+                if content_type == 'image/png':
+                    head.append('Cache-Control: max-age=3600')
+
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass    # client went away
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8000):
+        '''
+        Start listening (port 0 for any free port), returns the asyncio server
+        '''
+
+        # fork every worker now, a worker forked while a client socket is open
+        # keeps it open, so the client never sees the end of its answer
+        pool = self._executor()
+        wait([pool.submit(int) for _ in range(self.processes)])
+
+        self._server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_LINE)
+
+        return self._server
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1] if self._server else None
+
+    async def close(self):
+        '''
+        Stop listening and shut the render processes down
+        '''
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+def load_server_board(locations, connections, board=None, seed=10):
+    '''
+    Graph and board data for the server from the board files, the board
+    colouring is made (as the pipeline does) when no board .csv is given
+
+    Parameters
+    ----------
+    locations : path of the locations .csv or .parquet file
+    connections : path of the connections .csv or .parquet file
+    board : path of a board .csv file or board archive (board.csv or
+            board.t2r from the pipeline, the first board of an archive)
+    seed : int, random seed for the board colouring
+
+    Returns
+    -------
+    graph : network X graph
+    board_data : pandas dataframe with board data
+
+    '''
+
+    graph, double_routes, double_len = load_board(locations, connections)
+
+    if board is not None and board.endswith('.t2r'):
+        return graph, read_board(board)
+
+    if board is not None:
+        return graph, pd.read_csv(board)
+
+    routes, route_len = get_all_neighbours(graph)
+    board_data, _ = create_board_colouring(routes, route_len, double_routes, double_len, seed)
+
+    return graph, board_data
+
+
+def serve(boards, host='127.0.0.1', port=8000, processes=1, cache_bytes=64*1024**2, font=None):
+    '''
+    Run a RenderServer until interrupted (Ctrl+C)
+
+    Parameters
+    ----------
+    boards : dict of board name: (graph, board_data)
+    host, port : address to listen on (local only by default)
+    processes : int, number of render processes
+    cache_bytes : int, total size of the cached images
+    font : path of a font file for the ticket text
+
+    Returns
+    -------
+    None.
+
+    '''
+
+    async def run():
+        server = RenderServer(boards, processes, cache_bytes, font)
+        listening = await server.start(host, port)
+        print('Serving %s on http://%s:%d' % (', '.join(boards), host, server.port), flush=True)
+        try:
+            async with listening:
+                await listening.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    '''
+    ticket2ride-serve command line entry point
+    '''
+
+    parser = argparse.ArgumentParser(prog='ticket2ride-serve', description='Serve ticket and board images on demand')
+    parser.add_argument('--board', nargs='+', action='append', required=True,
+                        metavar=('NAME LOCATIONS CONNECTIONS', 'BOARD'),
+                        help='board name, locations and connections files and optionally a board .csv or .t2r archive '
+                             '(coloured with --seed if not given), can be repeated')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on')
+    parser.add_argument('-j', '--processes', type=int, default=1, help='number of render processes')
+    parser.add_argument('--cache-mb', type=float, default=64, help='size of the image cache in MB')
+    parser.add_argument('--seed', type=int, default=10, help='random seed for boards without a board file')
+    parser.add_argument('--font', help='font file for the ticket text (default matplotlib font)')
+    args = parser.parse_args(argv)
+
+    matplotlib.use('Agg')
+
+    boards = {}
+    for board in args.board:
+        if len(board) not in (3, 4):
+            parser.error('--board needs NAME LOCATIONS CONNECTIONS [BOARD]')
+        for path in board[1:]:
+            if not os.path.exists(path):
+                parser.error('no file %s' % path)
+        boards[board[0]] = load_server_board(*board[1:], seed=args.seed)
+
+    serve(boards, args.host, args.port, args.processes, int(args.cache_mb*1024**2), args.font)
+
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,512 @@
+# Ticket to ride game simulator
+
+# Monte Carlo games with simple bot players to test boards and decks
+import heapq
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .T2R_create_board import BoardData
+from .T2R_profile import stage, count
+
+# points for claiming a route of each length
+ROUTE_POINTS = {1:1, 2:2, 3:4, 4:7, 5:10, 6:15, 7:18, 8:21}
+
+TRAINS = 45     # trains for each player
+
+COLOUR_CARDS = 12   # train cards of each colour (not grey)
+LOCOMOTIVE_CARDS = 14
+
+INFINITY = float('inf')
+
+
+def simulation_layout(board_data, decks):
+    '''
+    Arrays and adjacency lists for the simulator, made once for all games
+
+    Parameters
+    ----------
+    board_data : pandas dataframe (or BoardData) with board data
+
+    decks : list of (routes, points) for each ticket deck (as get_routes)
+
+    Returns
+    -------
+    layout : dict of board arrays, adjacency lists and tickets
+
+    '''
+
+    if not isinstance(board_data, BoardData):
+        board_data = BoardData.from_frame(board_data)
+
+    grey = board_data.colours.index('grey')
+
+    place_1 = board_data.place_1.tolist()
+    place_2 = board_data.place_2.tolist()
+
+    adjacency = [[] for _ in range(len(board_data.places))]     # (route, other place) for each place
+    for route, (a, b) in enumerate(zip(place_1, place_2)):
+        adjacency[a].append((route, b))
+        adjacency[b].append((route, a))
+
+    # index of the other track of double routes (-1 for single routes)
+    partner = [-1]*len(board_data)
+    first = {}
+    for route, (a, b) in enumerate(zip(place_1, place_2)):
+        key = (min(a, b), max(a, b))
+        if key in first:
+            partner[route] = first[key]
+            partner[first[key]] = route
+        else:
+            first[key] = route
+
+    place_index = {name:idx for idx, name in enumerate(board_data.places.tolist())}
+
+    tickets = []    # (deck, place 1, place 2, points) for each deck
+    for routes, points in decks:
+        tickets.append([(place_index[str(pair[0])], place_index[str(pair[1])], int(np.ravel(point)[0]))
+                        for pair, point in zip(routes, points)])
+
+    return {'board':board_data,
+            'place_1':place_1,
+            'place_2':place_2,
+            'length':board_data.track_length.tolist(),
+            'colour':[grey if colour < 0 else int(colour) for colour in board_data.colour],   # no colour as grey
+            'grey':grey,
+            'tunnel':board_data.tunnel.tolist(),
+            'locomotive':board_data.locomotive.tolist(),
+            'partner':partner,
+            'adjacency':adjacency,
+            'tickets':tickets}
+
+
+class _Player:
+    '''
+    State of one bot player
+    '''
+
+    __slots__ = ('hand', 'trains', 'route_points', 'tickets', 'parent', 'plan')
+
+    def __init__(self, n_places, n_colours, tickets):
+        self.hand = [0]*(n_colours + 1)   # cards of each colour, locomotives last
+        self.trains = TRAINS
+        self.route_points = 0
+        self.tickets = tickets  # (deck, ticket index, place 1, place 2, points)
+        self.parent = list(range(n_places))     # union find of connected places
+        self.plan = None    # routes wanted for the tickets
+
+    def find(self, place):
+        parent = self.parent
+        while parent[place] != place:
+            parent[place] = parent[parent[place]]
+            place = parent[place]
+        return place
+
+    def connected(self, a, b):
+        return self.find(a) == self.find(b)
+
+
+class _Game:
+    '''
+    State of one game: route owners, train card deck and players
+    '''
+
+    __slots__ = ('layout', 'rng', 'owner', 'claim_turn', 'blocked', 'cards', 'discard', 'players',
+                 'n_colours', 'close_doubles')
+
+    def __init__(self, layout, n_players, tickets_dealt, rng):
+
+        self.layout = layout
+        self.rng = rng
+        self.n_colours = layout['grey']     # colours of train cards (grey is any colour)
+        self.owner = [-1]*len(layout['length'])    # player owning each route, -2 closed double route
+        self.claim_turn = [-1]*len(layout['length'])
+        self.blocked = [0]*len(layout['length'])   # times a route a player wanted was claimed by another
+        self.close_doubles = n_players <= 3     # only one track of double routes used
+
+        self.cards = [colour for colour in range(self.n_colours) for _ in range(COLOUR_CARDS)]
+        self.cards += [self.n_colours]*LOCOMOTIVE_CARDS
+        rng.shuffle(self.cards)
+        self.discard = []
+
+        # deal tickets from each deck
+        dealt = [[] for _ in range(n_players)]
+        for deck, (tickets, n_dealt) in enumerate(zip(layout['tickets'], tickets_dealt)):
+            order = list(range(len(tickets)))
+            rng.shuffle(order)
+            for player in range(n_players):
+                for idx in order[player*n_dealt:(player+1)*n_dealt]:
+                    dealt[player].append((deck, idx) + tickets[idx])
+
+        n_places = len(layout['adjacency'])
+        self.players = [_Player(n_places, self.n_colours, dealt[player]) for player in range(n_players)]
+
+        for player in self.players:  # starting hand
+            for _ in range(4):
+                self.draw(player)
+
+    def draw(self, player):
+        '''
+        Draw one train card, reshuffling the discard pile when the deck is empty
+        '''
+
+        if not self.cards:
+            if not self.discard:
+                return
+            self.cards, self.discard = self.discard, []
+            self.rng.shuffle(self.cards)
+
+        player.hand[self.cards.pop()] += 1
+
+    def available(self, route, player_idx):
+        '''
+        Route can be claimed by the player
+        '''
+
+        if self.owner[route] != -1:
+            return False
+
+        partner = self.layout['partner'][route]
+
+        return partner < 0 or self.owner[partner] != player_idx
+
+    def route_costs(self, player_idx):
+        '''
+        Cost of each route for a player: 0 for own routes, the length for
+        routes that can be claimed and -1 for routes that can not be used
+        '''
+
+        owner = self.owner
+        partner = self.layout['partner']
+
+        return [0 if owner[route] == player_idx else
+                length if owner[route] == -1 and (partner[route] < 0 or owner[partner[route]] != player_idx) else -1
+                for route, length in enumerate(self.layout['length'])]
+
+    def shortest_route(self, costs, start, end):
+        '''
+        Routes still to claim on the cheapest path between two places, None
+        if there is no path
+        '''
+
+        adjacency = self.layout['adjacency']
+
+        dist = [INFINITY]*len(adjacency)
+        dist[start] = 0
+        previous = [-1]*len(adjacency)  # (route, place) before each place
+        heap = [(0, start)]
+
+        while heap:
+            cost, place = heapq.heappop(heap)
+
+            if place == end:
+                break
+            if cost > dist[place]:
+                continue
+
+            for route, other in adjacency[place]:
+                route_cost = costs[route]
+                if route_cost < 0:
+                    continue
+
+                new_cost = cost + route_cost
+                if new_cost < dist[other]:
+                    dist[other] = new_cost
+                    previous[other] = (route, place)
+                    heapq.heappush(heap, (new_cost, other))
+
+        if dist[end] == INFINITY:
+            return None
+
+        routes = []
+        place = end
+        while place != start:
+            route, place = previous[place]
+            if costs[route] > 0:
+                routes.append(route)
+
+        return routes
+
+    def make_plan(self, player_idx):
+        '''
+        Routes the player wants for all unfinished tickets
+        '''
+
+        player = self.players[player_idx]
+
+        costs = None
+        plan = []
+        for ticket in player.tickets:
+            if not player.connected(ticket[2], ticket[3]):
+                if costs is None:
+                    costs = self.route_costs(player_idx)
+                routes = self.shortest_route(costs, ticket[2], ticket[3])
+                if routes:
+                    plan += [route for route in routes if route not in plan]
+
+        player.plan = plan
+
+    def payment(self, player, route):
+        '''
+        Colour to pay with and number of locomotives needed, None if the
+        player can not afford the route
+        '''
+
+        layout = self.layout
+        hand = player.hand
+        length = layout['length'][route]
+        colour = layout['colour'][route]
+        locomotives = hand[self.n_colours]
+
+        if player.trains < length:
+            return None
+
+        needed_locomotives = 1 if layout['locomotive'][route] else 0   # ferries need a locomotive
+
+        if locomotives < needed_locomotives:
+            return None
+
+        if colour == layout['grey']:    # any colour, use the colour with most cards
+            colour = max(range(self.n_colours), key=hand.__getitem__)
+
+        if hand[colour] + locomotives >= length:
+            return colour, max(needed_locomotives, length - hand[colour])
+
+        return None
+
+    def claim(self, player_idx, route, colour, locomotives, turn):
+        '''
+        Pay for and claim a route (tunnels may cost extra cards)
+        '''
+
+        layout = self.layout
+        player = self.players[player_idx]
+        hand = player.hand
+        length = layout['length'][route]
+
+        if layout['tunnel'][route]:     # extra cards for each matching card drawn
+            revealed = [self.cards.pop() for _ in range(min(3, len(self.cards)))]
+            self.discard += revealed
+            extra = sum(1 for card in revealed if card == colour or card == self.n_colours)
+            if hand[colour] + hand[self.n_colours] < length + extra:
+                return False    # can not pay, turn is lost
+            locomotives = max(locomotives, length + extra - hand[colour])
+            length += extra
+
+        hand[self.n_colours] -= locomotives
+        hand[colour] -= length - locomotives
+        self.discard += [colour]*(length - locomotives) + [self.n_colours]*locomotives
+
+        base_length = layout['length'][route]
+        player.trains -= base_length
+        player.route_points += ROUTE_POINTS.get(base_length, 2*base_length)
+
+        self.owner[route] = player_idx
+        self.claim_turn[route] = turn
+
+        partner = layout['partner'][route]
+        if partner >= 0 and self.close_doubles and self.owner[partner] == -1:
+            self.owner[partner] = -2
+
+        a, b = player.find(layout['place_1'][route]), player.find(layout['place_2'][route])
+        player.parent[a] = b
+
+        for other_idx, other in enumerate(self.players):   # other plans through this route are blocked
+            if other_idx != player_idx and other.plan is not None and (route in other.plan or partner in other.plan):
+                self.blocked[route] += 1
+                other.plan = None
+
+        player.plan = None
+
+        return True
+
+    def turn(self, player_idx, turn):
+        '''
+        Play one turn for a bot: claim an affordable route on its plan
+        (longest first), otherwise the longest affordable route once the
+        tickets are done, otherwise draw two cards
+        '''
+
+        player = self.players[player_idx]
+        length = self.layout['length']
+
+        if player.plan is None:
+            self.make_plan(player_idx)
+
+        candidates = player.plan
+        if not candidates:  # tickets finished or impossible, score route points
+            candidates = [route for route in range(len(length)) if length[route] >= 3 and self.available(route, player_idx)]
+
+        best = None
+        for route in candidates:
+            if self.available(route, player_idx) and (best is None or length[route] > length[best[0]]):
+                payment = self.payment(player, route)
+                if payment is not None:
+                    best = (route,) + payment
+
+        if best is not None and self.claim(player_idx, best[0], best[1], best[2], turn):
+            return
+
+        self.draw(player)
+        self.draw(player)
+
+    def play(self, max_turns):
+        '''
+        Play until a player has 2 or fewer trains, then one last round
+        '''
+
+        n_players = len(self.players)
+        last_turn = max_turns
+
+        for turn in range(max_turns):
+            player_idx = turn % n_players
+            self.turn(player_idx, turn)
+
+            if last_turn == max_turns and self.players[player_idx].trains <= 2:
+                last_turn = turn + n_players    # everyone gets one more turn
+
+            if turn >= last_turn:
+                break
+
+
+def _simulate_batch(layout, seeds, n_players, tickets_dealt, max_turns):
+    '''
+    Play a batch of games and sum the statistics
+
+    Returns
+    -------
+    dealt, completed : list of arrays of times each ticket was dealt/completed, for each deck
+    claimed, claim_turn, blocked : arrays for each route
+    scores : list of score rows (game, player, score, route points, ticket points, completed, failed)
+
+    '''
+
+    n_routes = len(layout['length'])
+
+    dealt = [np.zeros(len(tickets)) for tickets in layout['tickets']]
+    completed = [np.zeros(len(tickets)) for tickets in layout['tickets']]
+    claimed = np.zeros(n_routes)
+    claim_turn = np.zeros(n_routes)
+    blocked = np.zeros(n_routes)
+    scores = []
+
+    for game_number, seed in seeds:
+        game = _Game(layout, n_players, tickets_dealt, random.Random(seed))
+        game.play(max_turns)
+
+        owner = np.array(game.owner)
+        claimed += owner >= 0
+        claim_turn += np.where(owner >= 0, game.claim_turn, 0)
+        blocked += game.blocked
+
+        for player_idx, player in enumerate(game.players):
+            ticket_points = 0
+            n_completed = 0
+            for deck, idx, a, b, points in player.tickets:
+                dealt[deck][idx] += 1
+                if player.connected(a, b):
+                    completed[deck][idx] += 1
+                    ticket_points += points
+                    n_completed += 1
+                else:
+                    ticket_points -= points
+
+            scores.append((game_number, player_idx, player.route_points + ticket_points, player.route_points,
+                           ticket_points, n_completed, len(player.tickets) - n_completed))
+
+    return dealt, completed, claimed, claim_turn, blocked, scores
+
+
+@stage('simulate_games')
+def simulate_games(board_data, decks, n_games, n_players=3, tickets_dealt=None, seed=None,
+                   processes=1, batch_size=500, max_turns=1000):
+    '''
+    Play many games with simple bot players to check a board and its
+    ticket decks. Each bot plans the cheapest paths for its tickets,
+    claims the longest affordable route on them and otherwise draws
+    cards. Only the board colours, lengths, tunnels and locomotives
+    (ferries) are used, there are no stations or face up cards.
+
+    Parameters
+    ----------
+    board_data : pandas dataframe (or BoardData) with board data
+
+    decks : list of (routes, points) for each ticket deck (as get_routes)
+
+    n_games : int, number of games to play
+
+    n_players : int, number of players in each game
+
+    tickets_dealt : list of number of tickets dealt to each player from
+                    each deck (default 3 from the first, 1 from the others)
+
+    seed : int or numpy SeedSequence, each game gets its own stream from it
+
+    processes : int, number of processes to play games in
+
+    batch_size : int, number of games in each process batch
+
+    max_turns : int, maximum number of turns in a game
+
+    Returns
+    -------
+    tickets : pandas dataframe with completion rate of each ticket
+    routes : pandas dataframe with claim rate, mean claim turn and number of
+             times each route was taken from a player that wanted it
+    scores : pandas dataframe of scores for each player in each game
+
+    '''
+
+    layout = simulation_layout(board_data, decks)
+
+    if tickets_dealt is None:
+        tickets_dealt = [3] + [1]*(len(decks) - 1)
+
+    for tickets, n_dealt in zip(layout['tickets'], tickets_dealt):
+        if n_dealt*n_players > len(tickets):
+            raise ValueError("Deck of %d tickets is too small to deal %d to %d players" % (len(tickets), n_dealt, n_players))
+
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    game_seeds = [(game, int(child.generate_state(1, np.uint64)[0])) for game, child in enumerate(root.spawn(n_games))]
+
+    batches = [game_seeds[start:start+batch_size] for start in range(0, n_games, batch_size)]
+
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_simulate_batch, [layout]*len(batches), batches, [n_players]*len(batches),
+                                    [tickets_dealt]*len(batches), [max_turns]*len(batches)))
+    else:
+        results = [_simulate_batch(layout, batch, n_players, tickets_dealt, max_turns) for batch in batches]
+
+    dealt = [sum(result[0][deck] for result in results) for deck in range(len(decks))]
+    completed = [sum(result[1][deck] for result in results) for deck in range(len(decks))]
+    claimed = sum(result[2] for result in results)
+    claim_turn = sum(result[3] for result in results)
+    blocked = sum(result[4] for result in results)
+
+    board = layout['board']
+
+    ticket_rows = []
+    for deck, tickets in enumerate(layout['tickets']):
+        for idx, (a, b, points) in enumerate(tickets):
+            ticket_rows.append((deck, board.places[a], board.places[b], points, dealt[deck][idx], completed[deck][idx]))
+
+    tickets = pd.DataFrame(ticket_rows, columns=['deck', 'place1', 'place2', 'points', 'dealt', 'completed'])
+    tickets['completion_rate'] = tickets.completed/tickets.dealt.where(tickets.dealt > 0)
+
+    routes = pd.DataFrame({'place1':board.places[board.place_1],
+                           'place2':board.places[board.place_2],
+                           'trackLength':board.track_length,
+                           'trackColour':board.track_colours(),
+                           'claim_rate':claimed/n_games,
+                           'mean_claim_turn':claim_turn/np.where(claimed > 0, claimed, np.nan),
+                           'blocked':blocked})
+
+    scores = pd.DataFrame([row for result in results for row in result[5]],
+                          columns=['game', 'player', 'score', 'route_points', 'ticket_points', 'completed', 'failed'])
+
+    count('games', n_games)
+
+    return tickets, routes, scores
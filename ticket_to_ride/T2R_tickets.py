@@ -3,6 +3,9 @@
 # Connections
 import numpy as np
 
+from .T2R_random import make_random_state, uniform_draws
+from .T2R_profile import stage, count
+
 def get_t2r_europe_ticket_counts():
     '''
     Routes number will be done according to rough Ticket to ride
@@ -43,7 +46,8 @@ def get_t2r_europe_ticket_counts():
     
 
 
-def get_routes(data, counts, seed):
+@stage('get_routes')
+def get_routes(data, counts, seed, route_index=None, fallback=2):
     '''
     Calculate the route cards
 
@@ -52,39 +56,289 @@ def get_routes(data, counts, seed):
     data : dict of distance lengths
         
     seed : int, seed for determining which place pairs are selected
+           (or numpy RandomState, Generator or SeedSequence, see make_random_state)
+    
+    route_index : RouteIndex (from route_difficulty_index), if given points
+                  are adjusted for difficulty with score_tickets
+    
+    fallback : int, how far from the wanted length a ticket can be when a
+               length has too few pairs (0 for exact lengths only)
 
     Returns
     -------
     route_sh : list of pairs for short routes
-    points_sh : array of points for short route pairs
+    points_sh : array of points for short route pairs (the length used)
 
     '''
     
-    np.random.seed(seed) # set random seed to generate card pairs
+    random_state = make_random_state(seed) # random stream to generate card pairs
     
     total_cards = sum(list(counts.values())) # get total points value
     
-    count_added = 0 # set couter
+    lengths = set(int(length) for length in data)
+    
+    used = {}   # indexes of the pairs already taken from each length
     
     points = np.zeros((total_cards,1)) # initialise points array
     
     route = [] # create list
     
-    # go through each number- for each select a random number of routes. If the number is greater
-    # than routes select maximum and add number of fails to array
+    # go through each number- for each select a random number of routes. If there are not
+    # enough routes of that length the rest are taken from the nearest lengths
     for point in counts:
-        num = np.linspace(0,len(data[point])-1,len(data[point]))
-        select = np.random.choice(num,counts[point],replace=False)
+        needed = counts[point]
         
-        for j in range(counts[point]):
-            route.append(list(data[point][int(select[j])]))
-            points[count_added ] = point
-            count_added += 1
+        for length in _fallback_lengths(int(point), lengths, fallback):
+            bucket = data.get(str(length), [])
+            
+            if length in used:  # pairs not taken yet
+                num = np.setdiff1d(np.arange(len(bucket)), list(used[length]))
+            else:
+                num = np.linspace(0,len(bucket)-1,len(bucket))
+            
+            n_select = min(needed, len(num))
+            if n_select == 0:
+                continue
+            
+            select = random_state.choice(num,n_select,replace=False)
+            
+            for j in range(n_select):
+                route.append(list(bucket[int(select[j])]))
+                points[len(route)-1] = length
+            
+            used.setdefault(length, set()).update(int(idx) for idx in select)
+            needed -= n_select
+            if needed == 0:
+                break
+        
+        if needed > 0:
+            raise ValueError("Not enough place pairs for %s point tickets" % point)
+    
+    if route_index is not None:
+        points = score_tickets(route, points, route_index)
+
+    count('tickets', len(route))
 
     return route, points
     
 
 
+def score_tickets(routes, points, route_index, bonus=2):
+    '''
+    Add points to tickets that are hard to complete: tickets where the k
+    shortest paths all share the same tracks (a bottleneck that another
+    player can block) get up to bonus extra points, tickets with separate
+    alternative paths keep their points
+
+    Parameters
+    ----------
+    routes : list of place pairs
+    
+    points : array of points for each pair (from get_routes or generate_decks)
+    
+    route_index : RouteIndex (from route_difficulty_index) including the pairs
+    
+    bonus : int, extra points for a ticket with a single path
+
+    Returns
+    -------
+    points : array of points with the difficulty bonus added
+
+    '''
+    
+    difficulty = np.nan_to_num(route_index.difficulty(routes))    # lookup of each pair in the index
+    
+    points = np.asarray(points, dtype=float)
+    
+    return points + np.rint(bonus*difficulty).reshape(points.shape[0], -1)
+    
+
+
+def _bucket_pair(bucket, idx):
+    '''
+    Place keys of both ends of one pair of a length bucket (integer place
+    ids for a LengthBucket, otherwise place names)
+    '''
+    
+    if hasattr(bucket, 'pair_ids'):     # LengthBucket, only this pair is looked up
+        return bucket.pair_id(idx)
+    
+    return str(bucket[idx][0]), str(bucket[idx][1])
+
+
+def _place_name(bucket, key):
+    '''
+    Place name of a key from _bucket_pair
+    '''
+    
+    return str(bucket.location_keys[key]) if hasattr(bucket, 'pair_ids') else key
+
+
+def _fallback_lengths(length, lengths, fallback):
+    '''
+    Lengths to try for a ticket: the length itself, then the nearest
+    lengths (shorter first) up to fallback away
+    '''
+    
+    yield length
+    
+    for step in range(1, fallback+1):
+        for other in (length-step, length+step):
+            if other in lengths:
+                yield other
+
+
+@stage('generate_decks')
+def generate_decks(data, deck_counts, seed=None, max_per_city=None, fallback=2):
+    '''
+    Generate ticket decks with constraints: no place pair is used twice
+    (in any deck), each place is on at most max_per_city tickets (over all
+    decks), and when a length has no pairs left the nearest lengths are
+    used instead.
+
+    Pairs of each length are drawn in random order without repeats (a
+    Fisher-Yates shuffle done only as far as it is read), pairs that
+    break a constraint are skipped for good (constraints only get
+    stricter), so each pair is looked at once and there are no retries.
+    The time taken depends on the number of tickets, not the bucket sizes.
+
+    Parameters
+    ----------
+    data : dict of distance lengths (from create_data_dictionary)
+    
+    deck_counts : list of dicts of number of tickets for each length (one per deck),
+                  e.g. from get_t2r_europe_ticket_counts
+    
+    seed : int, numpy RandomState, Generator or SeedSequence (see make_random_state)
+    
+    max_per_city : int, maximum number of tickets for each place (None for no limit)
+    
+    fallback : int, how far from the wanted length a ticket can be (0 for exact lengths only)
+
+    Returns
+    -------
+    decks : list of (route, points) for each deck, as get_routes. Points are
+            the length of the ticket used, which can differ from the
+            counts with fallback.
+
+    '''
+    
+    random_state = make_random_state(seed)
+    
+    lengths = set(int(length) for length in data)
+    
+    pools = {}  # pairs of each length already drawn and the swaps of the partial shuffle
+    
+    city_count = {}     # number of tickets for each place
+    
+    limit = np.inf if max_per_city is None else max_per_city
+    
+    uniforms = []   # random numbers, drawn in blocks
+    
+    def take(length):
+        # next pair of this length that keeps to the constraints, pairs are
+        # drawn in random order by a Fisher-Yates shuffle done only as far
+        # as it is read, so only the pairs looked at are touched
+        if str(length) not in data:
+            return None
+        
+        bucket = data[str(length)]
+        pool = pools.setdefault(length, [0, {}])
+        drawn, swaps = pool
+        
+        while drawn < len(bucket):
+            if not uniforms:
+                uniforms.extend(uniform_draws(random_state, 1024).tolist())
+            pick = drawn + int(uniforms.pop()*(len(bucket) - drawn))
+            idx = swaps.get(pick, pick)
+            swaps[pick] = swaps.pop(drawn, drawn)
+            drawn += 1
+            
+            row, col = _bucket_pair(bucket, idx)
+            
+            if city_count.get(row, 0) < limit and city_count.get(col, 0) < limit:
+                city_count[row] = city_count.get(row, 0) + 1
+                city_count[col] = city_count.get(col, 0) + 1
+                pool[0] = drawn
+                return [_place_name(bucket, row), _place_name(bucket, col)]
+        
+        pool[0] = drawn
+        return None
+    
+    decks = []
+    
+    for counts in deck_counts:
+        
+        route = []
+        points = np.zeros((sum(counts.values()),1))
+        
+        for point in counts:
+            for j in range(counts[point]):
+                
+                for length in _fallback_lengths(int(point), lengths, fallback):
+                    pair = take(length)
+                    if pair is not None:
+                        break
+                else:
+                    raise ValueError("Not enough place pairs for %s point tickets with the constraints" % point)
+                
+                points[len(route)] = length
+                route.append(pair)
+        
+        decks.append((route, points))
+    
+    count('tickets', sum(len(route) for route, _ in decks))
+    
+    return decks
+    
+
+def write_decks(path, graph, decks):
+    '''
+    Save ticket decks as a binary board archive without boards (see
+    T2R_create_board.write_boards to save them with boards)
+
+    Parameters
+    ----------
+    path : string, archive file to save
+    
+    graph : network X graph (or ArrayGraph) of the map
+    
+    decks : list of (route, points) for each deck, as get_routes or generate_decks
+
+    Returns
+    -------
+    None.
+
+    '''
+
+    from .T2R_archive import write_archive
+
+    write_archive(path, graph, (), decks)
+
+
+def read_deck(path, index=0):
+    '''
+    Read one ticket deck of a board archive
+
+    Parameters
+    ----------
+    path : string, archive file (from write_decks or write_boards)
+    
+    index : int, position of the deck in the archive
+
+    Returns
+    -------
+    route : list of place pairs for each ticket
+    points : array of points for each ticket, as get_routes
+
+    '''
+
+    from .T2R_archive import BoardArchive
+
+    with BoardArchive(path) as archive:
+        return archive.deck(index)
+
+
 def get_start_end_destination(routes):
     '''
     Returns the start and end destination in separate lists for all route cards
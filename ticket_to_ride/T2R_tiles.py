@@ -0,0 +1,248 @@
+# Ticket to ride board tiles
+
+# Zoomable pyramid of PNG tiles for large boards
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+from .T2R_plotting import board_segments, NODE_COLOUR, TRACK_WIDTH, NODE_SIZE
+from .T2R_profile import stage, count
+
+TILE_DPI = 100  # tile figure resolution, line widths and node sizes are in points
+
+
+def tile_bounds(bounds, level, x, y):
+    '''
+    Map area of a tile: level 0 is one tile over the whole (square) map,
+    each level splits each tile into 4. x counts from the left, y from the top.
+
+    Parameters
+    ----------
+    bounds : (xmin, ymin, xmax, ymax) of the square map area
+    level, x, y : int, tile zoom level and position
+
+    Returns
+    -------
+    (xmin, ymin, xmax, ymax) of the tile
+
+    '''
+
+    size = (bounds[2] - bounds[0])/2**level
+
+    return (bounds[0] + x*size, bounds[3] - (y+1)*size, bounds[0] + (x+1)*size, bounds[3] - y*size)
+
+
+def _map_bounds(segments, coords):
+    '''
+    Square area around all tracks and places, with a small margin
+    '''
+
+    points = np.concatenate([segments.reshape(-1, 2), coords])
+
+    low, high = points.min(axis=0), points.max(axis=0)
+
+    centre = (low + high)/2
+    half = max((high - low).max()/2*1.05, 1e-9)
+
+    return (centre[0] - half, centre[1] - half, centre[0] + half, centre[1] + half)
+
+
+def _tiles_in_area(bounds, level, area):
+    '''
+    Tiles of a level overlapping an area (xmin, ymin, xmax, ymax)
+    '''
+
+    n_tiles = 2**level
+    size = (bounds[2] - bounds[0])/n_tiles
+
+    x0 = max(int(np.floor((area[0] - bounds[0])/size)), 0)
+    x1 = min(int(np.floor((area[2] - bounds[0])/size)), n_tiles - 1)
+    y0 = max(int(np.floor((bounds[3] - area[3])/size)), 0)
+    y1 = min(int(np.floor((bounds[3] - area[1])/size)), n_tiles - 1)
+
+    return [(level, x, y) for x in range(x0, x1+1) for y in range(y0, y1+1)]
+
+
+def _occupied_tiles(bounds, level, boxes):
+    '''
+    Tiles of a level overlapped by any box (rows of xmin, ymin, xmax, ymax)
+    '''
+
+    n_tiles = 2**level
+    size = (bounds[2] - bounds[0])/n_tiles
+
+    x0 = np.clip(np.floor((boxes[:, 0] - bounds[0])/size), 0, n_tiles-1).astype(np.int64)
+    x1 = np.clip(np.floor((boxes[:, 2] - bounds[0])/size), 0, n_tiles-1).astype(np.int64)
+    y0 = np.clip(np.floor((bounds[3] - boxes[:, 3])/size), 0, n_tiles-1).astype(np.int64)
+    y1 = np.clip(np.floor((bounds[3] - boxes[:, 1])/size), 0, n_tiles-1).astype(np.int64)
+
+    # mark the tile ranges of all boxes with a 2D difference array
+    marks = np.zeros((n_tiles+1, n_tiles+1), dtype=np.int64)
+    np.add.at(marks, (x0, y0), 1)
+    np.add.at(marks, (x1+1, y0), -1)
+    np.add.at(marks, (x0, y1+1), -1)
+    np.add.at(marks, (x1+1, y1+1), 1)
+
+    occupied = np.cumsum(np.cumsum(marks, axis=0), axis=1)[:n_tiles, :n_tiles] > 0
+
+    x, y = np.nonzero(occupied)
+
+    return [(level, int(i), int(j)) for i, j in zip(x, y)]
+
+
+def _render_tile_batch(segments, colour, coords, bounds, tiles, tile_size, folder):
+    '''
+    Render a batch of tiles on one off screen figure, tiles with nothing
+    drawn on them are not saved
+
+    Returns
+    -------
+    paths : list of saved tile file names
+
+    '''
+
+    fig = Figure(figsize=(tile_size/TILE_DPI, tile_size/TILE_DPI), dpi=TILE_DPI)
+    canvas = FigureCanvasAgg(fig)
+    fig.patch.set_alpha(0)
+
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.axis('off')
+
+    lines = LineCollection([], linewidths=TRACK_WIDTH)
+    ax.add_collection(lines)
+    nodes = ax.scatter([], [], s=NODE_SIZE, c=NODE_COLOUR, zorder=2)
+
+    low, high = segments.min(axis=1), segments.max(axis=1)   # bounding box of each track
+
+    paths = []
+
+    for level, x, y in tiles:
+        xmin, ymin, xmax, ymax = tile_bounds(bounds, level, x, y)
+        pad = (xmax - xmin)/tile_size*np.sqrt(NODE_SIZE)    # about a node size in map units
+
+        # only draw the tracks and places near the tile
+        near = ((high[:, 0] >= xmin-pad) & (low[:, 0] <= xmax+pad) & (high[:, 1] >= ymin-pad) & (low[:, 1] <= ymax+pad))
+        lines.set_segments(segments[near])
+        lines.set_color(colour[near])
+
+        inside = ((coords[:, 0] >= xmin-pad) & (coords[:, 0] <= xmax+pad) &
+                  (coords[:, 1] >= ymin-pad) & (coords[:, 1] <= ymax+pad))
+        nodes.set_offsets(coords[inside])
+
+        ax.set_xlim(xmin, xmax)
+        ax.set_ylim(ymin, ymax)
+
+        canvas.draw()
+        image = np.asarray(canvas.buffer_rgba())
+
+        if not image[:, :, 3].any():    # nothing drawn on the tile
+            continue
+
+        path = os.path.join(folder, str(level), str(x), str(y) + '.png')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fig.savefig(path, dpi=TILE_DPI, transparent=True)
+        paths.append(path)
+
+    return paths
+
+
+@stage('export_board_tiles')
+def export_board_tiles(board_data, G, folder, levels=4, tile_size=256, processes=1, area=None, double_offset=None):
+    '''
+    Render the board colouring (as show_board_colour) to a pyramid of
+    PNG tiles, folder/level/x/y.png, for browsing large boards. Level 0 is
+    one tile of the whole board and each level doubles the zoom. Tiles
+    with no tracks or places are skipped, tiles are rendered in batches
+    across a process pool. Give an area to only re-render the tiles over
+    part of the board (e.g. after editing some tracks).
+
+    A tiles.json file with the map bounds, tile size and levels is saved
+    with the tiles.
+
+    Parameters
+    ----------
+    board_data : pandas dataframe (or BoardData) with board data
+
+    G : network x graph (or ArrayGraph)
+
+    folder : string, folder to save the tiles in
+
+    levels : int, number of zoom levels
+
+    tile_size : int, width and height of each tile in pixels
+
+    processes : int, number of processes to render tiles in
+
+    area : (xmin, ymin, xmax, ymax) in map units, only render tiles over
+           this area (the map bounds are kept from tiles.json if it exists,
+           levels and tile_size must be the same as in tiles.json)
+
+    double_offset : float, distance between double route tracks in map units
+
+    Returns
+    -------
+    paths : list of saved tile file names
+
+    '''
+
+    segments, colour, coords = board_segments(board_data, G, double_offset)
+
+    metadata_path = os.path.join(folder, 'tiles.json')
+
+    if area is not None and os.path.exists(metadata_path):  # keep the existing tile grid
+        with open(metadata_path) as file:
+            metadata = json.load(file)
+
+        if (metadata['levels'], metadata['tile_size']) != (levels, tile_size):
+            raise ValueError("tiles in %s have %d levels of %d pixel tiles, not %d levels of %d pixels: render "
+                             "the whole board (no area) to change them"
+                             % (folder, metadata['levels'], metadata['tile_size'], levels, tile_size))
+
+        bounds = tuple(metadata['bounds'])
+    else:
+        bounds = _map_bounds(segments, coords)
+
+        os.makedirs(folder, exist_ok=True)
+        with open(metadata_path, 'w') as file:
+            json.dump({'bounds':list(bounds), 'tile_size':tile_size, 'levels':levels}, file)
+
+    # bounding box of each track and place
+    boxes = np.concatenate([np.column_stack([segments.min(axis=1), segments.max(axis=1)]),
+                            np.column_stack([coords, coords])])
+
+    tiles = []
+    area_tiles = []     # every tile over the area, re-rendered or not
+    for level in range(levels):
+        pad = (bounds[2] - bounds[0])/2**level/tile_size*np.sqrt(NODE_SIZE)   # about a node size in map units
+        occupied = _occupied_tiles(bounds, level, boxes + np.array([-pad, -pad, pad, pad]))
+        if area is not None:
+            area_tiles += _tiles_in_area(bounds, level, area)
+            occupied = sorted(set(occupied) & set(area_tiles))
+        tiles += occupied
+
+    if processes > 1 and len(tiles) > 1:
+        batches = [idx for idx in np.array_split(np.arange(len(tiles)), processes) if len(idx)]
+
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(_render_tile_batch, segments, colour, coords, bounds,
+                                   [tiles[i] for i in idx], tile_size, folder) for idx in batches]
+
+            paths = [path for future in futures for path in future.result()]
+    else:
+        paths = _render_tile_batch(segments, colour, coords, bounds, tiles, tile_size, folder)
+
+    # tiles over the area that are now empty would still show removed tracks
+    rendered = set(paths)
+    for level, x, y in area_tiles:
+        path = os.path.join(folder, str(level), str(x), str(y) + '.png')
+        if path not in rendered and os.path.exists(path):
+            os.remove(path)
+
+    count('tiles_rendered', len(paths))
+
+    return paths
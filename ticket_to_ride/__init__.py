@@ -1,8 +1,53 @@
+# Ticket to ride
 
-from .T2R_build_network import build_graph, get_double_routes,  create_data_dictionary, get_all_neighbours
+# Submodules (and with them numpy, pandas, networkx and matplotlib) are only
+# imported when one of their functions is first used
+import importlib
 
-from .T2R_create_board import create_board_colouring
+from .T2R_profile import profile, Profiler
 
-from .T2R_tickets import get_routes, get_t2r_europe_ticket_counts, get_start_end_destination
+_EXPORTS = {'T2R_build_network':['build_graph', 'get_double_routes', 'create_data_dictionary', 'get_all_neighbours',
+                                 'route_difficulty_index'],
+            'T2R_array_graph':['ArrayGraph'],
+            'T2R_loader':['load_board'],
+            'T2R_create_board':['create_board_colouring', 'BoardData', 'write_boards', 'read_board'],
+            'T2R_board_search':['generate_board_colourings'],
+            'T2R_board_optimise':['optimise_board_colouring', 'board_scores'],
+            'T2R_simulate':['simulate_games'],
+            'T2R_tickets':['get_routes', 'get_t2r_europe_ticket_counts', 'get_start_end_destination', 'generate_decks',
+                           'score_tickets', 'write_decks', 'read_deck'],
+            'T2R_plotting':['draw_graph', 'show_board_colour', 'create_tickets', 'create_ticket_sheets'],
+            'T2R_tiles':['export_board_tiles'],
+            'T2R_pipeline':['run_pipeline'],
+            'T2R_server':['RenderServer', 'serve'],
+            'T2R_archive':['BoardArchive', 'write_archive'],
+            'T2R_incremental':['IncrementalGraph'],
+            'T2R_cache':['NetworkCache']}
 
-from .T2R_plotting import draw_graph, show_board_colour, create_tickets
\ No newline at end of file
+_MODULES = {name:module for module, names in _EXPORTS.items() for name in names}   # module of each export
+
+__all__ = [name for names in _EXPORTS.values() for name in names] + ['profile', 'Profiler']
+
+
+def __getattr__(name):
+    '''
+    Import the submodule of an exported name on first use
+    '''
+
+    if name in _MODULES:
+        value = getattr(importlib.import_module('.' + _MODULES[name], __name__), name)
+        globals()[name] = value     # found directly from now on
+        return value
+
+    if name.startswith('T2R_'):     # submodules, as when everything was imported
+        try:
+            return importlib.import_module('.' + name, __name__)
+        except ModuleNotFoundError as error:
+            if error.name != __name__ + '.' + name:   # a missing dependency of the submodule
+                raise
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
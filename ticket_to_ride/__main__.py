@@ -0,0 +1,6 @@
+# Run the ticket to ride pipeline: python -m ticket_to_ride locations.csv connections.csv
+import sys
+
+from .T2R_pipeline import main
+
+sys.exit(main())